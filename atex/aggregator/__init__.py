@@ -14,6 +14,26 @@ class Aggregator(ABC):
         This is **destructive**, the artifacts are consumed in the process.
         """
 
+    def artifacts_dir(self):  # noqa: PLR6301
+        """
+        Return a directory (string/Path) to create test artifacts in, on the
+        same filesystem as where `.ingest()` stores them, so that ingesting
+        them is a cheap rename instead of a copy.
+
+        Return None if there is no such directory (or it doesn't matter).
+        """
+        return None
+
+    def discard(self, platform, test_names):  # noqa: ARG002, PLR6301
+        """
+        Remove any results of `test_names` (iterable of strings) aggregated
+        under `platform` so far, ie. possibly partial ones of tests whose
+        ingestion was interrupted by a crash, before they are run again.
+
+        Return how many tests had their results removed.
+        """
+        return 0
+
     @abstractmethod
     def start(self):
         """
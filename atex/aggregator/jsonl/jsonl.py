@@ -2,8 +2,10 @@ import abc
 import gzip
 import json
 import lzma
+import re
 import shutil
 import threading
+import zlib
 from pathlib import Path
 
 from ... import util
@@ -20,6 +22,20 @@ def verbatim_move(src, dst):
     )
 
 
+def same_fs_parent(path):
+    """
+    Return the parent directory of an existing `path` if it is on the same
+    filesystem as `path` (ie. `path` is not a mount point), or None.
+    """
+    parent = path.parent
+    try:
+        if path.stat().st_dev == parent.stat().st_dev:
+            return parent
+    except FileNotFoundError:
+        pass
+    return None
+
+
 class JSONLinesAggregator(Aggregator):
     """
     - `target` is a string/Path to a `.jsonl` file for all ingested
@@ -31,31 +47,98 @@ class JSONLinesAggregator(Aggregator):
     - `allow_duplicate` permits any one test name to be ingested more than
       once, appending ` (1)` to the second test name entry, ` (2)` to the
       third, etc.
+
+    - `resume`, if True, allows `target` and `files` to already exist
+      (ie. from a previous interrupted run), appending any further results
+      to them. Tests already present in `target` count as ingested.
+      If `target` ends with an incomplete line (or compressed stream) from
+      a crash, it is rewritten with only the complete lines first.
     """
 
-    def __init__(self, target, files, *, allow_duplicate=False):
+    # matches the ' (1)' suffix added by allow_duplicate
+    _duplicate_suffix = re.compile(r"^(.*) \(([0-9]+)\)$")
+
+    def __init__(self, target, files, *, allow_duplicate=False, resume=False):
         self._lock = threading.RLock()
         self.logger = _get_logger()
 
         self.target = Path(target)
         self.files = Path(files)
         self.allow_duplicate = allow_duplicate
+        self.resume = resume
         self._seen_tests = {}
         self._target_fobj = None
 
-    def _open_target(self, target):  # noqa: PLR6301
-        return open(target, "w")
+    def _open_target(self, target, append=False):  # noqa: PLR6301
+        return open(target, "a" if append else "w")
+
+    def _read_target(self, target):  # noqa: PLR6301
+        return open(target)
+
+    def _load_seen_tests(self):
+        """
+        Re-populate the record of ingested tests from an existing `target`,
+        rewriting it if it doesn't end with a complete line.
+        """
+        lines = []
+        intact = True
+        with self._read_target(self.target) as f:
+            try:
+                for raw_line in f:
+                    try:
+                        platform, _, test_name, *_ = json.loads(raw_line)
+                    except ValueError:
+                        # likely a truncated last line from a crash
+                        self.logger.warning(f"skipping corrupted line in {self.target}")
+                        intact = False
+                        continue
+                    if not raw_line.endswith("\n"):
+                        raw_line += "\n"
+                        intact = False
+                    lines.append(raw_line)
+                    count = 1
+                    if self.allow_duplicate and (m := self._duplicate_suffix.match(test_name)):
+                        test_name, count = m.group(1), int(m.group(2)) + 1
+                    unique_id = (platform, test_name)
+                    self._seen_tests[unique_id] = max(self._seen_tests.get(unique_id, 0), count)
+            # truncated compressed stream from a crash
+            except (EOFError, gzip.BadGzipFile, zlib.error, lzma.LZMAError) as e:
+                self.logger.warning(f"stopped reading {self.target} early: {e}")
+                intact = False
+
+        # appending after a broken line or stream would make the new
+        # results unreadable, so keep only what was read successfully
+        if not intact:
+            self.logger.info(f"rewriting {self.target} with {len(lines)} complete lines")
+            self._rewrite_target(lines)
+
+    def _rewrite_target(self, lines):
+        """
+        Atomically replace `target` with `lines` (of raw JSON).
+        """
+        tmp_target = self.target.with_name(f".{self.target.name}.tmp")
+        with self._open_target(tmp_target) as f:
+            f.writelines(lines)
+        tmp_target.replace(self.target)
 
     def start(self):
         self.logger.debug(f"starting: {self}")
 
-        if self.target.exists(follow_symlinks=False):
+        if self.resume and self.target.exists(follow_symlinks=False):
+            self._load_seen_tests()
+            self.logger.info(f"resuming with {len(self._seen_tests)} already ingested tests")
+            self._target_fobj = self._open_target(self.target, append=True)
+        elif self.target.exists(follow_symlinks=False):
             raise FileExistsError(f"{self.target} already exists")
-        self._target_fobj = self._open_target(self.target)
+        else:
+            self._target_fobj = self._open_target(self.target)
 
-        if self.files.exists(follow_symlinks=False):
+        if self.resume:
+            self.files.mkdir(exist_ok=True)
+        elif self.files.exists(follow_symlinks=False):
             raise FileExistsError(f"{self.files} already exists")
-        self.files.mkdir()
+        else:
+            self.files.mkdir()
 
     def stop(self):
         self.logger.debug(f"stopping: {self}")
@@ -64,6 +147,36 @@ class JSONLinesAggregator(Aggregator):
             self._target_fobj.close()
             self._target_fobj = None
 
+    def discard(self, platform, test_names):
+        # 'allow_duplicate' suffixed names are not matched, only exact ones
+        with self._lock:
+            discarded = {name for name in test_names if (platform, name) in self._seen_tests}
+            if not discarded:
+                return 0
+
+            self.logger.info(f"discarding results of {len(discarded)} tests for '{platform}'")
+
+            self._target_fobj.close()
+            lines = []
+            with self._read_target(self.target) as f:
+                for raw_line in f:
+                    line_platform, _, test_name, *_ = json.loads(raw_line)
+                    if line_platform != platform or test_name not in discarded:
+                        lines.append(raw_line)
+            self._rewrite_target(lines)
+            self._target_fobj = self._open_target(self.target, append=True)
+
+            platform_files = self.files / util.normalize_path(platform)
+            for name in discarded:
+                del self._seen_tests[platform, name]
+                shutil.rmtree(platform_files / util.normalize_path(name), ignore_errors=True)
+
+            return len(discarded)
+
+    def artifacts_dir(self):
+        # next to 'files', to be moved into it by a rename
+        return same_fs_parent(self.files)
+
     @staticmethod
     def _modify_file_list(test_files):
         return test_files
@@ -163,8 +276,11 @@ class CompressedJSONLinesAggregator(JSONLinesAggregator, abc.ABC):
     def compressed_open(self, *args, **kwargs):
         pass
 
-    def _open_target(self, target):
-        return self.compressed_open(target, "wt", newline="\n")
+    def _open_target(self, target, append=False):
+        return self.compressed_open(target, "at" if append else "wt", newline="\n")
+
+    def _read_target(self, target):
+        return self.compressed_open(target, "rt")
 
     def _modify_file_list(self, test_files):
         if self.compress_files and self.suffix:
@@ -271,6 +387,10 @@ class LZMAJSONLinesAggregator(CompressedJSONLinesAggregator):
     def compressed_open(self, *args, **kwargs):
         return lzma.open(*args, preset=self.preset, **kwargs)
 
+    def _read_target(self, target):  # noqa: PLR6301
+        # lzma refuses a preset when reading
+        return lzma.open(target, "rt")
+
     def __init__(
         self, *args,
         compress_preset=9, compress_files=True, compress_files_suffix=".xz",
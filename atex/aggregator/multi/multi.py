@@ -38,18 +38,21 @@ class MultiAggregator(Aggregator):
                 self.logger.exception(f"failed to stop {aggregator}")
 
     def ingest(self, platform, test_name, artifacts):
-        # since .ingest() is destructive, copy test artifacts for all
-        # aggregators except the last one, and leave the original location
+        # since .ingest() is destructive, give all aggregators except the last
+        # one a hardlinked copy of the test artifacts (just new directory
+        # entries, no file data is copied), and leave the original location
         # for the last aggregator to consume
+        # - this relies on aggregators not modifying ingested files in place,
+        #   only moving, reading or deleting them
 
         artifacts = Path(artifacts)
         for aggregator in self.aggregators[:-1]:
             tmp_copy = tempfile.mkdtemp(dir=artifacts.parent, prefix="atex-multi-")
             try:
-                # use 'cp' to do reflink, python code for this is notoriously
-                # buggy and takes forever on large trees
+                # use 'cp', python code for this is notoriously buggy and takes
+                # forever on large trees
                 subprocess.run(
-                    ("cp", "--reflink=auto", "-a", f"{artifacts}/.", f"{tmp_copy}/."),
+                    ("cp", "-al", f"{artifacts}/.", f"{tmp_copy}/."),
                     check=True,
                 )
                 aggregator.ingest(platform, test_name, tmp_copy)
@@ -58,6 +61,10 @@ class MultiAggregator(Aggregator):
 
         self.aggregators[-1].ingest(platform, test_name, artifacts)
 
+    def artifacts_dir(self):
+        # the last aggregator gets the original artifacts
+        return self.aggregators[-1].artifacts_dir()
+
     def __str__(self):
         class_name = self.__class__.__name__
         names = ", ".join(str(aggregator) for aggregator in self.aggregators)
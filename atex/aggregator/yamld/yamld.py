@@ -6,7 +6,7 @@ import yaml
 
 from ... import util
 from .. import Aggregator, AggregatorError
-from ..jsonl.jsonl import verbatim_move
+from ..jsonl.jsonl import same_fs_parent, verbatim_move
 
 _get_logger = util.get_loggers("atex.aggregator.yamld")
 
@@ -52,6 +52,10 @@ class YAMLDocumentAggregator(Aggregator):
             self._target_fobj.close()
             self._target_fobj = None
 
+    def artifacts_dir(self):
+        # next to 'files', to be moved into it by a rename
+        return same_fs_parent(self.files)
+
     def ingest(self, platform, test_name, artifacts):
         unique_id = (platform, test_name)
         with self._lock:
@@ -1,3 +1,4 @@
+import asyncio
 import importlib
 import pkgutil
 import subprocess
@@ -40,6 +41,18 @@ class Connection(ABC):
         - `func_args` are further keyword arguments to pass to `func`.
         """
 
+    async def acmd(self, command, **func_args):
+        """
+        Like `.cmd()`, but execute the command via `asyncio.create_subprocess_exec()`,
+        returning an asyncio.subprocess.Process instance.
+
+        - `command` is the command with arguments, as a tuple/list.
+
+        - `func_args` are further keyword arguments to pass
+          to `asyncio.create_subprocess_exec()`.
+        """
+        return await self.cmd(command, func=_create_subprocess_exec, **func_args)
+
     @abstractmethod
     def rsync(self, *args, func=subprocess.run, **func_args):
         """
@@ -62,6 +75,10 @@ class Connection(ABC):
         """
 
 
+def _create_subprocess_exec(args, **kwargs):
+    return asyncio.create_subprocess_exec(*args, **kwargs)
+
+
 class NotConnectedError(ConnectionError):
     """
     Raised by `.cmd()` or `.rsync()` when a Connection is not connected.
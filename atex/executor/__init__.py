@@ -1,3 +1,4 @@
+import asyncio
 import importlib
 import pkgutil
 from abc import ABC, abstractmethod
@@ -24,6 +25,38 @@ class Executor(ABC):
         Returns an integer exit code of the test script.
         """
 
+    async def arun_test(self, test_name, artifacts):
+        """
+        Like `.run_test()`, but as a coroutine, for running many tests
+        concurrently from one asyncio event loop.
+
+        Executors that don't implement it natively run `.run_test()`
+        in a thread of the default asyncio executor.
+        """
+        return await asyncio.to_thread(self.run_test, test_name, artifacts)
+
+    def run_tests(self, tests):
+        """
+        Run several tests on the remote system, one after another.
+
+        - `tests` is an iterable of `(test_name, artifacts)` tuples, with both
+          being the same as for `.run_test()`.
+
+        Returns a list with an item for each test, being either its integer
+        exit code, an exception it failed with, or None if it wasn't run
+        (ie. after an earlier test was aborted).
+
+        Executors may implement this with less overhead than calling
+        `.run_test()` for every test, ie. with fewer round-trips.
+        """
+        results = []
+        for test_name, artifacts in tests:
+            try:
+                results.append(self.run_test(test_name, artifacts))
+            except Exception as e:
+                results.append(e)
+        return results
+
     @abstractmethod
     def start(self):
         """
@@ -37,6 +70,21 @@ class Executor(ABC):
         Stop the Executor instance, cleaning the system up after test execution.
         """
 
+    def export_setup(self):  # noqa: PLR6301
+        """
+        Return (picklable) data describing what a finished `.start()` did,
+        for another Executor instance to use on a copy (snapshot) of the set-up
+        remote system, instead of `.start()`.
+
+        Returns None if the Executor doesn't support this.
+
+        Executors supporting this also implement `.restore_setup(data)`,
+        which sets the Executor instance up for test execution like `.start()`,
+        but on such a copy, using `data` from `.export_setup()` of the Executor
+        that set up the original.
+        """
+        return None
+
     @abstractmethod
     def cancel(self):
         """
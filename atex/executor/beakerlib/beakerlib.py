@@ -1,6 +1,6 @@
+import asyncio
 import json
 import shlex
-import subprocess
 import uuid
 
 from ... import util
@@ -18,10 +18,12 @@ class BeakerlibExecutor(FMFExecutor):
 
     - `env` is a dict of extra environment variables to pass to the
       plan prepare/finish scripts and to all tests.
+
+    All other arguments are the same as for FMFExecutor.
     """
 
-    def __init__(self, connection, fmf_tests, *, env=None):
-        super().__init__(connection, fmf_tests, env=env)
+    def __init__(self, connection, fmf_tests, *, env=None, **kwargs):
+        super().__init__(connection, fmf_tests, env=env, **kwargs)
         self.logger = _get_logger()
 
     def _make_start_script(self):
@@ -148,16 +150,9 @@ class BeakerlibExecutor(FMFExecutor):
 
     def start(self):
         super().start()
-        self.conn.cmd(
-            ("bash",),
-            func=util.subprocess_log,
-            logger=self.logger,
-            input=self._make_start_script(),
-            stderr=subprocess.STDOUT,
-            check=True,
-        )
+        self._cmd_log(("bash",), input=self._make_start_script())
 
-    def run_test(self, *args, env=None):
+    def _beakerlib_env(self, env):
         # create BEAKERLIB_DIR, symlink metadata.yaml to it
         quoted_dir = shlex.quote(str(self.work_dir / "beakerlib"))
         # prepare metadata.yaml for rlImport --all
@@ -167,14 +162,7 @@ class BeakerlibExecutor(FMFExecutor):
 
             ln -s ../test/metadata.yaml {quoted_dir}/metadata.yaml
         """) + "\n"
-        self.conn.cmd(
-            ("bash",),
-            func=util.subprocess_log,
-            logger=self.logger,
-            input=script,
-            stderr=subprocess.STDOUT,
-            check=True,
-        )
+        self._cmd_log(("bash",), input=script)
 
         beakerlib_env = {
             # these are created in _make_start_script() above
@@ -184,9 +172,14 @@ class BeakerlibExecutor(FMFExecutor):
             "TESTID": str(uuid.uuid4()),
             "BEAKERLIB_JOURNAL": str(0),  # XML journal is useless
         }
-        env = beakerlib_env if env is None else env | beakerlib_env
+        return beakerlib_env if env is None else env | beakerlib_env
+
+    def run_test(self, *args, env=None):
+        return super().run_test(*args, env=self._beakerlib_env(env))
 
-        return super().run_test(*args, env=env)
+    async def arun_test(self, *args, env=None):
+        env = await asyncio.to_thread(self._beakerlib_env, env)
+        return await super().arun_test(*args, env=env)
 
     def eval_exit_code(self, test_name, reporter, exit_code):  # noqa: ARG002, PLR6301
         if reporter.nameless_result_seen:
@@ -1,3 +1,5 @@
+import asyncio
+import contextlib
 import json
 import subprocess
 from pathlib import Path
@@ -20,7 +22,8 @@ class CommandExecutor(Executor):
         self.logger = _get_logger()
         self.conn = connection
         self.tests = tests
-        self._proc = None
+        # (loop, process) of a running test, for .cancel()
+        self._running = None
 
     def run_test(self, test_name, artifacts, *, output="output.txt"):
         """
@@ -29,6 +32,12 @@ class CommandExecutor(Executor):
         - `output` is a file name inside artifacts for capturing stdout/stderr
           of the executed command.
         """
+        return util.run_sync(self.arun_test(test_name, artifacts, output=output))
+
+    async def arun_test(self, test_name, artifacts, *, output="output.txt"):
+        """
+        Like `.run_test()`, but as a coroutine.
+        """
         if test_name not in self.tests:
             raise ValueError(f"'{test_name}' doesn't exist")
 
@@ -41,15 +50,16 @@ class CommandExecutor(Executor):
 
         output_file = files_dir / util.normalize_path(output)
         with open(output_file, "wb") as f:
-            self._proc = self.conn.cmd(
+            proc = await self.conn.acmd(
                 command,
                 stdout=f,
                 stderr=subprocess.STDOUT,
-                func=subprocess.Popen,
             )
-            self._proc.wait()
-        returncode = self._proc.returncode
-        self._proc = None
+            self._running = (asyncio.get_running_loop(), proc)
+            try:
+                returncode = await proc.wait()
+            finally:
+                self._running = None
 
         status = self.evaluate(returncode, output_file)
 
@@ -79,11 +89,29 @@ class CommandExecutor(Executor):
     def stop(self):
         self.logger.debug(f"stopping: {self}")
 
+    def export_setup(self):  # noqa: PLR6301
+        # nothing is set up by .start()
+        return {}
+
+    def restore_setup(self, data):  # noqa: ARG002
+        self.logger.debug(f"restoring: {self}")
+
     def __str__(self):
         class_name = self.__class__.__name__
         return f"{class_name}({self.conn}, {len(self.tests)} tests)"
 
     def cancel(self):
-        proc = self._proc
-        if proc:
-            proc.kill()
+        running = self._running
+        if not running:
+            return
+        loop, proc = running
+
+        def kill():
+            # may have just exited (and its transport closed)
+            with contextlib.suppress(ProcessLookupError):
+                proc.kill()
+
+        # asyncio objects aren't thread-safe, kill it from its own loop,
+        # which might have just finished the test and closed
+        with contextlib.suppress(RuntimeError):
+            loop.call_soon_threadsafe(kill)
@@ -0,0 +1,228 @@
+import asyncio
+import base64
+import concurrent.futures
+import itertools
+import json
+import subprocess
+import threading
+
+from ... import util
+from .. import ExecutorError
+
+_get_logger = util.get_loggers("atex.executor.fmf.agent")
+
+
+class AgentError(ExecutorError):
+    """
+    Raised when the remote agent fails to handle a request, ie. a command
+    could not be executed.
+    """
+
+
+class AgentGoneError(AgentError, ConnectionError):
+    """
+    Raised when the remote agent is not running (anymore), ie. because
+    the remote system was rebooted.
+    """
+
+
+def _encode(data):
+    if isinstance(data, str):
+        data = data.encode()
+    return base64.b64encode(data).decode("ascii")
+
+
+def _decode(data):
+    return base64.b64decode(data)
+
+
+class RemoteAgent:
+    """
+    A client of the `remote-agent` helper, which runs on the remote system
+    for as long as this class is started, and runs commands over one
+    long-lived Connection command, instead of one new Connection command
+    (and remote shell) for each.
+
+    Requests from multiple threads (or coroutines) are multiplexed over
+    the one connection, commands run in parallel on the remote.
+
+    - `connection` is a connected class Connection instance.
+
+    - `agent_exec` is a Path of the (executable) `remote-agent` on the
+      remote system.
+    """
+
+    def __init__(self, connection, agent_exec):
+        self.logger = _get_logger()
+
+        self.conn = connection
+        self.agent_exec = agent_exec
+        # guards ._pending and ._gone, shared with the reader thread
+        self._lock = threading.Lock()
+        # serializes writes of requests, separate from ._lock, so that a write
+        # blocked on a full pipe doesn't block the reader thread from reading
+        # responses (which the agent may be blocked on writing)
+        self._write_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._pending = {}
+        self._proc = None
+        self._reader = None
+        self._gone = False
+
+    @property
+    def alive(self):
+        """
+        True if the remote agent is running and accepting requests.
+        """
+        return self._proc is not None and not self._gone and self._proc.poll() is None
+
+    def start(self):
+        self.logger.debug(f"starting: {self}")
+        self._gone = False
+        self._proc = self.conn.cmd(
+            (self.agent_exec,),
+            func=subprocess.Popen,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._reader = threading.Thread(
+            target=self._read_responses,
+            args=(self._proc,),
+            name=f"atex-agent-{self._proc.pid}",
+            daemon=True,
+        )
+        self._reader.start()
+
+    def stop(self):
+        self.logger.debug(f"stopping: {self}")
+        proc = self._proc
+        if not proc:
+            return
+        self._proc = None
+        # the agent exits on EOF
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        self._reader.join()
+        self._reader = None
+
+    def _read_responses(self, proc):
+        for line in proc.stdout:
+            try:
+                response = json.loads(line)
+            except ValueError:
+                self.logger.warning(f"ignoring invalid agent response: {line}")
+                continue
+            with self._lock:
+                future = self._pending.pop(response.get("id"), None)
+            if future:
+                future.set_result(response)
+        proc.stdout.close()
+        # fail any requests left without a response
+        with self._lock:
+            self._gone = True
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(AgentGoneError("remote agent exited"))
+
+    def _submit(self, op, **args):
+        """
+        Send a request for `op` with `args`, returning a Future of the raw
+        response dict.
+        """
+        future = concurrent.futures.Future()
+        with self._lock:
+            if not self.alive:
+                raise AgentGoneError("remote agent is not running")
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            proc = self._proc
+        line = json.dumps({"id": request_id, "op": op, **args}) + "\n"
+        try:
+            with self._write_lock:
+                proc.stdin.write(line.encode())
+                proc.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise AgentGoneError("remote agent exited") from None
+        return future
+
+    @staticmethod
+    def _result(response):
+        if "error" in response:
+            raise AgentError(response["error"])
+        return response
+
+    @staticmethod
+    def _completed(command, response, check):
+        completed = subprocess.CompletedProcess(
+            args=command,
+            returncode=response["returncode"],
+            stdout=_decode(response["stdout"]),
+            stderr=_decode(response["stderr"]),
+        )
+        if check:
+            completed.check_returncode()
+        return completed
+
+    @staticmethod
+    def _run_args(command, input, env, cwd, merge):
+        return {
+            "argv": [str(arg) for arg in command],
+            "input": _encode(input) if input is not None else None,
+            "env": {str(k): str(v) for k, v in env.items()} if env else None,
+            "cwd": str(cwd) if cwd is not None else None,
+            "merge": merge,
+        }
+
+    def cmd(self, command, *, input=None, env=None, cwd=None, merge=False, check=False):
+        """
+        Run a single command on the remote and wait for it to finish,
+        returning a subprocess.CompletedProcess with (bytes) stdout/stderr.
+
+        - `command` is the command with arguments, as a tuple/list.
+
+        - `input` is a str/bytes to pass to the command's stdin.
+
+        - `env` is a dict of environment variables to add.
+
+        - `cwd` is a remote directory to run the command in.
+
+        - `merge`, if True, captures stderr as part of stdout.
+
+        - `check`, if True, raises CalledProcessError on a non-zero exit code.
+        """
+        future = self._submit("run", **self._run_args(command, input, env, cwd, merge))
+        response = self._result(future.result())
+        return self._completed(command, response, check)
+
+    async def acmd(self, command, *, input=None, env=None, cwd=None, merge=False, check=False):
+        """
+        Like `.cmd()`, but as a coroutine.
+        """
+        future = self._submit("run", **self._run_args(command, input, env, cwd, merge))
+        response = self._result(await asyncio.wrap_future(future))
+        return self._completed(command, response, check)
+
+    def __enter__(self):
+        try:
+            self.start()
+            return self
+        except BaseException:
+            self.stop()
+            raise
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def __str__(self):
+        class_name = self.__class__.__name__
+        return f"{class_name}({self.conn}, {self.agent_exec})"
@@ -1,3 +1,4 @@
+import os
 import re
 import shutil
 import tempfile
@@ -13,7 +14,7 @@ from .metadata import FMFTests, listlike
 def discover(
     fmf_tree, plan=None, *,
     names=None, filters=None, conditions=None, excludes=None,
-    context=None, libraries=True,
+    context=None, libraries=True, prune=False,
 ):
     r"""
     Discover fmf tests in an `fmf_tree` (repository) location, using
@@ -61,6 +62,12 @@ def discover(
       When True, libraries are cloned into 'libs' under the fmf tree root,
       and any RPM dependencies found in their metadata are added to the
       requiring test's require/recommend metadata.
+
+    - `prune`, if True, copies only the discovered tests from the fmf tree,
+      instead of the whole tree - the directory of each test (recursively),
+      fmf metadata files it inherits from, and any paths it requires via
+      'require: type: file' (matched by regex 'pattern', like tmt does).\
+      Files are hardlinked instead of copied where possible.
     """
     if isinstance(fmf_tree, fmf.Tree):
         tree = fmf_tree.copy()  # copy because we'll be .adjust()ing the tree
@@ -142,6 +149,7 @@ def discover(
             filters=filters,
             conditions=conditions,
             excludes=excludes,
+            prune=prune,
         )
 
         # store beakerlib libraries under libs/ in the tests tree,
@@ -189,7 +197,7 @@ def _merge_lists(into, name, source):
 
 def _discover_section(
     origin_tree, section, tmp_dir, context, *,
-    names=None, filters=None, conditions=None, excludes=None,
+    names=None, filters=None, conditions=None, excludes=None, prune=False,
 ):
     """
     Process one 'discover' plan section, searching for (filtering) tests,
@@ -205,7 +213,7 @@ def _discover_section(
 
     - `context` is used to adjust remotely-fetched trees.
 
-    - `names` / `filters` / `conditions` / `excludes` are the same
+    - `names` / `filters` / `conditions` / `excludes` / `prune` are the same
       as for discover().
     """
     if "url" in section:
@@ -219,19 +227,17 @@ def _discover_section(
         # local fmf tree - reuse the node
         tree = origin_tree
 
-    # do a one-shot copy of the fetched data to the tmp_dir
-    # TODO: this could be part of tree.prune() below if we ever implement
-    #       require: type: file -- only the test and any paths it itself
-    #       requires could be copied (with dirs_exist_ok=True to merge
-    #       existing), not the whole repo
-    shutil.copytree(
-        tree.root,
-        tmp_dir,
-        ignore=shutil.ignore_patterns(".git"),
-        symlinks=True,
-        # without prefix, we're copying to the (existing) tmp_dir root
-        dirs_exist_ok=True,
-    )
+    # do a one-shot copy of the fetched data to the tmp_dir,
+    # unless only the discovered tests are to be copied (below)
+    if not prune:
+        shutil.copytree(
+            tree.root,
+            tmp_dir,
+            ignore=shutil.ignore_patterns(".git"),
+            symlinks=True,
+            # without prefix, we're copying to the (existing) tmp_dir root
+            dirs_exist_ok=True,
+        )
 
     # merge plan-defined filters with argument-passed ones
     prune_kwargs = {}
@@ -245,6 +251,9 @@ def _discover_section(
 
     tests_data = {}
     tests_sources = {}
+    # relative paths to copy when pruning, always including the fmf root
+    prune_paths = {".fmf"}
+    file_patterns = set()
 
     # actually discover the tests
     for child in tree.prune(**prune_kwargs):
@@ -267,9 +276,95 @@ def _discover_section(
         # child.sources ie. ['/abs/path/to/some.fmf', '/abs/path/to/some/node.fmf']
         tests_sources[child.name] = str(Path(child.sources[-1]).parent.relative_to(tree.root))
 
+        if prune:
+            prune_paths.update(_node_paths(child))
+            for require in listlike(child.data, "require"):
+                if isinstance(require, dict) and require.get("type") == "file":
+                    file_patterns.update(listlike(require, "pattern"))
+
+    if prune:
+        if file_patterns:
+            prune_paths.update(
+                path for path in _tree_paths(tree.root)
+                if any(re.search(p, f"/{path}") for p in file_patterns)
+            )
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        _copy_paths(tree.root, prune_paths, tmp_dir)
+
     return (tree, tests_data, tests_sources)
 
 
+def _node_paths(node):
+    """
+    Return relative paths (strings) needed to use a fmf `node` in a pruned
+    copy of its tree - its directory and all fmf files it was defined by
+    (including inherited main.fmf files of its parents).
+    """
+    root = Path(node.root)
+    paths = {str(Path(source).relative_to(root)) for source in node.sources}
+    paths.add(str(Path(node.sources[-1]).parent.relative_to(root)))
+    return paths
+
+
+def _tree_paths(root):
+    """
+    Yield relative paths (strings) of all files and directories under `root`,
+    skipping .git.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != ".git"]
+        rel_dir = Path(dirpath).relative_to(root)
+        for name in (*dirnames, *filenames):
+            yield str(rel_dir / name)
+
+
+def _link_or_copy(src, dst):
+    # hardlink if on the same filesystem (and permitted), copy otherwise
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+def _copy_paths(root, paths, dest):
+    """
+    Copy relative `paths` (files, or directories recursively) from a `root`
+    directory to `dest`, creating any missing parent directories.
+
+    Files or symlinks already present in `dest` are skipped, so that paths
+    can overlap (ie. a test directory and a main.fmf inside it).
+    """
+    root = Path(root)
+
+    def present(path):
+        return path.is_symlink() or path.is_file()
+
+    def ignore(src_dir, names):
+        dst_dir = dest / Path(src_dir).relative_to(root)
+        return [n for n in names if n == ".git" or present(dst_dir / n)]
+
+    for path in sorted(paths):
+        src = root / path
+        dst = dest / path
+        if present(dst) or not (src.is_symlink() or src.exists()):
+            continue
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        if src.is_symlink():
+            dst.symlink_to(src.readlink())
+        elif src.is_dir():
+            shutil.copytree(
+                src,
+                dst,
+                ignore=ignore,
+                symlinks=True,
+                copy_function=_link_or_copy,
+                dirs_exist_ok=True,
+            )
+        else:
+            _link_or_copy(src, dst)
+
+
 _http = urllib3.PoolManager()
 
 
@@ -380,6 +475,9 @@ def resolve_libraries(tests_data, tests_tree, libs_dir, context):
                 # - just symlink it to libs/
                 if not target.exists():
                     source = libs_dir.parent / node.name.lstrip("/")
+                    # not copied along with the tests (pruned tree)
+                    if not source.exists():
+                        _copy_paths(tests_tree.root, _node_paths(node), libs_dir.parent)
                     target.parent.mkdir(parents=True, exist_ok=True)
                     target.symlink_to(source.relative_to(target.parent, walk_up=True))
 
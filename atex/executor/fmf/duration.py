@@ -43,3 +43,9 @@ class Duration:
 
     def out_of_time(self):
         return time.monotonic() > self._end
+
+    def remaining(self):
+        """
+        Return how many seconds are left (possibly negative).
+        """
+        return self._end - time.monotonic()
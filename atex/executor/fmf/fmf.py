@@ -1,19 +1,35 @@
+import asyncio
 import contextlib
 import enum
 import os
 import select
 import subprocess
 import threading
+import time
 from pathlib import Path
 
 from ... import util
 from ...connection.ssh import ManagedSSHConnection
 from .. import Executor, ExecutorError
+from .agent import RemoteAgent
 from .duration import Duration
-from .metadata import listlike
+from .metadata import all_pkg_requires, listlike, test_pkg_requires
 from .reporter import Reporter
-from .scripts import make_pkg_install, make_plan_script, make_test_setup
+from .scripts import (
+    agent_name,
+    batch_driver_name,
+    make_batch_driver,
+    make_helpers_install,
+    make_pkg_install,
+    make_pkg_query,
+    make_plan_script,
+    make_test_setup,
+    make_tree_extract,
+    make_tree_upload,
+    wrapper_name,
+)
 from .testcontrol import TestControl
+from .tree import tree_archive
 
 _get_logger = util.get_loggers("atex.executor.fmf")
 
@@ -38,16 +54,58 @@ class FMFExecutor(Executor):
 
     - `env` is a dict of extra environment variables to pass to the
       plan prepare/finish scripts and to all tests.
+
+    - `preinstall` is an iterable of test names (ie. all tests to be run
+      using this Executor) whose required/recommended RPM packages are
+      installed by `.start()` all at once, instead of by each test.
+
+    - `cache_packages`, if True, skips RPM packages known to be installed
+      (by the plan, `preinstall` or earlier tests) in later test setups,
+      without checking them again. Use only if no test removes or downgrades
+      packages (or such tests are destructive).
+
+    - `agent`, if True, keeps a `remote-agent` helper running on the remote
+      for the life of the Executor, and uses it for test setup and other
+      short commands, instead of a new Connection command for each.
+
+    - `upload` is how the fmf tree gets uploaded to the remote; `rsync`
+      syncs it file by file, `archive` sends it as one compressed tar
+      archive, cached on the remote (in `tree_cache_dir`) by a hash of
+      the tree contents, and not sent again if already cached there.
     """
 
-    def __init__(self, connection, fmf_tests, *, env=None):
+    # remote directory for caching uploaded tree archives, see 'upload'
+    # - not in work_dir, to be shared by Executors on the same remote
+    tree_cache_dir = Path("/var/tmp/atex-trees")
+
+    def __init__(
+        self, connection, fmf_tests, *, env=None, preinstall=None, cache_packages=False,
+        agent=False, upload="rsync",
+    ):
         self.logger = _get_logger()
 
         self.fmf_tests = fmf_tests
         self.conn = connection
         self.env = env or {}
+        self.preinstall = preinstall
+        self.cache_packages = cache_packages
+        self.agent = agent
+        if upload not in ("rsync", "archive"):
+            raise ValueError(f"unknown upload method: {upload}")
+        self.upload = upload
         self.work_dir = None
+        self._agent = None
+        # RPM packages (provides) known to be installed on the remote,
+        # not handled again by test setup if 'cache_packages' is True
+        self._installed = set()
         self._cancel_event = threading.Event()
+        # (loop, future) of a running test, to wake it up on .cancel()
+        self._cancel_wakeup = None
+        # about the last .run_test(), ie. for judging the health of the remote:
+        # how many times the test reconnected (ie. after a reboot)
+        self.reconnects = 0
+        # how long (in seconds) it took to run a short test setup command
+        self.command_latency = None
 
     def start(self):
         self.logger.debug(f"starting: {self}")
@@ -61,21 +119,50 @@ class FMFExecutor(Executor):
         )
         self.work_dir = Path(proc.stdout.rstrip("\n"))
 
+        # install the test wrapper (and other helpers) once, not for each test
+        self._install_helpers()
+        if self.agent:
+            self._agent = RemoteAgent(self.conn, self.work_dir / agent_name)
+            self._agent.start()
+
         # create / truncate the TMT_PLAN_ENVIRONMENT_FILE
-        self.conn.cmd(("truncate", "-s", "0", self.work_dir / "plan_env"), check=True)
+        self._cmd_log(("truncate", "-s", "0", self.work_dir / "plan_env"))
 
         # upload tests to the remote
-        self.conn.rsync(
-            "-rlptD", "--delete", "--exclude=.git/",
-            f"{self.fmf_tests.root}/",
-            f"remote:{self.work_dir}/tests",
-            func=util.subprocess_log,
-            logger=self.logger,
-        )
+        if self.upload == "archive":
+            self._upload_archive()
+        else:
+            self.conn.rsync(
+                "-rlptD", "--delete", "--exclude=.git/",
+                f"{self.fmf_tests.root}/",
+                f"remote:{self.work_dir}/tests",
+                func=util.subprocess_log,
+                logger=self.logger,
+            )
         self.env["TMT_TREE"] = str(self.work_dir / "tests")
 
         # run 'prepare' scripts from the plan on the remote
         self._run_plan_prepare_finish("prepare")
+        self._installed.update(all_pkg_requires(self.fmf_tests, tests=()))
+
+        if self.preinstall is not None:
+            self._preinstall_packages(self.preinstall)
+
+    def export_setup(self):
+        return {"work_dir": str(self.work_dir), "installed": sorted(self._installed)}
+
+    def restore_setup(self, data):
+        self.logger.debug(f"restoring: {self}")
+        # the uploaded tests, plan_env and anything the 'prepare' scripts
+        # did are already on the (snapshotted) remote
+        self.work_dir = Path(data["work_dir"])
+        self.env["TMT_TREE"] = str(self.work_dir / "tests")
+        self._installed = set(data.get("installed", ()))
+        # in case the remote was set up by a different ATEX version
+        self._install_helpers()
+        if self.agent:
+            self._agent = RemoteAgent(self.conn, self.work_dir / agent_name)
+            self._agent.start()
 
     def stop(self):
         self.logger.debug(f"stopping: {self}")
@@ -83,14 +170,156 @@ class FMFExecutor(Executor):
         try:
             if self.work_dir:
                 self._run_plan_prepare_finish("finish")
-                self.conn.cmd(("rm", "-rf", self.work_dir), check=True)
+                self._cmd_log(("rm", "-rf", self.work_dir))
         except ConnectionError:
             self.logger.debug("ignoring .stop() cleanup due to ConnectionError")
+        finally:
+            if self._agent:
+                self._agent.stop()
+                self._agent = None
 
         self.work_dir = None
 
     def cancel(self):
         self._cancel_event.set()
+        if wakeup := self._cancel_wakeup:
+            loop, future = wakeup
+            # the loop might have just finished the test and closed
+            with contextlib.suppress(RuntimeError):
+                loop.call_soon_threadsafe(
+                    lambda: future.done() or future.set_result(None),
+                )
+
+    def _init_cancel_wakeup(self):
+        self._cancel_event.clear()
+        loop = asyncio.get_running_loop()
+        self._cancel_wakeup = (loop, loop.create_future())
+
+    async def _wait_interruptible(self, aw, duration):
+        """
+        Wait for an awaitable `aw`, unless `.cancel()` gets called or
+        `duration` (a class Duration, or None) runs out first.
+
+        Return the finished asyncio.Task of `aw`, or None if interrupted.
+
+        This sleeps until one of these events happens, so that an idle test
+        doesn't wake up the event loop.
+        """
+        task = asyncio.ensure_future(aw)
+        _, cancelled = self._cancel_wakeup
+        timeout = max(duration.remaining(), 0) if duration else None
+        done, _ = await asyncio.wait(
+            (task, cancelled), timeout=timeout, return_when=asyncio.FIRST_COMPLETED,
+        )
+        if task in done:
+            return task
+        # let it clean up (ie. remove its fd reader) before we go on
+        task.cancel()
+        await asyncio.wait((task,))
+        return None
+
+    def _get_agent(self):
+        """
+        Return a running RemoteAgent, or None if not using one.
+        """
+        if self._agent and not self._agent.alive:
+            # ie. the remote was rebooted by a test
+            self.logger.info(f"restarting {self._agent}")
+            self._agent.stop()
+            self._agent.start()
+        return self._agent
+
+    def _cmd_log(self, command, *, input=None):
+        """
+        Run `command` on the remote (via the agent, if used), logging its
+        output, and raising CalledProcessError if it fails.
+
+        - `input` is a string to pass to the command's stdin.
+        """
+        if agent := self._get_agent():
+            proc = agent.cmd(command, input=input, merge=True)
+            for line in proc.stdout.decode(errors="replace").splitlines():
+                self.logger.debug(f"{agent}: {line}")
+            proc.check_returncode()
+        else:
+            self.conn.cmd(
+                command,
+                func=util.subprocess_log,
+                logger=self.logger,
+                input=input,
+                stderr=subprocess.STDOUT,
+                check=True,
+            )
+
+    def _cmd_output(self, command, *, input=None):
+        """
+        Run `command` on the remote (via the agent, if used), returning
+        a tuple of its exit code and (text) stdout.
+
+        - `input` is a string to pass to the command's stdin.
+        """
+        if agent := self._get_agent():
+            proc = agent.cmd(command, input=input)
+            return (proc.returncode, proc.stdout.decode())
+        else:
+            proc = self.conn.cmd(command, input=input, stdout=subprocess.PIPE, text=True)
+            return (proc.returncode, proc.stdout)
+
+    def _upload_archive(self):
+        archive = tree_archive(self.fmf_tests.root)
+        remote_archive = self.tree_cache_dir / f"{archive.digest}.tar.gz"
+        dest = self.work_dir / "tests"
+
+        code, output = self._cmd_output(
+            ("bash",),
+            input=make_tree_extract(archive=remote_archive, dest=dest),
+        )
+        if code == 0 and output.strip() == "cached":
+            self.logger.info(f"using {archive} already cached on the remote")
+            return
+
+        self.logger.info(f"uploading {archive}")
+        with open(archive.path, "rb") as f:
+            self.conn.cmd(
+                ("bash", "-c", make_tree_upload(archive=remote_archive, dest=dest)),
+                func=util.subprocess_log,
+                logger=self.logger,
+                stdin=f,
+                stderr=subprocess.STDOUT,
+                check=True,
+            )
+
+    def _install_helpers(self):
+        self.conn.cmd(
+            ("bash",),
+            func=util.subprocess_log,
+            logger=self.logger,
+            input=make_helpers_install(helpers_dir=self.work_dir),
+            stderr=subprocess.STDOUT,
+            check=True,
+        )
+
+    def _preinstall_packages(self, tests):
+        pkgs = set(all_pkg_requires(self.fmf_tests, "require", tests=tests))
+        pkgs.update(all_pkg_requires(self.fmf_tests, "recommend", tests=tests))
+        pkgs -= self._installed
+        if not pkgs:
+            return
+        pkgs = sorted(pkgs)
+
+        self.logger.info(f"pre-installing {len(pkgs)} packages")
+        # skip any unavailable packages, tests requiring them will fail
+        # their own setup later, same as without pre-installing
+        try:
+            self._cmd_log(("bash",), input="set -x\n" + make_pkg_install(recommended=pkgs))
+        except subprocess.CalledProcessError as e:
+            self.logger.warning(f"pre-installing packages failed: {e}")
+        code, output = self._cmd_output(("bash",), input=make_pkg_query(pkgs))
+        if code != 0:
+            self.logger.warning("could not query installed packages, not caching them")
+            return
+        missing = set(output.splitlines())
+        self._installed.update(p for p in pkgs if p not in missing)
 
     def _run_plan_prepare_finish(self, plugin_type):
         # make environment for 'prepare' / 'finish' scripts
@@ -105,13 +334,9 @@ class FMFExecutor(Executor):
             how = item.get("how")
             if how == "install":
                 if packages := listlike(item, "package"):
-                    self.conn.cmd(
+                    self._cmd_log(
                         ("bash",),
-                        func=util.subprocess_log,
-                        logger=self.logger,
                         input="set -xe\n" + make_pkg_install(required=packages),
-                        stderr=subprocess.STDOUT,
-                        check=True,
                     )
             elif how == "shell":
                 for script in listlike(item, "script"):
@@ -119,14 +344,7 @@ class FMFExecutor(Executor):
                         contents=script,
                         cwd=self.work_dir / "tests",
                     )
-                    self.conn.cmd(
-                        ("env", *env_args, "bash"),
-                        func=util.subprocess_log,
-                        logger=self.logger,
-                        input=full_script,
-                        stderr=subprocess.STDOUT,
-                        check=True,
-                    )
+                    self._cmd_log(("env", *env_args, "bash"), input=full_script)
 
     def eval_exit_code(self, test_name, reporter, exit_code):  # noqa: ARG002, PLR6301
         """
@@ -211,13 +429,25 @@ class FMFExecutor(Executor):
 
         - `env` is a dict of extra environment variables to pass to the test.
         """
-        self._cancel_event.clear()
+        return util.run_sync(self._run_test(test_name, artifacts, env=env))
+
+    async def arun_test(self, test_name, artifacts, *, env=None):
+        """
+        Like `.run_test()`, but as a coroutine.
 
+        Note that subclasses overriding `.run_test()` need to override this
+        as well, for their changes to apply when run from an event loop.
+        """
+        return await self._run_test(test_name, artifacts, env=env)
+
+    def _prepare_test(self, test_name, env):
+        """
+        Return a `(test_data, env_vars, wrapper_args, setup_script)` tuple
+        for running `test_name` with extra `env`.
+        """
         if test_name not in self.fmf_tests.data:
             raise ValueError(f"'{test_name}' doesn't exist in the given FMFTests")
 
-        self.logger.info(f"'{test_name}': running, {artifacts=}")
-
         test_data = self.fmf_tests.data[test_name]
         test_fmf_dir = self.work_dir / "tests" / self.fmf_tests.sources[test_name]
 
@@ -253,6 +483,26 @@ class FMFExecutor(Executor):
 
         self.logger.debug(f"'{test_name}': {env_vars=}")
 
+        setup_script = make_test_setup(
+            test_data=test_data,
+            test_dir=self.work_dir / "test",
+            test_exec="test.sh",
+            test_yaml="metadata.yaml",
+            bin_dir=self.work_dir / "bin",
+            installed=self._installed if self.cache_packages else (),
+        )
+
+        return (test_data, env_vars, wrapper_args, setup_script)
+
+    async def _run_test(self, test_name, artifacts, *, env=None):
+        self._init_cancel_wakeup()
+        self.reconnects = 0
+        self.command_latency = None
+
+        test_data, env_vars, wrapper_args, setup_script = self._prepare_test(test_name, env)
+
+        self.logger.info(f"'{test_name}': running, {artifacts=}")
+
         with contextlib.ExitStack() as stack:
             reporter = stack.enter_context(
                 Reporter(artifacts, "results", "files", logger=self.logger),
@@ -260,27 +510,28 @@ class FMFExecutor(Executor):
             duration = Duration(test_data.get("duration", "5m"))
             control = TestControl(reporter=reporter, duration=duration, logger=self.logger)
 
-            setup_script = make_test_setup(
-                test_data=test_data,
-                test_dir=self.work_dir / "test",
-                wrapper_exec="wrapper.py",
-                test_exec="test.sh",
-                test_yaml="metadata.yaml",
-                bin_dir=self.work_dir / "bin",
-            )
-            setup_proc = self.conn.cmd(
-                ("bash",),
-                input=setup_script,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-            )
+            setup_started = time.monotonic()
+            # (re)starting the agent blocks on the Connection
+            if agent := await asyncio.to_thread(self._get_agent):
+                setup_proc = await agent.acmd(("bash",), input=setup_script, merge=True)
+                setup_output = setup_proc.stdout
+            else:
+                setup_proc = await self.conn.acmd(
+                    ("bash",),
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                )
+                setup_output, _ = await setup_proc.communicate(setup_script.encode())
+            self.command_latency = time.monotonic() - setup_started
             if setup_proc.returncode != 0:
+                setup_output = setup_output.decode()
                 reporter.report({
                     "status": "infra",
-                    "note": f"TestSetupError({setup_proc.stdout})",
+                    "note": f"TestSetupError({setup_output})",
                 })
-                raise TestSetupError(setup_proc.stdout)
+                raise TestSetupError(setup_output)
+            self._installed.update(test_pkg_requires(test_data))
 
             test_proc = None
             control_fd = None
@@ -288,10 +539,10 @@ class FMFExecutor(Executor):
 
             reconnects = 0
 
-            def abort(msg):
-                if test_proc:
+            async def abort(msg):
+                if test_proc and test_proc.returncode is None:
                     test_proc.kill()
-                    test_proc.wait()
+                    await test_proc.wait()
                 raise TestAbortedError(msg) from None
 
             exception = None
@@ -302,7 +553,7 @@ class FMFExecutor(Executor):
 
                 while not duration.out_of_time():
                     if self._cancel_event.is_set():
-                        abort("cancel requested")
+                        await abort("cancel requested")
 
                     if state == self.State.STARTING_TEST:
                         # reconnect/reboot count (for compatibility)
@@ -317,16 +568,14 @@ class FMFExecutor(Executor):
                             # run the test in the background, letting it log output directly to
                             # an opened file (we don't handle it, cmd client sends it to kernel)
                             with reporter.open_testout() as testout_fd:
-                                test_proc = self.conn.cmd(
+                                test_proc = await self.conn.acmd(
                                     (
                                         "env", *env_args,
-                                        self.work_dir / "test" / "wrapper.py", *wrapper_args,
+                                        self.work_dir / wrapper_name, *wrapper_args,
                                     ),
                                     stdin=subprocess.DEVNULL,
                                     stdout=pipe_w,
                                     stderr=testout_fd,
-                                    func=subprocess.Popen,
-                                    bufsize=0,  # we handle fds ourselves
                                 )
                         finally:
                             os.close(pipe_w)
@@ -334,10 +583,15 @@ class FMFExecutor(Executor):
                         self.logger.debug(f"'{test_name}': {state.name}")
 
                     elif state == self.State.READING_CONTROL:
-                        rlist, _, xlist = select.select((control_fd,), (), (control_fd,), 0.1)
-                        if xlist:
-                            abort(f"got exceptional condition on control_fd {control_fd}")
-                        elif rlist:
+                        readable = util.wait_readable(control_fd)
+                        if await self._wait_interruptible(readable, duration):
+                            # the loop reader doesn't report these separately,
+                            # poll for them once woken up
+                            _, _, xlist = select.select((), (), (control_fd,), 0)
+                            if xlist:
+                                await abort(
+                                    f"got exceptional condition on control_fd {control_fd}",
+                                )
                             control.process()
                             if control.eof or control.disconnect_received:
                                 os.close(control_fd)
@@ -348,66 +602,67 @@ class FMFExecutor(Executor):
                     elif state == self.State.WAITING_FOR_EXIT:
                         # control stream is EOF and it has nothing for us to read,
                         # we're now just waiting for proc to cleanly terminate
-                        try:
-                            code = test_proc.wait(0.1)
-                            if code == 0:
-                                # wrapper exited cleanly, testing is done
-                                break
+                        waited = await self._wait_interruptible(test_proc.wait(), duration)
+                        if not waited:
+                            continue
+                        code = waited.result()
+                        if code == 0:
+                            # wrapper exited cleanly, testing is done
+                            break
+                        else:
+                            # unexpected error happened (crash, disconnect, etc.)
+                            self.conn.disconnect()
+                            # if there was a test control parser running
+                            if control.in_progress:
+                                await abort(
+                                    f"{str(control.in_progress)} was running while test "
+                                    f"wrapper unexpectedly exited with {code}",
+                                )
+                            # if test control disconnect was intentional, try to reconnect
+                            if control.disconnect_received:
+                                state = self.State.RECONNECTING
+                                self.logger.debug(f"'{test_name}': {state.name}")
+                                control.disconnect_received = False
+                                # also reset exitcode, let a reconnected test set it
+                                control.exit_code = None
                             else:
-                                # unexpected error happened (crash, disconnect, etc.)
-                                self.conn.disconnect()
-                                # if there was a test control parser running
-                                if control.in_progress:
-                                    abort(
-                                        f"{str(control.in_progress)} was running while test "
-                                        f"wrapper unexpectedly exited with {code}",
-                                    )
-                                # if test control disconnect was intentional, try to reconnect
-                                if control.disconnect_received:
-                                    state = self.State.RECONNECTING
-                                    self.logger.debug(f"'{test_name}': {state.name}")
-                                    control.disconnect_received = False
-                                    # also reset exitcode, let a reconnected test set it
-                                    control.exit_code = None
-                                else:
-                                    abort(
-                                        f"test wrapper unexpectedly exited with {code} and "
-                                        "disconnect was not sent via test control",
-                                    )
-                            test_proc = None
-                        except subprocess.TimeoutExpired:
-                            pass
+                                await abort(
+                                    f"test wrapper unexpectedly exited with {code} and "
+                                    "disconnect was not sent via test control",
+                                )
+                        test_proc = None
 
                     elif state == self.State.RECONNECTING:
                         try:
                             if isinstance(self.conn, ManagedSSHConnection):
                                 self.conn.connect(block=False)
                             else:
-                                self.conn.connect()
+                                await asyncio.to_thread(self.conn.connect)
                             reconnects += 1
+                            self.reconnects = reconnects
                             state = self.State.STARTING_TEST
                             self.logger.debug(f"'{test_name}': {state.name}")
                         except BlockingIOError:
                             # avoid 100% CPU spinning if the connection is too slow
                             # to come up (ie. ssh ControlMaster socket file not created)
-                            self._cancel_event.wait(timeout=0.1)
+                            await asyncio.sleep(0.1)
                         except ConnectionError:
                             # can happen when ie. ssh is connecting over a LocalForward port,
                             # causing 'read: Connection reset by peer' instead of timeout
                             # - just retry again after a short delay
-                            self._cancel_event.wait(timeout=0.5)
+                            await asyncio.sleep(0.5)
 
                     else:
                         raise AssertionError("reached unexpected state")
 
                 else:
-                    abort("test duration timeout reached")
+                    await abort("test duration timeout reached")
 
                 # testing successful
 
                 # test wrapper hasn't provided exitcode
                 if control.exit_code is None:
-                    abort("exitcode not reported, wrapper bug?")
+                    await abort("exitcode not reported, wrapper bug?")
 
                 control.exit_code = self.eval_exit_code(test_name, reporter, control.exit_code)
                 return control.exit_code
@@ -416,13 +671,251 @@ class FMFExecutor(Executor):
                 exception = e
                 if test_proc and test_proc.returncode is None:
                     test_proc.kill()
-                    test_proc.wait()
+                    await test_proc.wait()
                 raise
 
             finally:
                 self._report_fallback_result(reporter, control.exit_code, exception, test_name)
 
+    def run_tests(self, tests, *, env=None):
+        """
+        Run several tests one after another by a single remote batch driver,
+        avoiding the per-test round-trips of `.run_test()`.
+
+        Positional arguments are the same as class Executor.
+
+        - `env` is a dict of extra environment variables to pass to all tests.
+
+        Intended for many short tests - tests cannot disconnect (ie. reboot)
+        the remote system, and a test aborted due to its duration running out
+        (or `.cancel()`) leaves the rest of the tests unrun.
+        """
+        return util.run_sync(self._run_tests(tests, env=env))
+
+    async def arun_tests(self, tests, *, env=None):
+        """
+        Like `.run_tests()`, but as a coroutine.
+        """
+        return await self._run_tests(tests, env=env)
+
+    async def _run_tests(self, tests, *, env=None):
+        self._init_cancel_wakeup()
+        self.reconnects = 0
+        self.command_latency = None
+
+        tests = list(tests)
+        jobs = []
+        for test_name, _ in tests:
+            _, env_vars, wrapper_args, setup_script = self._prepare_test(test_name, env)
+            # no reconnects in a batch (for compatibility)
+            env_vars["TMT_REBOOT_COUNT"] = "0"
+            env_vars["TMT_TEST_RESTART_COUNT"] = "0"
+            jobs.append({
+                "setup": setup_script,
+                "cmd": [
+                    "env", *(f"{k}={v}" for k, v in env_vars.items()),
+                    str(self.work_dir / wrapper_name), *map(str, wrapper_args),
+                ],
+            })
+        driver_script = make_batch_driver(
+            jobs=jobs,
+            driver_exec=self.work_dir / batch_driver_name,
+            jobs_file=self.work_dir / "batch.json",
+        )
+
+        self.logger.info(f"running a batch of {len(tests)} tests")
+
+        results = [None] * len(tests)
+        current = None
+
+        started = time.monotonic()
+        proc = await self.conn.acmd(
+            ("bash",),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+        async def kill():
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+
+        try:
+            proc.stdin.write(driver_script.encode())
+            await proc.stdin.drain()
+            proc.stdin.close()
+
+            while True:
+                if self._cancel_event.is_set():
+                    raise TestAbortedError("cancel requested")
+                if current and current.duration.out_of_time():
+                    raise TestAbortedError("test duration timeout reached")
+
+                duration = current.duration if current else None
+                read = await self._wait_interruptible(proc.stdout.readline(), duration)
+                if not read:
+                    continue
+                header = read.result()
+                if not header:
+                    break
+                index, kind, length = header.decode().split()
+                index = int(index)
+                data = await proc.stdout.readexactly(int(length))
+
+                if kind in ("setup", "setupfail"):
+                    test_name, artifacts = tests[index]
+                    self.logger.info(f"'{test_name}': running, {artifacts=}")
+                    if self.command_latency is None:
+                        self.command_latency = time.monotonic() - started
+                    current = _BatchedTest(self, index, test_name, artifacts)
+                    if kind == "setupfail":
+                        output = data.decode()
+                        current.reporter.report({
+                            "status": "infra",
+                            "note": f"TestSetupError({output})",
+                        })
+                        results[index] = current.finish(TestSetupError(output))
+                        current = None
+                    else:
+                        self._installed.update(test_pkg_requires(self.fmf_tests.data[test_name]))
+                elif kind == "exit":
+                    if not current.finished:
+                        results[index] = current.exited(int(data))
+                    current = None
+                elif current.finished:
+                    # failed on its own, ignore the rest of it
+                    continue
+                elif kind in ("control", "testout"):
+                    try:
+                        if kind == "control":
+                            current.feed(data)
+                        else:
+                            os.write(current.testout_fd, data)
+                    except Exception as e:
+                        # ie. BadControlError, affecting only this test
+                        results[index] = current.finish(e)
+                else:
+                    raise AssertionError(f"unknown batch driver output: {header}")
+
+            await proc.wait()
+            if current:
+                stderr = (await proc.stderr.read()).decode()
+                raise TestAbortedError(
+                    f"batch driver unexpectedly exited with {proc.returncode}: {stderr}",
+                )
+
+        except Exception as e:
+            await kill()
+            if not current:
+                raise
+            if not current.finished:
+                results[current.index] = current.finish(e)
+
+        except BaseException as e:
+            await kill()
+            if current and not current.finished:
+                current.finish(e)
+            raise
+
+        return results
+
     def __str__(self):
         class_name = self.__class__.__name__
         fmf_root = str(self.fmf_tests.root)
         return f"{class_name}({self.conn}, {fmf_root})"
+
+
+class _BatchedTest:
+    """
+    One test run by the batch driver, see `FMFExecutor.run_tests()`,
+    with its test control stream being fed in by the caller.
+    """
+
+    def __init__(self, executor, index, test_name, artifacts):
+        self.executor = executor
+        self.index = index
+        self.test_name = test_name
+        self.artifacts = artifacts
+        self.finished = False
+
+        self._stack = contextlib.ExitStack()
+        self.reporter = self._stack.enter_context(
+            Reporter(artifacts, "results", "files", logger=executor.logger),
+        )
+        self.testout_fd = self._stack.enter_context(self.reporter.open_testout())
+        test_data = executor.fmf_tests.data[test_name]
+        self.duration = Duration(test_data.get("duration", "5m"))
+
+        # TestControl reads from a file descriptor, so pass it the stream
+        # through a pipe
+        control_fd, self._pipe_w = os.pipe()
+        self._stack.callback(os.close, control_fd)
+        self._stack.callback(lambda: os.close(self._pipe_w) if self._pipe_w else None)
+        os.set_blocking(control_fd, False)
+        os.set_blocking(self._pipe_w, False)
+        self.control = TestControl(
+            reporter=self.reporter,
+            duration=self.duration,
+            control_fd=control_fd,
+            logger=executor.logger,
+        )
+
+    def _process(self):
+        # process everything available
+        while not self.control.eof and select.select((self.control.control_fd,), (), (), 0)[0]:
+            self.control.process()
+
+    def feed(self, data):
+        """
+        Pass a part of the test control stream to TestControl.
+        """
+        while data:
+            try:
+                written = os.write(self._pipe_w, data)
+                data = data[written:]
+            except BlockingIOError:
+                pass
+            self._process()
+
+    def exited(self, code):
+        """
+        Finish the test after its test wrapper exited with `code`,
+        returning its exit code, or an exception it failed with.
+        """
+        os.close(self._pipe_w)
+        self._pipe_w = None
+        try:
+            self._process()
+            control = self.control
+            if control.in_progress:
+                raise TestAbortedError(
+                    f"{str(control.in_progress)} was running while test "
+                    f"wrapper unexpectedly exited with {code}",
+                )
+            if control.disconnect_received:
+                raise TestAbortedError("disconnect is not supported when running a batch")
+            if code != 0:
+                raise TestAbortedError(f"test wrapper unexpectedly exited with {code}")
+            if control.exit_code is None:
+                raise TestAbortedError("exitcode not reported, wrapper bug?")
+            control.exit_code = self.executor.eval_exit_code(
+                self.test_name, self.reporter, control.exit_code,
+            )
+        except Exception as e:
+            return self.finish(e)
+        return self.finish(None)
+
+    def finish(self, exception):
+        """
+        Report a fallback result and close the test artifacts, returning
+        its exit code, or `exception` if not None.
+        """
+        self.finished = True
+        try:
+            self.executor._report_fallback_result(
+                self.reporter, self.control.exit_code, exception, self.test_name,
+            )
+        finally:
+            self._stack.close()
+        return self.control.exit_code if exception is None else exception
@@ -93,17 +93,22 @@ def test_pkg_requires(data, key="require"):
             yield entry
 
 
-def all_pkg_requires(fmf_tests, key="require"):
+def all_pkg_requires(fmf_tests, key="require", *, tests=None):
     """
     Yield RPM package names from the plan and all tests discovered by
     a class FMFTests instance `fmf_tests`, ignoring any non-RPM-package
     requires/recommends.
+
+    - `tests` is an iterable of test names to limit the tests to,
+      None for all of them.
     """
     # use a set to avoid duplicates
     pkgs = set()
     for entry in listlike(fmf_tests.plan, "prepare"):
         if entry.get("how") == "install":
             pkgs.update(listlike(entry, "package"))
-    for data in fmf_tests.data.values():
-        pkgs.update(test_pkg_requires(data, key))
+    if tests is None:
+        tests = fmf_tests.data
+    for name in tests:
+        pkgs.update(test_pkg_requires(fmf_tests.data[name], key))
     yield from pkgs
@@ -1,4 +1,6 @@
+import hashlib
 import importlib.resources
+import json
 import shlex
 import uuid
 
@@ -8,6 +10,110 @@ from ... import util
 from .metadata import test_pkg_requires
 
 _test_wrapper = importlib.resources.files(__package__).joinpath("test-wrapper")
+_batch_driver = importlib.resources.files(__package__).joinpath("batch-driver")
+_remote_agent = importlib.resources.files(__package__).joinpath("remote-agent")
+
+# find a valid python
+_find_python = util.dedent(r"""
+    pyexec=$(command -v python3) || \
+    pyexec=$(command -v python) || \
+    pyexec=/usr/libexec/platform-python
+    if [[ ! -x $pyexec ]]; then
+        echo no executable python interpreter found >&2
+        exit 1
+    fi
+""") + "\n"
+
+
+def _helper_name(resource, suffix):
+    # keyed by contents, so a helper left on the remote (ie. in a snapshot)
+    # by a different ATEX version is never mistaken for the current one
+    digest = hashlib.sha256(resource.read_bytes()).hexdigest()[:16]
+    return f"{resource.name}-{digest}{suffix}"
+
+
+# file names of helpers installed by make_helpers_install()
+wrapper_name = _helper_name(_test_wrapper, ".py")
+batch_driver_name = _helper_name(_batch_driver, ".py")
+agent_name = _helper_name(_remote_agent, ".py")
+
+
+def make_helpers_install(*, helpers_dir):
+    """
+    Generate a bash script that installs the test wrapper, the batch driver
+    and the remote agent (as `wrapper_name`, `batch_driver_name` and
+    `agent_name`) into `helpers_dir`, skipping any already installed.
+
+    - `helpers_dir` is a Path of an existing remote directory, kept for
+      the entire life of the Executor.
+    """
+    out = "#!/bin/bash\n"
+    out += "set -xe\n"
+    out += _find_python
+
+    eof = f"EOF_{uuid.uuid4()}"
+
+    helpers = (
+        (_test_wrapper, wrapper_name),
+        (_batch_driver, batch_driver_name),
+        (_remote_agent, agent_name),
+    )
+    for resource, name in helpers:
+        path = shlex.quote(str(helpers_dir / name))
+        # write to a temporary file first, to never leave a partial helper
+        # behind under the final name
+        out += f"if [[ ! -f {path} ]]; then\n"
+        out += f"printf '#!%s\\n' \"$pyexec\" > {path}.tmp\n"
+        out += f"cat >> {path}.tmp <<'{eof}'\n"
+        out += resource.read_text()
+        out += f"\n{eof}\n"
+        out += f"chmod 0755 {path}.tmp\n"
+        out += f"mv -f {path}.tmp {path}\n"
+        out += "fi\n"
+
+    out += "exit 0\n"
+
+    return out
+
+
+def make_tree_extract(*, archive, dest):
+    """
+    Generate a bash script that extracts a tree `archive` cached on the remote
+    into a `dest` directory, printing 'cached' if it did, or nothing if
+    the `archive` is not cached.
+
+    - `archive` is a Path of a remote `.tar.gz` file.
+
+    - `dest` is a Path of a remote directory, created if needed.
+    """
+    archive_path = shlex.quote(str(archive))
+    dest_path = shlex.quote(str(dest))
+    return util.dedent(fr"""
+        set -e
+        if [[ -f {archive_path} ]]; then
+            mkdir -p {dest_path}
+            tar -xzf {archive_path} -C {dest_path} --no-same-owner
+            echo cached
+        fi
+    """) + "\n"
+
+
+def make_tree_upload(*, archive, dest):
+    """
+    Generate a bash script that reads a tree archive from stdin, caches it
+    on the remote as `archive` (see `make_tree_extract()`) and extracts it
+    into a `dest` directory.
+    """
+    archive_path = shlex.quote(str(archive))
+    dest_path = shlex.quote(str(dest))
+    return util.dedent(fr"""
+        set -e
+        mkdir -p {dest_path} "$(dirname {archive_path})"
+        # don't leave a partial archive behind under the final name
+        cat > {archive_path}.$$
+        mv -f {archive_path}.$$ {archive_path}
+        tar -xzf {archive_path} -C {dest_path} --no-same-owner
+    """) + "\n"
 
 
 def make_pkg_install(required=None, recommended=None):
@@ -47,24 +153,36 @@ def make_pkg_install(required=None, recommended=None):
     return out
 
 
-def make_test_setup(*, test_data, test_dir, wrapper_exec, test_exec, test_yaml, bin_dir):
+def make_pkg_query(pkgs):
+    """
+    Generate a bash script printing (one per line) those of `pkgs` which
+    are not provided by any installed RPM package, or fail if there is no
+    RPM database to query.
+    """
+    pkgs_str = " ".join(shlex.quote(p) for p in pkgs)
+    return util.dedent(fr"""
+        command -v rpm >/dev/null || exit 1
+        rpm -q --qf '' --whatprovides {pkgs_str} 2>&1 | \
+            sed -nr -e 's/^no package provides (.+)$/\1/p' -e 's/error: file (.+): No such file or directory$/\1/p'
+    """) + "\n"  # noqa: E501
+
+
+def make_test_setup(*, test_data, test_dir, test_exec, test_yaml, bin_dir, installed=()):
     """
     Generate a bash script that should prepare the remote end for test
     execution.
 
-    The bash script itself will (among other things) generate two more scripts:
-    a test script (contents of 'test' from FMF) and a python-based wrapper
-    script to run the test script.
+    The bash script itself will (among other things) generate a test script
+    (contents of 'test' from FMF), to be run by the test wrapper installed
+    via `make_helpers_install()`.
 
     - `test_data` is a dict with the parsed fmf metadata for the test.
 
-    - `test_dir` is a Path of a remote directory for wrapper and test
-      executables, and any additional test-related files.
+    - `test_dir` is a Path of a remote directory for the test executable,
+      and any additional test-related files.
 
       It is deleted and re-created for each test.
 
-    - `wrapper_exec` is a file, inside `test_dir`, of the test wrapper.
-
     - `test_exec` is a file, inside `test_dir`, holding the test script
       contents.
 
@@ -72,9 +190,11 @@ def make_test_setup(*, test_data, test_dir, wrapper_exec, test_exec, test_yaml,
       is to be written.
 
     - `bin_dir` is a Path of a remote directory to be prepended to PATH.
+
+    - `installed` is a set of RPM package names known to be already provided
+      on the remote, to skip querying (and installing) them.
     """
     test_dir_path = shlex.quote(str(test_dir))
-    wrapper_exec_path = shlex.quote(str(test_dir / wrapper_exec))
     test_exec_path = shlex.quote(str(test_dir / test_exec))
     test_yaml_path = shlex.quote(str(test_dir / test_yaml))
     bin_dir_path = shlex.quote(str(bin_dir))
@@ -91,8 +211,10 @@ def make_test_setup(*, test_data, test_dir, wrapper_exec, test_exec, test_yaml,
 
     # install test dependencies
     out += make_pkg_install(
-        required=tuple(test_pkg_requires(test_data, "require")),
-        recommended=tuple(test_pkg_requires(test_data, "recommend")),
+        required=tuple(p for p in test_pkg_requires(test_data, "require") if p not in installed),
+        recommended=tuple(
+            p for p in test_pkg_requires(test_data, "recommend") if p not in installed
+        ),
     )
 
     eof = f"EOF_{uuid.uuid4()}"
@@ -102,23 +224,6 @@ def make_test_setup(*, test_data, test_dir, wrapper_exec, test_exec, test_yaml,
     out += yaml.dump(test_data).rstrip("\n")  # don't rely on trailing \n
     out += f"\n{eof}\n"
 
-    # find a valid python
-    out += util.dedent(r"""
-        pyexec=$(command -v python3) || \
-        pyexec=$(command -v python) || \
-        pyexec=/usr/libexec/platform-python
-        if [[ ! -x $pyexec ]]; then
-            echo no executable python interpreter found >&2
-            exit 1
-        fi
-    """) + "\n"
-
-    # make the wrapper script
-    out += f"printf '#!%s\\n' \"$pyexec\" > {wrapper_exec_path}\n"
-    out += f"cat >> {wrapper_exec_path} <<'{eof}'\n"
-    out += _test_wrapper.read_text()
-    out += f"\n{eof}\n"
-
     # make the test script
     out += f"cat > {test_exec_path} <<'{eof}'\n"
     out += "#!/bin/bash\n"
@@ -142,14 +247,44 @@ def make_test_setup(*, test_data, test_dir, wrapper_exec, test_exec, test_yaml,
     out += test_data["test"]
     out += f"\n{eof}\n"
 
-    # make both executable
-    out += f"chmod 0755 {wrapper_exec_path} {test_exec_path}\n"
+    out += f"chmod 0755 {test_exec_path}\n"
 
     out += "exit 0\n"
 
     return out
 
 
+def make_batch_driver(*, jobs, driver_exec, jobs_file):
+    """
+    Generate a bash script that runs the batch driver on the remote end,
+    which sets up and runs several tests one after another, see the
+    `batch-driver` file for its output format.
+
+    - `jobs` is a list of dicts, one per test, with `setup` being a script
+      from `make_test_setup()` and `cmd` a list of test wrapper argv.
+
+    - `driver_exec` is a Path of the remote batch driver, installed via
+      `make_helpers_install()`.
+
+    - `jobs_file` is a Path of a remote file for the (JSON) `jobs`.
+    """
+    driver_exec_path = shlex.quote(str(driver_exec))
+    jobs_file_path = shlex.quote(str(jobs_file))
+
+    out = "#!/bin/bash\n"
+    out += "set -e\n"
+
+    eof = f"EOF_{uuid.uuid4()}"
+
+    out += f"cat > {jobs_file_path} <<'{eof}'\n"
+    out += json.dumps(jobs)
+    out += f"\n{eof}\n"
+
+    out += f"exec {driver_exec_path} {jobs_file_path}\n"
+
+    return out
+
+
 def make_plan_script(*, contents, cwd):
     """
     Generate a bash script to be used for every prepare/finish script defined
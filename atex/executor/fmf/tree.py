@@ -0,0 +1,94 @@
+import hashlib
+import os
+import tarfile
+import tempfile
+import threading
+import weakref
+from pathlib import Path
+
+# like 'rsync --exclude=.git/'
+_EXCLUDE = {".git"}
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def tree_manifest(root):
+    """
+    Yield a line (string) for every file, directory and symlink under a `root`
+    directory (a Path), describing it by its relative path, permission bits
+    and contents (SHA256 of a file, target of a symlink), sorted by path.
+
+    `.git` directories are skipped.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in _EXCLUDE)
+        dirpath = Path(dirpath)
+        rel_dir = dirpath.relative_to(root)
+        yield f"{rel_dir}\0dir\0{dirpath.stat().st_mode & 0o7777:o}"
+        # os.walk() lists symlinks to directories as directories
+        for name in sorted((*filenames, *(d for d in dirnames if (dirpath / d).is_symlink()))):
+            path = dirpath / name
+            rel = rel_dir / name
+            st = path.lstat()
+            if path.is_symlink():
+                yield f"{rel}\0link\0{path.readlink()}"
+            else:
+                digest = hashlib.sha256()
+                with open(path, "rb") as f:
+                    while chunk := f.read(1024 * 1024):
+                        digest.update(chunk)
+                yield f"{rel}\0file\0{st.st_mode & 0o7777:o}\0{digest.hexdigest()}"
+
+
+class TreeArchive:
+    """
+    A compressed tar archive of an fmf tree, identified by `digest`,
+    a SHA256 hash of its `tree_manifest()`, so that the archive can be
+    cached (ie. on a remote system) by its contents.
+
+    - `root` is a Path to the fmf metadata tree root.
+
+    The archive is created in a temporary `path`, deleted when this instance
+    is garbage collected.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+        digest = hashlib.sha256()
+        for line in tree_manifest(self.root):
+            digest.update(line.encode(errors="surrogateescape") + b"\n")
+        self.digest = digest.hexdigest()
+
+        fd, path = tempfile.mkstemp(prefix="atex-tree-", suffix=".tar.gz")
+        self.path = Path(path)
+        weakref.finalize(self, self.path.unlink, missing_ok=True)
+        with os.fdopen(fd, "wb") as f, tarfile.open(fileobj=f, mode="w:gz") as tar:
+            tar.add(self.root, arcname=".", filter=self._filter)
+
+    @staticmethod
+    def _filter(info):
+        if Path(info.name).name in _EXCLUDE:
+            return None
+        # let the remote user own the files, like rsync without -o/-g
+        info.uid = info.gid = 0
+        info.uname = info.gname = ""
+        return info
+
+    def __str__(self):
+        class_name = self.__class__.__name__
+        return f"{class_name}({self.root}, {self.digest})"
+
+
+def tree_archive(root):
+    """
+    Return a TreeArchive of an fmf tree `root`, creating it only once
+    for the same `root` (in a thread-safe way).
+    """
+    root = str(root)
+    with _archives_lock:
+        archive = _archives.get(root)
+        if archive is None:
+            archive = _archives[root] = TreeArchive(root)
+        return archive
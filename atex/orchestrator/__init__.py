@@ -21,7 +21,17 @@ class Orchestrator(ABC):
         Run the orchestration logic, blocking until all testing is concluded.
         """
         while self.serve_once():
-            time.sleep(0.1)
+            self.wait_for_work()
+
+    def wait_for_work(self):  # noqa: PLR6301
+        """
+        Block until `.serve_once()` might have new work to process.
+
+        The default implementation just sleeps for a short while, but
+        an Orchestrator may instead wait for a notification from any of its
+        running threads or Provisioners.
+        """
+        time.sleep(0.1)
 
     @abstractmethod
     def start(self):
@@ -1,17 +1,63 @@
 from .adhoc import (
     AdHocOrchestrator,
 )
+from .aio import (
+    AsyncAdHocOrchestrator,
+)
+from .budget import (
+    ArtifactBudget,
+)
+from .health import (
+    RemoteHealth,
+)
+from .journal import (
+    RunJournal,
+)
+from .metrics import (
+    Histogram,
+    RunMetrics,
+)
 from .mixins import (
     FMFDestructiveMixin,
     FMFDurationMixin,
+    FMFPackageAffinityMixin,
     FMFPriorityMixin,
+    HedgingMixin,
+    HistoricalRuntimeMixin,
     LimitedRerunsMixin,
 )
+from .multi import (
+    MultiPlatformOrchestrator,
+)
+from .provisioning import (
+    ProvisioningController,
+)
+from .runtimes import (
+    RuntimeStore,
+)
+from .workqueue import (
+    WorkQueue,
+    WorkQueueCoordinator,
+)
 
 __all__ = (
     "AdHocOrchestrator",
+    "AsyncAdHocOrchestrator",
+    "MultiPlatformOrchestrator",
     "LimitedRerunsMixin",
     "FMFDurationMixin",
     "FMFPriorityMixin",
     "FMFDestructiveMixin",
+    "HistoricalRuntimeMixin",
+    "FMFPackageAffinityMixin",
+    "HedgingMixin",
+    "ProvisioningController",
+    "ArtifactBudget",
+    "RemoteHealth",
+    "RunMetrics",
+    "Histogram",
+    "RunJournal",
+    "RuntimeStore",
+    "WorkQueue",
+    "WorkQueueCoordinator",
 )
@@ -1,4 +1,7 @@
+import collections
 import tempfile
+import threading
+import time
 
 from ... import util
 from .. import Orchestrator, OrchestratorError
@@ -51,8 +54,72 @@ class AdHocOrchestrator(Orchestrator):
     - `max_failed_setups` is an integer of how many times a setup (preparing
       a reserved Remote for test execution) may fail before FailedSetupError
       is raised.
+
+    - `max_ingest_workers` is how many Aggregator ingestions can run at once,
+      with any further ones waiting for a free worker thread. If None, every
+      finished test is ingested right away in a thread of its own.
+
+    - `max_release_workers` is the same, but for releasing Remotes.
+
+    - `journal` is a started RunJournal instance to record the progress
+      of testing to. If it was resumed from a previous run, any tests already
+      ingested (for this `platform`) are not run again, and any results
+      of other tests are `.discard()`ed from `aggregator`.
+
+    - `runtimes` is a started RuntimeStore instance to record runtimes
+      of all tests that finished without an exception.
+
+    - `provisioning` is a ProvisioningController instance to decide how many
+      Remotes to request from `provisioners`. If None, as many Remotes as there
+      are tests are requested from each Provisioner upfront, cancelled via
+      `.clear()` once all tests have started.
+
+    - `metrics` is a started RunMetrics instance to record the duration
+      of provisioning, setup, test, ingestion and release phases to.
+
+    - `work_queue` is a started WorkQueue instance (or a proxy from
+      `WorkQueueCoordinator.connect()`) shared with other orchestrators
+      (shards) running the same `tests` for the same `platform`, each test
+      being run by whichever shard claims it first. Re-runs are put back
+      to the WorkQueue for any shard to claim.
+
+    - `shard` is a unique name of this orchestrator among others sharing
+      `work_queue`, required with it. Tests left claimed by it (ie. by
+      a previous crashed run of the same shard) are given back to the
+      WorkQueue on `.start()`, so it needs to stay the same across restarts.
+
+    - `health` is a RemoteHealth instance to track the health of Remotes with,
+      releasing (and not re-using) any it considers broken.
+
+    - `snapshots` is True to set up only one Remote per Provisioner the usual
+      way (`.run_setup()`), snapshot it (see `Provisioner.snapshot()`) and
+      skip `.run_setup()` on later Remotes started from the snapshot, only
+      restoring their Executor (see `Executor.export_setup()`).
+      This silently does nothing for Provisioners or Executors without
+      snapshot support.
+
+    - `artifacts_budget` is an ArtifactBudget instance limiting the amount
+      of test artifacts waiting for ingestion, not starting new tests while
+      it is exceeded.
+
+    - `artifacts_dir` is a string/Path of a directory to create temporary
+      test artifacts in (ie. on a fast local disk or tmpfs). If None, the
+      default temporary directory is used.
+
+    - `artifacts_in_aggregator`, if True, creates test artifacts in the
+      Aggregator's `.artifacts_dir()` instead of `artifacts_dir`, so that
+      ingesting them is just a rename (falling back to the default temporary
+      directory if the Aggregator has none).
     """
 
+    # how long (in seconds) .wait_for_work() blocks without any notification,
+    # if all Provisioners support notifications (as a safety net), or if not
+    # (to poll the Provisioners for new Remotes)
+    notify_timeout = 10
+    poll_timeout = 0.1
+    # how often (in seconds) to check `work_queue` for re-runs from other shards
+    work_queue_timeout = 1
+
     class SetupInfo(
         util.NamedMapping,
         required=(
@@ -74,6 +141,8 @@ class AdHocOrchestrator(Orchestrator):
             "test_name",
             # Path of a dir with test artifacts as a TemporaryDirectory instance
             "artifacts",
+            # time.monotonic() of when the test was started
+            "started",
         ),
     ):
         pass
@@ -94,6 +163,10 @@ class AdHocOrchestrator(Orchestrator):
     def __init__(
         self, platform, tests, provisioners, executor, aggregator, *,
         old_aggregator=None, max_spares=0, max_failed_setups=10,
+        max_ingest_workers=None, max_release_workers=None, journal=None,
+        runtimes=None, provisioning=None, metrics=None, work_queue=None, shard=None,
+        health=None, snapshots=False, artifacts_budget=None, artifacts_dir=None,
+        artifacts_in_aggregator=False,
     ):
         self.logger = _get_logger()
 
@@ -106,26 +179,309 @@ class AdHocOrchestrator(Orchestrator):
 
         if not self._to_run:
             raise ValueError("no tests were passed to run, 'tests' is empty")
+        if work_queue and not shard:
+            raise ValueError("'work_queue' needs a 'shard' name, to resume its claimed tests")
+        if artifacts_dir is not None and artifacts_in_aggregator:
+            raise ValueError("'artifacts_dir' and 'artifacts_in_aggregator' are exclusive")
 
         self.old_aggregator = old_aggregator
         self.max_spares = max_spares
         self._failed_setups_left = max_failed_setups
+        self.journal = journal
+        self.runtimes = runtimes
+        self.provisioning = provisioning
+        self.metrics = metrics
+        self.work_queue = work_queue
+        self.shard = shard
+        self.health = health
+        self.snapshots = snapshots
+        self.artifacts_budget = artifacts_budget
+        self.artifacts_dir = artifacts_dir
+        self.artifacts_in_aggregator = artifacts_in_aggregator
+        self._artifacts_root = artifacts_dir
 
         # just for str(self)
         self._total_tests = len(self._to_run)
+
+        # the journal and WorkQueue work with strings, map them back
+        # to the original tests
+        self._test_names = {str(name): name for name in self._to_run}
+
+        if journal:
+            ingested = [
+                self._test_names[name] for name in journal.ingested(platform)
+                if name in self._test_names
+            ]
+            if ingested:
+                for name in ingested:
+                    del self._to_run[name]
+                self.logger.info(f"resuming, skipping {len(ingested)} already ingested tests")
+
+        # with a WorkQueue, self._to_run mirrors tests pending in it
+        # (as of self._work_queue_seq), and they are claimed only when started
+        self._work_queue_seq = 0
+        if work_queue:
+            work_queue.add(platform, self._test_names)
+            for name in self._test_names.keys() - map(str, self._to_run):
+                work_queue.done(platform, name)
+            reset = work_queue.reset(platform, self.shard)
+            if reset:
+                self.logger.info(f"resuming, returned {reset} tests claimed by {self.shard}")
+            self._to_run = {}
+            # subclasses (mixins) haven't set up their state yet,
+            # they see the pending tests in self._to_run after this __init__
+            self._sync_work_queue(requeue=False)
+
         # True if empty self._to_run was seen at least once;
         # needed because re-runs add the test back to self._to_run
         self._finishing_up = False
         # running tests as a dict, indexed by test name, with RunningInfo values
         self._running_tests = {}
+        # duplicates of running tests (see .should_hedge()), indexed by test
+        # name, with RunningInfo values
+        self._hedges = {}
+        # losers of a hedged test, cancelled but not yet finished,
+        # indexed by id() of their RunningInfo
+        self._cancelled = {}
+        # (snapshot, Executor.export_setup() data) tuples per Provisioner,
+        # None if a snapshot is being taken or isn't supported
+        self._golden = {}
+        # Remotes being set up, including ones with setup finished but not yet
+        # retrieved from self._setup_queue
+        self._setting_up = 0
+        # time.monotonic() of .provision() calls as [time, count] FIFOs,
+        # per Provisioner, to measure Remote provisioning time for metrics
+        # (the ProvisioningController, if any, does this on its own)
+        self._provision_requests = collections.defaultdict(collections.deque)
+        # set-up Remotes (as SetupInfo or FinishedInfo) waiting for
+        # ._can_start_test() to allow running a test on them
+        self._idle = collections.deque()
+        # time.monotonic() of when a Remote was put to self._idle by
+        # ._start_or_hold(), indexed by the Remote, for metrics
+        self._held_since = {}
+        # callable deciding whether a test can start, see ._attach()
+        self._start_limiter = None
+        # set by any finished thread or a Provisioner with a new Remote,
+        # waking up .wait_for_work()
+        self._wakeup = threading.Event()
+        # False if the Event is shared and cleared by somebody else
+        self._owns_wakeup = True
+        # True if all Provisioners notify us via self._wakeup, so we don't
+        # need to poll them
+        self._notified = False
         # thread queue for actively running tests
-        self._test_queue = util.ThreadJoinQueue(daemon=False)
+        self._test_queue = util.ThreadJoinQueue(daemon=False, notify=self._wakeup.set)
         # thread queue for remotes being set up (uploading tests, etc.)
-        self._setup_queue = util.ThreadJoinQueue(daemon=True)
+        self._setup_queue = util.ThreadJoinQueue(daemon=True, notify=self._wakeup.set)
         # thread queue for remotes being released
-        self._release_queue = util.ThreadJoinQueue(daemon=True)
+        self._release_queue = self._make_queue(
+            max_release_workers, daemon=True, notify=self._wakeup.set,
+        )
         # thread queue for results being ingested
-        self._ingest_queue = util.ThreadJoinQueue(daemon=False)
+        self._ingest_queue = self._make_queue(
+            max_ingest_workers, daemon=False, notify=self._wakeup.set,
+        )
+
+    @staticmethod
+    def _make_queue(max_workers, **kwargs):
+        if max_workers is None:
+            return util.ThreadJoinQueue(**kwargs)
+        else:
+            return util.ThreadPoolJoinQueue(max_workers, **kwargs)
+
+    def _attach(self, wakeup, ingest_queue, start_limiter):
+        """
+        Share a `wakeup` Event and an `ingest_queue` with other orchestrators,
+        letting a `start_limiter` callable (given this orchestrator) decide
+        whether a new test can start.
+
+        The caller becomes responsible for clearing `wakeup` before calling
+        `.serve_once()`. Must be called before `.start()`.
+        """
+        self._wakeup = wakeup
+        self._owns_wakeup = False
+        for queue in (self._test_queue, self._setup_queue, self._release_queue):
+            queue.notify = wakeup.set
+        self._ingest_queue = ingest_queue
+        self._start_limiter = start_limiter
+
+    def _held_remotes(self):
+        """
+        Return how many Remotes are held, but not running tests.
+        """
+        return self._setting_up + len(self._idle)
+
+    def _provision(self, provisioner, count):
+        provisioner.provision(count)
+        if self.metrics:
+            self._provision_requests[provisioner].append([time.monotonic(), count])
+
+    def _provision_replacement(self, provisioner):
+        """
+        Get a replacement for a Remote from `provisioner` that was destroyed
+        (or failed to set up).
+        """
+        if self.provisioning:
+            # let it figure out the missing Remote on its own
+            self.provisioning.update(self, force=True)
+        else:
+            self._provision(provisioner, 1)
+
+    def _remote_received(self, provisioner):
+        """
+        Account for a new Remote from `provisioner`, returning how long
+        it was waited for (or None if unknown).
+        """
+        if self.provisioning:
+            return self.provisioning.remote_received(provisioner)
+        requests = self._provision_requests[provisioner]
+        if not requests:
+            return None
+        requested = requests[0][0]
+        requests[0][1] -= 1
+        if requests[0][1] <= 0:
+            requests.popleft()
+        return time.monotonic() - requested
+
+    def _record(self, phase, duration, provisioner, *, platform=None, **extra):
+        """
+        Record a `phase` of `duration` seconds into `metrics`, if any.
+        """
+        if self.metrics:
+            self.metrics.record(
+                phase,
+                duration,
+                platform=self.platform if platform is None else platform,
+                provisioner=type(provisioner).__name__,
+                **extra,
+            )
+
+    def _setup_finished(self, treturn):
+        """
+        Account for a finished setup `treturn`, returning its SetupInfo.
+        """
+        self._setting_up -= 1
+        self._record(
+            "setup",
+            time.monotonic() - treturn.started,
+            treturn.sinfo.provisioner,
+            failed=treturn.exception is not None,
+            restored=treturn.restore is not None,
+        )
+        if treturn.bake:
+            provisioner = treturn.sinfo.provisioner
+            if treturn.exception:
+                # try again with the next Remote
+                del self._golden[provisioner]
+            elif treturn.returned:
+                self.logger.info(f"{provisioner}: new Remotes will start from a snapshot")
+                self._golden[provisioner] = treturn.returned
+        return treturn.sinfo
+
+    def _release(self, info):
+        """
+        Release the Remote of `info` (any SetupInfo) in a background thread.
+        """
+        if self.health:
+            self.health.forget(info.remote)
+        self._held_since.pop(info.remote, None)
+        self._release_queue.start_thread(
+            info.remote.release,
+            remote=info.remote,
+            provisioner=info.provisioner,
+            started=time.monotonic(),
+        )
+
+    def _ingest(self, aggregator, finfo, *, final):
+        """
+        Ingest the artifacts of `finfo` into `aggregator` in a background
+        thread, cleaning them up afterwards.
+        """
+        # the size of artifacts is measured by the ingestion worker,
+        # not to walk through all the files here
+        if self.artifacts_budget:
+            self.artifacts_budget.add()
+        labels = {
+            "platform": self.platform,
+            "provisioner": type(finfo.provisioner).__name__,
+        }
+        if self.metrics:
+            self.metrics.adjust("ingest_backlog", 1, **labels)
+        self._ingest_queue.start_thread(
+            self._ingest_and_cleanup,
+            target_args=(
+                # ingest func itself
+                aggregator.ingest,
+                # args for ingest
+                (self.platform, finfo.test_name, finfo.artifacts.name),
+                # cleanup func itself
+                finfo.artifacts.cleanup,
+                labels,
+            ),
+            test_name=finfo.test_name,
+            platform=self.platform,
+            provisioner=finfo.provisioner,
+            queued=time.monotonic(),
+            final=final,
+        )
+
+    def _can_start_test(self):
+        """
+        Return True if a new test can be started right now, False to hold
+        a set-up Remote idle until a later `.serve_once()`.
+        """
+        if self.artifacts_budget and self.artifacts_budget.exceeded():
+            return False
+        return self._start_limiter is None or self._start_limiter(self)
+
+    def _start_idle(self):
+        """
+        Start tests on any Remotes held idle, for as long as we can.
+        """
+        while self._idle and self._to_run and self._can_start_test():
+            self._run_new_test(self._idle.popleft())
+
+    def _start_or_hold(self, info):
+        """
+        Run a new test using `info` (see `._run_new_test()`), or hold its
+        Remote idle if a test cannot be started right now.
+        """
+        if self._can_start_test():
+            self._run_new_test(info)
+        else:
+            if self.artifacts_budget and self.artifacts_budget.exceeded():
+                self.logger.info(
+                    f"holding {info.remote} idle, waiting for ingestion: {self.artifacts_budget}",
+                )
+            else:
+                self.logger.debug(f"holding {info.remote} idle, cannot start a test now")
+            self._held_since[info.remote] = time.monotonic()
+            self._idle.append(info)
+
+    def _sync_work_queue(self, *, requeue=True):
+        """
+        Update self._to_run with tests that became pending in `work_queue`
+        (ie. re-runs from other shards), or stopped being pending.
+
+        If `requeue` is False, pending tests are added to self._to_run
+        directly, without calling ._requeue_test().
+        """
+        self._work_queue_seq, changes = self.work_queue.changes(
+            self.platform, self._work_queue_seq,
+        )
+        for name, state in changes:
+            test_name = self._test_names.get(name)
+            if test_name is None:
+                continue
+            if state == "pending":
+                if test_name in self._to_run:
+                    continue
+                if requeue:
+                    self._requeue_test(test_name)
+                else:
+                    self._to_run[test_name] = None
+            else:
+                self._to_run.pop(test_name, None)
 
     def _run_new_test(self, info):
         """
@@ -136,46 +492,206 @@ class AdHocOrchestrator(Orchestrator):
           - FinishedInfo instance of a previously executed test
             (reusing Remote/Executor for a new test).
         """
-        next_test_name = self.next_test(self._to_run.keys(), info)
-        assert next_test_name in self._to_run, "next_test() needs to return a valid test name"
+        while True:
+            next_test_name = self.next_test(self._to_run.keys(), info)
+            assert next_test_name in self._to_run, "next_test() needs to return a valid test name"
+            del self._to_run[next_test_name]
+            if not self.work_queue:
+                break
+            if self.work_queue.claim(self.platform, str(next_test_name), self.shard):
+                break
+            # claimed by another shard in the meantime
+            self.logger.debug(f"'{next_test_name}' was claimed by another shard")
+            if not self._to_run:
+                self.logger.debug(f"holding {info.remote} idle, nothing left to claim")
+                self._idle.append(info)
+                return
 
         self.logger.info(f"starting '{next_test_name}' on {info.remote}")
 
-        del self._to_run[next_test_name]
+        if self.journal:
+            self.journal.record(self.platform, "start", str(next_test_name))
+
+        self._running_tests[next_test_name] = self._start_test(info, next_test_name)
+
+    def _start_test(self, info, test_name):
+        """
+        Start running `test_name` using `info` (see `._run_new_test()`),
+        returning its RunningInfo.
+        """
+        held = self._held_since.pop(info.remote, None)
+        if held is not None:
+            self._record("stall", time.monotonic() - held, info.provisioner)
 
         # let __del__ take care of it in case we don't
         artifacts = tempfile.TemporaryDirectory(
-            prefix="atex-" + str(util.normalize_path(next_test_name)).replace("/","-") + "-",
+            prefix="atex-" + str(util.normalize_path(test_name)).replace("/","-") + "-",
+            dir=self._artifacts_root,
         )
 
         rinfo = self.RunningInfo._from(
             info,
-            test_name=next_test_name,
+            test_name=test_name,
             artifacts=artifacts,
+            started=time.monotonic(),
         )
 
         self._test_queue.start_thread(
-            target=info.executor.run_test,
+            target=self._run_test,
             target_args=(
-                next_test_name,
+                info.executor,
+                test_name,
                 artifacts.name,
             ),
             rinfo=rinfo,
         )
 
-        self._running_tests[next_test_name] = rinfo
+        return rinfo
 
     @staticmethod
-    def _ingest_and_cleanup(ingest, args, cleanup):
+    def _run_test(executor, test_name, artifacts):
+        return executor.run_test(test_name, artifacts)
+
+    def _run_setup(self, info, restore, bake):
+        """
+        Set up the Remote of `info` (SetupInfo), restoring its Executor from
+        `restore` data of a snapshot (if not None), or running `.run_setup()`
+        and, if `bake` is True, snapshotting the result.
+
+        Returns a (snapshot, data) tuple if a snapshot was taken.
+        """
+        if restore is not None:
+            info.executor.restore_setup(restore)
+            return None
+        self.run_setup(info)
+        if not bake:
+            return None
+        data = info.executor.export_setup()
+        # supported only by some Executors
+        if data is None or not hasattr(info.executor, "restore_setup"):
+            return None
+        try:
+            snapshot = info.provisioner.snapshot(info.remote)
+        except Exception as e:
+            # the Remote itself is still fine, just run setup on every one
+            self.logger.warning(f"{info.remote}: snapshot failed with {type(e).__name__}({e})")
+            return None
+        return None if snapshot is None else (snapshot, data)
+
+    def _get_spare(self):
+        """
+        Return a set-up Remote (as SetupInfo or FinishedInfo) not running
+        any test, or None if there is none.
+        """
+        if self._idle:
+            return self._idle.popleft()
+        while True:
+            try:
+                treturn = self._setup_queue.get_raw(block=False)
+            except util.ThreadJoinQueue.Empty:
+                return None
+            sinfo = self._setup_finished(treturn)
+            if not treturn.exception:
+                return sinfo
+            self._release(sinfo)
+
+    def _hedge_tests(self):
+        """
+        Start a duplicate of any running test `.should_hedge()` agrees with,
+        on spare set-up Remotes, for as long as there are any.
+        """
+        if not self._idle and not self._setup_queue.qsize():
+            return
+        for rinfo in list(self._running_tests.values()):
+            if rinfo.test_name in self._hedges or not self.should_hedge(rinfo):
+                continue
+            spare = self._get_spare()
+            if spare is None:
+                break
+            self.logger.info(
+                f"'{rinfo.test_name}' is taking long, hedging it on {spare.remote}",
+            )
+            self._hedges[rinfo.test_name] = self._start_test(spare, rinfo.test_name)
+
+    def _resolve_hedge(self, rinfo, finfo):
+        """
+        If `rinfo` (a finished test, with `finfo` as its FinishedInfo) was
+        hedged, pick a winner among its two copies.
+
+        A copy that finished cleanly wins, and the other (still running) copy
+        is cancelled. A copy that failed (ie. on a broken spare Remote) is
+        discarded like a cancelled one instead, leaving the other copy running
+        on its own, with its result being used, whatever it is.
+
+        Returns False if `finfo` was discarded, True if it is the test result.
+        """
+        hedge = self._hedges.pop(rinfo.test_name, None)
+        if hedge is None:
+            return True
+        original = self._running_tests[rinfo.test_name]
+        other = original if rinfo is hedge else hedge
+        if finfo.exception is None and finfo.exit_code == 0:
+            self.logger.info(f"'{rinfo.test_name}' finished first on {rinfo.remote}")
+            self.logger.debug(f"cancelling '{other.test_name}' on {other.remote}")
+            other.executor.cancel()
+            self._cancelled[id(other)] = other
+            return True
+        self.logger.info(
+            f"'{rinfo.test_name}' failed on {rinfo.remote}, "
+            f"waiting for its other copy on {other.remote}",
+        )
+        self._running_tests[rinfo.test_name] = other
+        self._process_cancelled_test(finfo)
+        return False
+
+    def _process_cancelled_test(self, finfo):
+        """
+        `finfo` is a FinishedInfo instance of a cancelled (or failed)
+        hedge loser.
+        """
+        if self.old_aggregator:
+            self._ingest(self.old_aggregator, finfo, final=False)
+        else:
+            finfo.artifacts.cleanup()
+        # the test was interrupted, don't trust the Remote
+        self._release(finfo)
+
+    def _requeue_test(self, test_name):
+        """
+        Add `test_name` back to the tests to be run (ie. for a rerun).
+        """
+        self._to_run[test_name] = None
+
+    def _ingest_and_cleanup(self, ingest, args, cleanup, labels):
+        # runs in an ingestion worker, account for the artifacts size here
+        size = 0
+        if self.artifacts_budget:
+            size = self.artifacts_budget.size(args[2])
+            self.artifacts_budget.resize(size)
+        if self.metrics:
+            self.metrics.adjust("artifacts_bytes", size, **labels)
         try:
             ingest(*args)
         finally:
             cleanup()
+            if self.artifacts_budget:
+                self.artifacts_budget.resize(-size)
+            if self.metrics:
+                self.metrics.adjust("artifacts_bytes", -size, **labels)
 
     def _process_finished_test(self, finfo):
         """
         `finfo` is a FinishedInfo instance.
         """
+        if self.journal:
+            self.journal.record(
+                self.platform, "finish", str(finfo.test_name), exit_code=finfo.exit_code,
+            )
+
+        if self.runtimes and not finfo.exception:
+            runtime = time.monotonic() - finfo.started
+            self.runtimes.record(self.platform, str(finfo.test_name), runtime)
+
         if finfo.exception:
             exc_str = f"{type(finfo.exception).__name__}({finfo.exception})"
             self.logger.warning(f"'{finfo.test_name}' threw {exc_str} during test runtime")
@@ -184,49 +700,43 @@ class AdHocOrchestrator(Orchestrator):
             self.logger.debug(f"'{finfo.test_name}' exited with: {finfo.exit_code}")
             remote_destroyed = self.destructive(finfo)
 
-        if (finfo.exception or finfo.exit_code != 0) and self.should_be_rerun(finfo):
+        rerun = (finfo.exception or finfo.exit_code != 0) and self.should_be_rerun(finfo)
+
+        quarantined = False
+        if self.health:
+            reason = self.health.record(finfo)
+            if reason and not remote_destroyed:
+                self.logger.warning(f"quarantining {finfo.remote}: {reason}")
+                remote_destroyed = quarantined = True
+                # replace it right away, before its tests pile up elsewhere
+                if self._to_run or rerun:
+                    self._provision_replacement(finfo.provisioner)
+
+        if rerun:
             self.logger.info(f"'{finfo.test_name}' failed, re-running")
-            self._to_run[finfo.test_name] = None  # add it
+            self._requeue_test(finfo.test_name)
+            if self.work_queue:
+                self.work_queue.requeue(self.platform, str(finfo.test_name))
+
+            if self.journal:
+                self.journal.record(self.platform, "rerun", str(finfo.test_name))
 
             # provision a replacement for a destroyed Remote
-            if remote_destroyed:
+            if remote_destroyed and not quarantined:
                 self.logger.debug(f"{finfo.remote} was destroyed, getting a new one")
-                finfo.provisioner.provision(1)
+                self._provision_replacement(finfo.provisioner)
 
             if self.old_aggregator:
                 # ingest the test artifacts into old_aggregator (will be rerun)
-                self._ingest_queue.start_thread(
-                    self._ingest_and_cleanup,
-                    target_args=(
-                        # ingest func itself
-                        self.old_aggregator.ingest,
-                        # args for ingest
-                        (self.platform, finfo.test_name, finfo.artifacts.name),
-                        # cleanup func itself
-                        finfo.artifacts.cleanup,
-                    ),
-                    test_name=finfo.test_name,
-                )
+                self._ingest(self.old_aggregator, finfo, final=False)
             else:
                 # discard the test artifacts
                 finfo.artifacts.cleanup()
 
         else:
             self.logger.info(f"'{finfo.test_name}' completed, ingesting result")
-
             # ingest the artifacts into the main aggregator
-            self._ingest_queue.start_thread(
-                self._ingest_and_cleanup,
-                target_args=(
-                    # ingest func itself
-                    self.aggregator.ingest,
-                    # args for ingest
-                    (self.platform, finfo.test_name, finfo.artifacts.name),
-                    # cleanup func itself
-                    finfo.artifacts.cleanup,
-                ),
-                test_name=finfo.test_name,
-            )
+            self._ingest(self.aggregator, finfo, final=True)
 
         # ingested (destroyed) or removed, artifacts are invalid either way
         finfo = self.FinishedInfo._from(finfo, artifacts=None)
@@ -235,19 +745,61 @@ class AdHocOrchestrator(Orchestrator):
         # run the next test on it (possibly a rerun)
         if self._to_run and not remote_destroyed:
             self.logger.debug(f"'{finfo.test_name}' was non-destructive, running next test")
-            self._run_new_test(finfo)
+            self._start_or_hold(finfo)
         else:
             self.logger.debug(f"{finfo.remote} no longer useful, releasing it")
-            self._release_queue.start_thread(
-                finfo.remote.release,
-                remote=finfo.remote,
-            )
+            self._release(finfo)
+
+    def _process_ingested(self, treturn):
+        """
+        `treturn` is a ThreadResult of a finished ingestion.
+        """
+        if self.artifacts_budget:
+            self.artifacts_budget.remove()
+        if self.metrics:
+            labels = {
+                "platform": treturn.platform,
+                "provisioner": type(treturn.provisioner).__name__,
+            }
+            self.metrics.adjust("ingest_backlog", -1, **labels)
+        self._record(
+            "ingest",
+            time.monotonic() - treturn.queued,
+            treturn.provisioner,
+            platform=treturn.platform,
+            test=str(treturn.test_name),
+            final=treturn.final,
+            failed=treturn.exception is not None,
+        )
+        if treturn.exception:
+            exc_str = f"{type(treturn.exception).__name__}({treturn.exception})"
+            self.logger.error(f"'{treturn.test_name}' ingesting failed: {exc_str}")
+        else:
+            self.logger.debug(f"'{treturn.test_name}' ingesting completed")
+            if self.journal and treturn.final:
+                self.journal.record(treturn.platform, "ingested", str(treturn.test_name))
+            # left claimed if ingesting failed, to be re-run by a restarted shard
+            if self.work_queue and treturn.final:
+                self.work_queue.done(treturn.platform, str(treturn.test_name))
 
     def serve_once(self):
+        # pick up re-runs from other shards
+        if self.work_queue:
+            self._sync_work_queue()
+
         # all done
-        if not self._to_run and not self._running_tests:
+        if not self._to_run and not self._running_tests and not self._cancelled:
             return False
 
+        # clear before processing anything, so that any notification arriving
+        # while we process the queues below makes the next .wait_for_work()
+        # return immediately
+        if self._owns_wakeup:
+            self._wakeup.clear()
+
+        # start tests on any Remotes held idle, if we can now
+        self._start_idle()
+
         # process all finished tests, potentially reusing remotes for executing
         # further tests
         while True:
@@ -257,13 +809,29 @@ class AdHocOrchestrator(Orchestrator):
                 break
 
             rinfo = treturn.rinfo
-            del self._running_tests[rinfo.test_name]
+            cancelled = self._cancelled.pop(id(rinfo), None) is not None
+            self._record(
+                "test",
+                time.monotonic() - rinfo.started,
+                rinfo.provisioner,
+                test=str(rinfo.test_name),
+                exit_code=treturn.returned,
+                cancelled=cancelled,
+            )
 
             finfo = self.FinishedInfo(
                 **rinfo,
                 exit_code=treturn.returned,
                 exception=treturn.exception,
             )
+
+            if cancelled:
+                self._process_cancelled_test(finfo)
+                continue
+
+            if not self._resolve_hedge(rinfo, finfo):
+                continue
+            del self._running_tests[rinfo.test_name]
             self._process_finished_test(finfo)
 
         # process any remotes with finished setup, start executing tests on them
@@ -273,26 +841,23 @@ class AdHocOrchestrator(Orchestrator):
             except util.ThreadJoinQueue.Empty:
                 break
 
-            sinfo = treturn.sinfo
+            sinfo = self._setup_finished(treturn)
 
             if treturn.exception:
                 exc_str = f"{type(treturn.exception).__name__}({treturn.exception})"
                 msg = f"{sinfo.remote}: setup failed with {exc_str}"
-                self._release_queue.start_thread(
-                    sinfo.remote.release,
-                    remote=sinfo.remote,
-                )
+                self._release(sinfo)
                 if self._failed_setups_left > 0:
                     self._failed_setups_left -= 1
                     self.logger.warning(
                         f"{msg}, re-trying ({self._failed_setups_left} setup retries left)",
                     )
-                    sinfo.provisioner.provision(1)
+                    self._provision_replacement(sinfo.provisioner)
                 else:
                     self.logger.error(f"{msg}, setup retries exceeded, giving up")
                     raise FailedSetupError("setup retries limit exceeded, broken infra?")
             else:
-                self._run_new_test(sinfo)
+                self._start_or_hold(sinfo)
 
         # everything is either finished, running, or about to be re-run,
         # and we have a healthy buffer of spare Remotes,
@@ -302,12 +867,14 @@ class AdHocOrchestrator(Orchestrator):
         if (
             not self._to_run and
             not self._finishing_up and
+            not self.provisioning and
             self._setup_queue.qsize() >= self.max_spares
         ):
             self._finishing_up = True
             self.logger.info("switching to finishing-up mode, sending .clear() to provisioners")
             for prov in self.provisioners:
                 prov.clear()
+                self._provision_requests[prov].clear()
 
         # release any extra Remotes being held as set-up beyond what we need
         # for re-runs + self.max_spares
@@ -317,28 +884,60 @@ class AdHocOrchestrator(Orchestrator):
                 treturn = self._setup_queue.get_raw(block=False)
             except util.ThreadJoinQueue.Empty:
                 break
-            self.logger.info(f"releasing extraneous set-up {treturn.sinfo.remote}")
-            self._release_queue.start_thread(
-                treturn.sinfo.remote.release,
-                remote=treturn.sinfo.remote,
-            )
+            sinfo = self._setup_finished(treturn)
+            self.logger.info(f"releasing extraneous set-up {sinfo.remote}")
+            self._release(sinfo)
+
+        # nothing else to run, but some tests are taking long, so try
+        # duplicating them on spare Remotes, taking whichever finishes first
+        if not self._to_run and self._running_tests:
+            self._hedge_tests()
 
         # try to get new Remotes from Provisioners - if we get some, start
         # running setup on them
         for provisioner in self.provisioners:
             while (remote := provisioner.get_remote(block=False)) is not None:
+                waited = self._remote_received(provisioner)
+                if waited is not None:
+                    self._record("provision", waited, provisioner)
                 ex = self.executor(remote)
                 sinfo = self.SetupInfo(
                     provisioner=provisioner,
                     remote=remote,
                     executor=ex,
                 )
+                restore = None
+                bake = False
+                if self.snapshots:
+                    golden = self._golden.get(provisioner)
+                    if golden and remote.snapshot == golden[0]:
+                        restore = golden[1]
+                    elif provisioner not in self._golden:
+                        self._golden[provisioner] = None
+                        bake = True
                 self._setup_queue.start_thread(
-                    target=self.run_setup,
-                    target_args=(sinfo,),
+                    target=self._run_setup,
+                    target_args=(sinfo, restore, bake),
                     sinfo=sinfo,
+                    restore=restore,
+                    bake=bake,
+                    started=time.monotonic(),
                 )
-                self.logger.info(f"running setup on new {remote}")
+                self._setting_up += 1
+                if restore is not None:
+                    self.logger.info(f"restoring setup on new {remote} from a snapshot")
+                else:
+                    self.logger.info(f"running setup on new {remote}")
+
+        # release any Remotes held idle if there is nothing more to run on them
+        while self._idle and not self._to_run:
+            info = self._idle.popleft()
+            self.logger.debug(f"{info.remote} no longer useful, releasing it")
+            self._release(info)
+
+        # request more Remotes, or cancel excess requests, based on work left
+        if self.provisioning:
+            self.provisioning.update(self)
 
         # gather returns from Remote.release() functions - check for exceptions
         # thrown, re-report them as warnings as they are not typically critical
@@ -349,6 +948,12 @@ class AdHocOrchestrator(Orchestrator):
             except util.ThreadJoinQueue.Empty:
                 break
             else:
+                self._record(
+                    "release",
+                    time.monotonic() - treturn.started,
+                    treturn.provisioner,
+                    failed=treturn.exception is not None,
+                )
                 if treturn.exception:
                     exc_str = f"{type(treturn.exception).__name__}({treturn.exception})"
                     self.logger.warning(f"{treturn.remote} release failed: {exc_str}")
@@ -362,17 +967,48 @@ class AdHocOrchestrator(Orchestrator):
             except util.ThreadJoinQueue.Empty:
                 break
             else:
-                if treturn.exception:
-                    exc_str = f"{type(treturn.exception).__name__}({treturn.exception})"
-                    self.logger.error(f"'{treturn.test_name}' ingesting failed: {exc_str}")
-                else:
-                    self.logger.debug(f"'{treturn.test_name}' ingesting completed")
+                self._process_ingested(treturn)
+
+        # finished ingestions may have freed up the artifacts budget
+        if self.artifacts_budget:
+            self._start_idle()
 
         return True
 
+    def _wait_timeout(self):
+        """
+        Return how long (in seconds) `.wait_for_work()` may block.
+        """
+        timeout = self.notify_timeout if self._notified else self.poll_timeout
+        # other shards don't notify us
+        if self.work_queue:
+            timeout = min(timeout, self.work_queue_timeout)
+        return timeout
+
+    def wait_for_work(self):
+        self._wakeup.wait(self._wait_timeout())
+
     def start(self):
         self.logger.debug(f"starting: {self}")
 
+        if self.artifacts_in_aggregator:
+            self._artifacts_root = self.aggregator.artifacts_dir()
+
+        # the journal decides what was ingested - any results of other tests
+        # come from a crash in the middle of ingesting them, and they will
+        # be run (and ingested) again
+        if self.journal:
+            ingested = self.journal.ingested(self.platform)
+            discarded = self.aggregator.discard(
+                self.platform, [name for name in self._test_names if name not in ingested],
+            )
+            if discarded:
+                self.logger.info(f"resuming, discarded partial results of {discarded} tests")
+
+        # register with all Provisioners, avoid short-circuiting all()
+        supported = [prov.add_notify(self._wakeup.set) for prov in self.provisioners]
+        self._notified = all(supported)
+
         # start up initial reservations - the idea is to request as many remotes
         # as there are tests (worst possible case where Remotes are not reused)
         # from EACH provisioner, allowing any one of them to supply the Remotes
@@ -381,14 +1017,20 @@ class AdHocOrchestrator(Orchestrator):
         # after self._to_run is exhausted, we do .clear() on all of these
         # and let just the destructive .provision(1) logic get new Remotes
         remotes = len(self._to_run)
-        for prov in self.provisioners:
-            prov.provision(remotes)
+        # nothing to do if all tests were already ingested by a resumed run
+        if remotes == 0:
+            return
+        if self.provisioning:
+            self.provisioning.update(self, force=True)
+        else:
+            for prov in self.provisioners:
+                self._provision(prov, remotes)
 
     def stop(self):
         self.logger.debug(f"stopping: {self}")
 
         # cancel all running tests and wait for them to clean up
-        for rinfo in self._running_tests.values():
+        for rinfo in (*self._running_tests.values(), *self._hedges.values()):
             rinfo.executor.cancel()
         self._test_queue.join()    # also ignore any exceptions raised
 
@@ -400,11 +1042,7 @@ class AdHocOrchestrator(Orchestrator):
             except util.ThreadJoinQueue.Empty:
                 break
             else:
-                if treturn.exception:
-                    exc_str = f"{type(treturn.exception).__name__}({treturn.exception})"
-                    self.logger.error(f"'{treturn.test_name}' ingesting failed: {exc_str}")
-                else:
-                    self.logger.debug(f"'{treturn.test_name}' ingesting completed")
+                self._process_ingested(treturn)
 
     def __str__(self):
         class_name = self.__class__.__name__
@@ -447,6 +1085,26 @@ class AdHocOrchestrator(Orchestrator):
         # default to simply picking any available test
         return next(iter(to_run))
 
+    def should_hedge(self, info, /):  # noqa: ARG002, PLR6301
+        """
+        Return a boolean result whether a still running test should be
+        duplicated onto a spare set-up Remote, with the copy finishing first
+        (with exit code 0) being used, and the other one cancelled (and its
+        Remote released). A copy that fails doesn't cancel the other one,
+        whose result is used instead.
+
+        This is only asked once there are no more tests to start, and only
+        when a spare Remote is held (see `max_spares`), typically to avoid
+        a single unusually slow test keeping the whole run alive.
+
+        Results of the cancelled copy are ingested into `old_aggregator`,
+        if any, or discarded.
+
+        - `info` is AdHocOrchestrator.RunningInfo of the test.
+        """
+        # never hedge by default
+        return False
+
     def destructive(self, info, /):  # noqa: PLR6301
         """
         Return a boolean result whether a finished test was destructive
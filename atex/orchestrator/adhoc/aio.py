@@ -0,0 +1,53 @@
+import asyncio
+
+from ... import util
+from .adhoc import AdHocOrchestrator
+
+
+class AsyncAdHocOrchestrator(AdHocOrchestrator):
+    """
+    An AdHocOrchestrator running all tests as coroutines (via
+    `Executor.arun_test()`) on a single asyncio event loop in a background
+    thread, instead of one thread per running test.
+
+    This makes thousands of concurrently running tests feasible, provided
+    the Executor implements `.arun_test()` natively - others fall back
+    to running `.run_test()` in a thread (see `max_threads`).
+
+    Remote setup (`.run_setup()`) is also run from the event loop, but since
+    it is blocking, it runs in a thread (see `max_threads`).
+
+    Everything else (ingestion, release of Remotes) is unchanged, so consider
+    limiting it via `max_ingest_workers` and `max_release_workers`.
+
+    - `max_threads` is how many threads can be used at once for blocking
+      operations started from the event loop, see above. If None, the asyncio
+      default is used.
+
+    All other arguments are the same as for AdHocOrchestrator.
+    """
+
+    def __init__(self, *args, max_threads=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loop = util.EventLoopThread(
+            name=f"atex-asyncio-{self.platform}",
+            max_workers=max_threads,
+        )
+        self._test_queue = util.CoroutineJoinQueue(self._loop, notify=self._wakeup.set)
+        self._setup_queue = util.CoroutineJoinQueue(self._loop, notify=self._wakeup.set)
+
+    @staticmethod
+    async def _run_test(executor, test_name, artifacts):
+        return await executor.arun_test(test_name, artifacts)
+
+    async def _run_setup(self, info, restore, bake):
+        return await asyncio.to_thread(super()._run_setup, info, restore, bake)
+
+    def start(self):
+        self._loop.start()
+        super().start()
+
+    def stop(self):
+        super().stop()
+        # also cancels any setups still running
+        self._loop.stop()
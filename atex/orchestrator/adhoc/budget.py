@@ -0,0 +1,92 @@
+import os
+import threading
+from pathlib import Path
+
+
+class ArtifactBudget:
+    """
+    Limits the amount of test artifacts waiting for (or being) ingested by
+    an Aggregator, so that a slow Aggregator doesn't let them fill up the disk.
+
+    - `max_bytes` is the total size (in bytes) of all in-flight artifacts,
+      None for no limit.
+
+    - `max_count` is the number of in-flight artifact directories (finished
+      test executions), None for no limit.
+
+    While either limit is reached, AdHocOrchestrator doesn't start any new
+    tests, holding set-up Remotes idle until enough ingestions finish.
+    Tests already running may still finish and add to the in-flight artifacts,
+    and the size of artifacts is measured only once an ingestion worker picks
+    them up, so the limits are not exact.
+
+    Pass an instance as `artifacts_budget` to AdHocOrchestrator. Sharing one
+    instance between orchestrators (ie. via MultiPlatformOrchestrator kwargs)
+    limits them all together.
+    """
+
+    def __init__(self, *, max_bytes=None, max_count=None):
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+        # ingestion workers account for the sizes they measure
+        self._lock = threading.Lock()
+        # in-flight artifacts
+        self.bytes = 0
+        self.count = 0
+
+    def size(self, path):
+        """
+        Return the total size (in bytes) of files under the `path` directory,
+        or 0 if `max_bytes` is not limited (to avoid measuring it needlessly).
+        """
+        if self.max_bytes is None:
+            return 0
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += (Path(root) / name).lstat().st_size
+                except OSError:
+                    pass
+        return total
+
+    def add(self, size=0):
+        """
+        Account for one artifacts directory of `size` bytes being ingested.
+        """
+        with self._lock:
+            self.count += 1
+            self.bytes += size
+
+    def remove(self, size=0):
+        """
+        Account for one artifacts directory of `size` bytes no longer
+        being in-flight (ingested and cleaned up).
+        """
+        with self._lock:
+            self.count -= 1
+            self.bytes -= size
+
+    def resize(self, delta):
+        """
+        Account for `delta` bytes more (or less, if negative) of an already
+        added artifacts directory, ie. once its size was measured.
+        """
+        with self._lock:
+            self.bytes += delta
+
+    def exceeded(self):
+        """
+        Return True if any limit is reached.
+        """
+        return (
+            (self.max_count is not None and self.count >= self.max_count) or
+            (self.max_bytes is not None and self.bytes >= self.max_bytes)
+        )
+
+    def __str__(self):
+        class_name = self.__class__.__name__
+        return (
+            f"{class_name}({self.count}/{self.max_count} artifacts, "
+            f"{self.bytes}/{self.max_bytes} bytes)"
+        )
@@ -0,0 +1,149 @@
+import collections
+import json
+from pathlib import Path
+
+from ... import util
+
+_get_logger = util.get_loggers("atex.orchestrator.adhoc.health")
+
+
+class RemoteHealth:
+    """
+    Tracks the health of every Remote an AdHocOrchestrator runs tests on,
+    telling it to release (quarantine) a Remote that seems broken, ie. due to
+    a bad disk or network, before it fails many more tests.
+
+    A Remote is quarantined once
+
+    - `max_failures` tests in a row failed on it (non-zero exit code or
+      an exception), as far as `.destructive()` kept it in use,
+
+    - `max_infra` tests (in total) reported an `infra` result on it,
+
+    - a test reconnected to it more than `max_reconnects` times, as counted
+      by the Executor (ie. FMFExecutor) in its `reconnects` attribute,
+
+    - `max_slow` tests in a row took more than `max_latency` seconds to run
+      a short command on it, as measured by the Executor (ie. FMFExecutor)
+      in its `command_latency` attribute.
+
+    Any of these can be None to disable the check.
+
+    Pass an instance as `health` to AdHocOrchestrator, see also `.stats()`.
+    """
+
+    def __init__(
+        self, *, max_failures=3, max_infra=2, max_reconnects=None, max_latency=None,
+        max_slow=2,
+    ):
+        self.logger = _get_logger()
+
+        self.max_failures = max_failures
+        self.max_infra = max_infra
+        self.max_reconnects = max_reconnects
+        self.max_latency = max_latency
+        self.max_slow = max_slow
+
+        # per-Remote counters, indexed by the Remote
+        self._remotes = {}
+        # cumulative counters, indexed by Provisioner class name
+        self._stats = collections.defaultdict(collections.Counter)
+
+    @staticmethod
+    def _count_infra(info):
+        """
+        Return how many `infra` results a finished test reported.
+        """
+        if not info.artifacts:
+            return 0
+        results = Path(info.artifacts.name) / "results"
+        count = 0
+        try:
+            with open(results) as f:
+                for line in f:
+                    try:
+                        if json.loads(line).get("status") == "infra":
+                            count += 1
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return count
+
+    def record(self, info):
+        """
+        Account for a finished test, `info` being AdHocOrchestrator.FinishedInfo
+        (with its artifacts not yet cleaned up).
+
+        Returns a string describing why the Remote of the test should be
+        quarantined, or None if it seems healthy.
+        """
+        remote = self._remotes.setdefault(info.remote, collections.Counter())
+        stats = self._stats[type(info.provisioner).__name__]
+        stats["tests"] += 1
+
+        if info.exception or info.exit_code != 0:
+            remote["failures"] += 1
+            stats["failures"] += 1
+        else:
+            remote["failures"] = 0
+
+        infra = self._count_infra(info)
+        remote["infra"] += infra
+        stats["infra"] += infra
+
+        reconnects = getattr(info.executor, "reconnects", 0)
+        stats["reconnects"] += reconnects
+
+        latency = getattr(info.executor, "command_latency", None)
+        if latency is not None:
+            stats["latency_count"] += 1
+            stats["latency_total"] += latency
+            if self.max_latency is not None and latency > self.max_latency:
+                remote["slow"] += 1
+            else:
+                remote["slow"] = 0
+
+        if self.max_failures is not None and remote["failures"] >= self.max_failures:
+            reason = f"{remote['failures']} tests failed in a row"
+        elif self.max_infra is not None and remote["infra"] >= self.max_infra:
+            reason = f"{remote['infra']} infra results"
+        elif self.max_reconnects is not None and reconnects > self.max_reconnects:
+            reason = f"{reconnects} reconnects during '{info.test_name}'"
+        elif self.max_slow is not None and remote["slow"] >= self.max_slow:
+            reason = f"commands took over {self.max_latency}s in {remote['slow']} tests in a row"
+        else:
+            return None
+
+        stats["quarantined"] += 1
+        self.logger.debug(f"{info.remote} is unhealthy: {reason}")
+        return reason
+
+    def forget(self, remote):
+        """
+        Drop any state kept for a `remote` that is no longer used.
+        """
+        self._remotes.pop(remote, None)
+
+    def stats(self):
+        """
+        Return a dict of Provisioner class names to dicts of cumulative
+        statistics of Remotes provided by them, ie.
+
+            {"LocalProvisioner": {"tests": 10, "failures": 2, "infra": 0,
+             "reconnects": 0, "quarantined": 1, "latency": 0.05}}
+
+        with `latency` being the average `command_latency` (or None).
+        """
+        result = {}
+        for provisioner, stats in self._stats.items():
+            count = stats["latency_count"]
+            result[provisioner] = {
+                "tests": stats["tests"],
+                "failures": stats["failures"],
+                "infra": stats["infra"],
+                "reconnects": stats["reconnects"],
+                "quarantined": stats["quarantined"],
+                "latency": stats["latency_total"] / count if count else None,
+            }
+        return result
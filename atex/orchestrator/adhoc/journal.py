@@ -0,0 +1,153 @@
+import collections
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from ... import util
+
+_get_logger = util.get_loggers("atex.orchestrator.adhoc.journal")
+
+
+class RunJournal:
+    """
+    An append-only record of AdHocOrchestrator progress, stored as JSON Lines,
+    one event per line, ie.
+
+        {"time": 1767225600.1, "platform": "9.6", "event": "start", "test": "/a"}
+
+    The events recorded are
+
+    - `start` when a test starts running on a Remote,
+    - `finish` when it finishes (with `exit_code`, null on exception),
+    - `rerun` when a finished test is put back to be re-run,
+    - `ingested` when its final results were ingested into the Aggregator.
+
+    Every line is flushed to the OS right away (surviving a crash of the Python
+    process), but is only `fsync()`ed to the disk in batches (surviving an OS
+    crash), to avoid slowing down short tests.
+
+    - `path` is a string/Path to the journal file.
+
+    - `resume`, if True, allows `path` to already exist (from a previous
+      interrupted run), reading it on `.start()` and appending to it,
+      after removing any incomplete last line. See `.ingested()`.
+
+    - `sync_every` is how many events may be written without an fsync.
+
+    - `sync_interval` is how many seconds may pass since the last fsync
+      before a newly written event triggers another fsync.
+
+    One RunJournal may be shared by several AdHocOrchestrator instances,
+    as long as they use a unique `platform` each.
+    """
+
+    def __init__(self, path, *, resume=False, sync_every=100, sync_interval=5):
+        self._lock = threading.RLock()
+        self.logger = _get_logger()
+
+        self.path = Path(path)
+        self.resume = resume
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+
+        self._fobj = None
+        self._unsynced = 0
+        self._last_sync = 0
+        # test names ingested in a previous run, per platform
+        self._ingested = collections.defaultdict(set)
+
+    def _load(self):
+        # end of the last complete (newline-terminated) line
+        complete = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                complete += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    self.logger.warning(f"skipping corrupted line in {self.path}")
+                    continue
+                platform = record["platform"]
+                test_name = record["test"]
+                if record["event"] == "ingested":
+                    self._ingested[platform].add(test_name)
+        # cut off a truncated last line from a crash, so that a new record
+        # appended after it isn't merged with it (and lost on next resume)
+        if complete < self.path.stat().st_size:
+            self.logger.warning(f"truncating incomplete last line in {self.path}")
+            os.truncate(self.path, complete)
+
+    def start(self):
+        self.logger.debug(f"starting: {self}")
+
+        with self._lock:
+            if self.path.exists(follow_symlinks=False):
+                if not self.resume:
+                    raise FileExistsError(f"{self.path} already exists")
+                self._load()
+            # line-buffered, every record is one line
+            self._fobj = open(self.path, "a", buffering=1)
+            self._last_sync = time.monotonic()
+
+    def stop(self):
+        self.logger.debug(f"stopping: {self}")
+
+        with self._lock:
+            if self._fobj:
+                self._sync()
+                self._fobj.close()
+                self._fobj = None
+
+    def _sync(self):
+        self._fobj.flush()
+        os.fsync(self._fobj.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def record(self, platform, event, test_name, **extra):
+        """
+        Append one `event` (string) about `test_name` under `platform`,
+        with any `extra` JSON-serializable keys.
+        """
+        record = {
+            "time": time.time(),
+            "platform": platform,
+            "event": event,
+            "test": test_name,
+            **extra,
+        }
+        line = json.dumps(record, indent=None) + "\n"
+        with self._lock:
+            self._fobj.write(line)
+            self._unsynced += 1
+            if (
+                self._unsynced >= self.sync_every
+                or time.monotonic() - self._last_sync >= self.sync_interval
+            ):
+                self._sync()
+
+    def ingested(self, platform):
+        """
+        Return a set of test names whose results were already ingested
+        for `platform` during a previous (resumed) run.
+        """
+        return frozenset(self._ingested[platform])
+
+    def __enter__(self):
+        try:
+            self.start()
+            return self
+        except BaseException:
+            self.stop()
+            raise
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def __str__(self):
+        class_name = self.__class__.__name__
+        return f"{class_name}({self.path})"
@@ -0,0 +1,280 @@
+import bisect
+import collections
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from ... import util
+
+_get_logger = util.get_loggers("atex.orchestrator.adhoc.metrics")
+
+
+class Histogram:
+    """
+    Counts of observed durations (in seconds), bucketed by upper bounds,
+    like a Prometheus histogram.
+
+    - `bounds` is an ascending sequence of bucket upper bounds, an implicit
+      infinite bucket is always added at the end.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        # non-cumulative, last one is the +Inf bucket
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other):
+        """
+        Add all observations of `other` (with the same `bounds`) to this one.
+        """
+        if other.bounds != self.bounds:
+            raise ValueError("cannot merge histograms with different bounds")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts, strict=True)]
+        self.count += other.count
+        self.sum += other.sum
+
+    def cumulative(self):
+        """
+        Yield `(upper_bound, count)` tuples of all buckets, with counts
+        of observations less or equal to `upper_bound`, ending with `math.inf`.
+        """
+        total = 0
+        for bound, count in zip((*self.bounds, math.inf), self.counts, strict=True):
+            total += count
+            yield (bound, total)
+
+    def quantile(self, q):
+        """
+        Return the upper bound of the bucket containing the `q` quantile
+        (0 to 1) of observations, or None if there are none.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return math.inf
+
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def __str__(self):
+        class_name = self.__class__.__name__
+        return f"{class_name}(count={self.count}, sum={self.sum:.1f})"
+
+
+class RunMetrics:
+    """
+    Timing of individual phases of an AdHocOrchestrator run, per platform
+    and Provisioner (class name), being
+
+    - `provision` - waiting for a Provisioner to deliver a requested Remote,
+    - `setup` - running `.run_setup()` on a new Remote,
+    - `test` - running a test (with `test` and `exit_code` keys),
+    - `ingest` - a finished test waiting for (and being) ingested,
+    - `release` - releasing a no longer needed Remote,
+    - `stall` - a set-up Remote held idle, ie. by an exceeded ArtifactBudget.
+
+    Each observed phase is written as one line of a JSON Lines event stream,
+    ie.
+
+        {"time": 1767225600.1, "phase": "setup", "duration": 41.2,
+         "platform": "9.6", "provisioner": "TestingFarmProvisioner"}
+
+    and aggregated into a Histogram, queryable at runtime via `.histogram()`.
+
+    Also tracked are gauges, currently `ingest_backlog`, the amount of
+    finished tests waiting for (or being) ingested, and `artifacts_bytes`,
+    the size of their artifacts (if measured by an ArtifactBudget),
+    see `.gauge()`.
+
+    - `path` is a string/Path to the JSON Lines event file (appended to),
+      or None to only aggregate the histograms.
+
+    - `prometheus` is a string/Path to a file to periodically (atomically)
+      write all histograms and gauges to, in the Prometheus text-based format,
+      ie. for the node_exporter textfile collector. If None, nothing is
+      written, see `.export_prometheus()` for doing so manually.
+
+    - `export_interval` is how often (in seconds) to re-write `prometheus`.
+
+    - `buckets` are the histogram bucket upper bounds (in seconds).
+
+    One RunMetrics may be shared by several AdHocOrchestrator instances.
+    """
+
+    default_buckets = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400)
+
+    def __init__(
+        self, path=None, *, prometheus=None, export_interval=15, buckets=default_buckets,
+    ):
+        self._lock = threading.RLock()
+        self.logger = _get_logger()
+
+        self.path = Path(path) if path else None
+        self.prometheus = Path(prometheus) if prometheus else None
+        self.export_interval = export_interval
+        self.buckets = tuple(buckets)
+
+        self._fobj = None
+        self._last_export = -math.inf
+        # indexed by (phase, platform, provisioner)
+        self._histograms = {}
+        # indexed by name, then by a sorted tuple of label items
+        self._gauges = collections.defaultdict(lambda: collections.defaultdict(int))
+
+    def start(self):
+        self.logger.debug(f"starting: {self}")
+
+        with self._lock:
+            if self.path:
+                # line-buffered, every event is one line
+                self._fobj = open(self.path, "a", buffering=1)
+
+    def stop(self):
+        self.logger.debug(f"stopping: {self}")
+
+        with self._lock:
+            if self._fobj:
+                self._fobj.close()
+                self._fobj = None
+            if self.prometheus:
+                self.export_prometheus()
+
+    def record(self, phase, duration, *, platform, provisioner, **extra):
+        """
+        Record one `phase` (string) that took `duration` seconds,
+        with any `extra` JSON-serializable keys added to the event.
+        """
+        key = (phase, platform, provisioner)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(self.buckets)
+            self._histograms[key].observe(duration)
+
+            if self._fobj:
+                event = {
+                    "time": time.time(),
+                    "phase": phase,
+                    "duration": duration,
+                    "platform": platform,
+                    "provisioner": provisioner,
+                    **extra,
+                }
+                self._fobj.write(json.dumps(event, indent=None) + "\n")
+
+            self._maybe_export()
+
+    def adjust(self, name, delta, **labels):
+        """
+        Add `delta` to a gauge `name` with `labels`.
+        """
+        with self._lock:
+            self._gauges[name][tuple(sorted(labels.items()))] += delta
+
+    def gauge(self, name, **labels):
+        """
+        Return the current value of gauge `name`, summed across all label
+        sets matching `labels`.
+        """
+        with self._lock:
+            return sum(
+                value for key, value in self._gauges[name].items()
+                if labels.items() <= dict(key).items()
+            )
+
+    def histogram(self, phase, *, platform=None, provisioner=None):
+        """
+        Return a Histogram of `phase` durations, merged across all platforms
+        and Provisioners, unless limited to a `platform` and/or `provisioner`.
+        """
+        merged = Histogram(self.buckets)
+        with self._lock:
+            for (h_phase, h_platform, h_provisioner), hist in self._histograms.items():
+                if (
+                    h_phase == phase
+                    and platform in (None, h_platform)
+                    and provisioner in (None, h_provisioner)
+                ):
+                    merged.merge(hist)
+        return merged
+
+    @staticmethod
+    def _format_labels(labels):
+        def escape(value):
+            value = str(value)
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        inner = ",".join(f'{k}="{escape(v)}"' for k, v in labels)
+        return f"{{{inner}}}"
+
+    def _prometheus_lines(self):
+        yield "# HELP atex_phase_duration_seconds Duration of orchestration phases."
+        yield "# TYPE atex_phase_duration_seconds histogram"
+        for (phase, platform, provisioner), hist in sorted(self._histograms.items()):
+            labels = (("phase", phase), ("platform", platform), ("provisioner", provisioner))
+            for bound, total in hist.cumulative():
+                le = "+Inf" if bound == math.inf else str(bound)
+                bucket_labels = self._format_labels((*labels, ("le", le)))
+                yield f"atex_phase_duration_seconds_bucket{bucket_labels} {total}"
+            yield f"atex_phase_duration_seconds_sum{self._format_labels(labels)} {hist.sum}"
+            yield f"atex_phase_duration_seconds_count{self._format_labels(labels)} {hist.count}"
+        for name, values in sorted(self._gauges.items()):
+            yield f"# TYPE atex_{name} gauge"
+            for labels, value in sorted(values.items()):
+                yield f"atex_{name}{self._format_labels(labels)} {value}"
+
+    def export_prometheus(self, path=None):
+        """
+        Atomically write all histograms and gauges to `path` (or `prometheus`
+        if None), in the Prometheus text-based exposition format.
+        """
+        path = Path(path) if path else self.prometheus
+        with self._lock:
+            lines = list(self._prometheus_lines())
+            self._last_export = time.monotonic()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+        try:
+            # mkstemp() creates it as 0600, readable only by us
+            os.fchmod(fd, 0o644)
+            with os.fdopen(fd, "w") as f:
+                f.writelines(f"{line}\n" for line in lines)
+            Path(tmp_path).replace(path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    def _maybe_export(self):
+        if (
+            self.prometheus
+            and time.monotonic() - self._last_export >= self.export_interval
+        ):
+            self.export_prometheus()
+
+    def __enter__(self):
+        try:
+            self.start()
+            return self
+        except BaseException:
+            self.stop()
+            raise
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def __str__(self):
+        class_name = self.__class__.__name__
+        return f"{class_name}({self.path}, {self.prometheus})"
@@ -1,4 +1,76 @@
-from ...executor.fmf.metadata import duration_to_seconds, listlike
+import heapq
+import itertools
+import time
+import weakref
+
+from ...executor.fmf.metadata import duration_to_seconds, listlike, test_pkg_requires
+
+
+class _TestIndex:
+    """
+    A max-heap of test names, ordered by a sort key, for picking the best test
+    to run next without scanning all the remaining tests.
+
+    - `key` is a callable returning the sort key of a test name, or None
+      for names never to be returned by `.best()`. It is called only once
+      for any name, on first sight.
+
+    - `order` is an iterable of test names to be initially indexed, ties
+      between equal keys are broken by this order.
+
+    Names are removed lazily, as they are found to no longer be queued
+    to run, so any re-added names (ie. re-runs, or tests becoming pending
+    in a WorkQueue) need to be `.push()`ed again.
+    """
+
+    def __init__(self, key, order):
+        self._key = key
+        self._keys = {}
+        self._counter = itertools.count()
+        self._heap = [
+            (-key, next(self._counter), name) for name in order
+            if (key := self.key(name)) is not None
+        ]
+        heapq.heapify(self._heap)
+
+    def key(self, name):
+        """
+        Return the (cached) sort key of `name`, or None if it has none.
+        """
+        try:
+            return self._keys[name]
+        except KeyError:
+            key = self._keys[name] = self._key(name)
+            return key
+
+    def push(self, name):
+        if (key := self.key(name)) is not None:
+            heapq.heappush(self._heap, (-key, next(self._counter), name))
+
+    def best(self, to_run, queued):
+        """
+        Return a test name from `to_run` with the highest key, or None if
+        there are no indexed names in `to_run`.
+
+        - `queued` is a container of all names still queued to run,
+          `to_run` is typically the same, but may be a subset of it.
+        """
+        heap = self._heap
+        while heap:
+            name = heap[0][2]
+            if name not in queued:
+                heapq.heappop(heap)
+            elif name in to_run:
+                return name
+            else:
+                break
+        else:
+            return None
+        # 'to_run' is a subset of the queued tests (ie. filtered by another
+        # mixin), fall back to a full scan, but with cached keys
+        keyed = ((key, name) for name in to_run if (key := self.key(name)) is not None)
+        best = max(keyed, key=lambda item: item[0], default=None)
+        return None if best is None else best[1]
 
 
 def LimitedRerunsMixin(reruns, cond=lambda code: code != 0):  # noqa: N802
@@ -37,14 +109,22 @@ def FMFDurationMixin(fmf_tests):  # noqa: N802
 
     - `fmf_tests` is a class FMFTests instance with all tests.
     """
+    def test_duration(name):
+        # only index tests with 'duration' explicitly set
+        data = fmf_tests.data[name]
+        return duration_to_seconds(data["duration"]) if "duration" in data else None
+
     class FMFDurationMixin:
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._duration_index = _TestIndex(test_duration, self._to_run)
+
+        def _requeue_test(self, test_name):
+            super()._requeue_test(test_name)
+            self._duration_index.push(test_name)
+
         def next_test(self, to_run, previous, /):
-            # only pick tests with 'duration' explicitly set
-            best = max(
-                (name for name in to_run if "duration" in fmf_tests.data[name]),
-                key=lambda name: duration_to_seconds(fmf_tests.data[name]["duration"]),
-                default=None,
-            )
+            best = self._duration_index.best(to_run, self._to_run)
             if best is not None:
                 return best
 
@@ -65,15 +145,23 @@ def FMFPriorityMixin(fmf_tests):  # noqa: N802
     - `fmf_tests` is a class FMFTests instance with all tests.
     """
     class FMFPriorityMixin:
-        def next_test(self, to_run, previous, /):
-            def priority(name):
-                return fmf_tests.data[name].get("extra-priority", 0)
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._priority_index = _TestIndex(
+                lambda name: fmf_tests.data[name].get("extra-priority", 0),
+                self._to_run,
+            )
 
+        def _requeue_test(self, test_name):
+            super()._requeue_test(test_name)
+            self._priority_index.push(test_name)
+
+        def next_test(self, to_run, previous, /):
             # this will be >0 if there are higher-than-0 priority tests,
             # and <0 if there are no 0-priority tests left
             # - in either case, we want the highest priority
-            best = max(to_run, key=priority)
-            if priority(best) != 0:
+            best = self._priority_index.best(to_run, self._to_run)
+            if best is not None and self._priority_index.key(best) != 0:
                 return best
 
             # only tests with 0 priority left (or with it unspecified),
@@ -83,6 +171,73 @@ def FMFPriorityMixin(fmf_tests):  # noqa: N802
     return FMFPriorityMixin
 
 
+def HistoricalRuntimeMixin(runtimes):  # noqa: N802
+    """
+    Return a mixin class that overrides next_test() to run tests in the order
+    of their longest observed (median) runtime first, as recorded for the same
+    platform by previous runs, also known as LPT scheduling.
+
+    Note that this skips over tests with no recorded runtime, passing them
+    to the next mixin (or base class).
+
+    - `runtimes` is a started class RuntimeStore instance, typically also
+      passed to the orchestrator as `runtimes` to record new runtimes.
+      The runtime of any test is looked up only once, when first queued.
+    """
+    class HistoricalRuntimeMixin:
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._runtime_index = _TestIndex(
+                lambda name: runtimes.median(self.platform, name),
+                self._to_run,
+            )
+
+        def _requeue_test(self, test_name):
+            super()._requeue_test(test_name)
+            self._runtime_index.push(test_name)
+
+        def next_test(self, to_run, previous, /):
+            best = self._runtime_index.best(to_run, self._to_run)
+            if best is not None:
+                return best
+
+            # pass on any tests without a known runtime
+            return super().next_test(to_run, previous)
+
+    return HistoricalRuntimeMixin
+
+
+def HedgingMixin(runtimes, factor=3, min_elapsed=300):  # noqa: N802
+    """
+    Return a mixin class that overrides should_hedge() to duplicate tests
+    running much longer than their median runtime, as recorded for the same
+    platform by previous runs.
+
+    Note that this needs spare set-up Remotes to hedge onto, so it is useful
+    only with `max_spares` above 0.
+
+    - `runtimes` is a started class RuntimeStore instance, typically also
+      passed to the orchestrator as `runtimes` to record new runtimes.
+
+    - `factor` is how many times longer than its median runtime a test needs
+      to be running before it is hedged.
+
+    - `min_elapsed` is the minimum time (in seconds) a test needs to be running
+      before it is hedged, to avoid hedging short tests running just a bit
+      slower than usual.
+    """
+    class HedgingMixin:
+        def should_hedge(self, info, /):
+            median = runtimes.median(self.platform, info.test_name)
+            if median is not None:
+                elapsed = time.monotonic() - info.started
+                if elapsed >= max(median * factor, min_elapsed):
+                    return True
+            return super().should_hedge(info)
+
+    return HedgingMixin
+
+
 def FMFDestructiveMixin(fmf_tests):  # noqa: N802
     """
     Return a mixin class that checks tests for a 'destructive' tag in the test
@@ -99,3 +254,81 @@ def FMFDestructiveMixin(fmf_tests):  # noqa: N802
             return super().destructive(info)
 
     return FMFDestructiveMixin
+
+
+def FMFPackageAffinityMixin(fmf_tests, min_satisfied=0.5):  # noqa: N802
+    """
+    Return a mixin class that overrides next_test() to prefer tests whose
+    required/recommended RPM packages are already installed on the Remote,
+    by the plan 'prepare' or by tests previously run on that Remote,
+    minimizing the number of package installations.
+
+    The best-satisfied tests are passed as `to_run` to the next mixin
+    (or base class), so it picks from them using its own ordering.
+    If no test is satisfied at least by `min_satisfied`, all tests are passed.
+
+    Note that tests requiring no packages are never preferred, as they can
+    run equally well on any Remote.
+
+    - `fmf_tests` is a class FMFTests instance with all tests.
+
+    - `min_satisfied` is a fraction (0 to 1) of a test's packages that need
+      to be installed on a Remote for the test to be preferred.
+    """
+    plan_pkgs = set()
+    for entry in listlike(fmf_tests.plan, "prepare"):
+        if entry.get("how") == "install":
+            plan_pkgs.update(listlike(entry, "package"))
+
+    def test_pkgs(name):
+        data = fmf_tests.data[name]
+        return frozenset((*test_pkg_requires(data), *test_pkg_requires(data, "recommend")))
+
+    class FMFPackageAffinityMixin:
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            # tests grouped by their (non-empty) package sets, as dicts
+            # to preserve test order
+            self._pkg_groups = {}
+            for name in self._to_run:
+                if pkgs := test_pkgs(name):
+                    self._pkg_groups.setdefault(pkgs, {})[name] = None
+            # packages likely installed on Remotes, deleted with the Remotes
+            self._remote_pkgs = weakref.WeakKeyDictionary()
+
+        def _requeue_test(self, test_name):
+            super()._requeue_test(test_name)
+            if pkgs := test_pkgs(test_name):
+                self._pkg_groups.setdefault(pkgs, {})[test_name] = None
+
+        def next_test(self, to_run, previous, /):
+            installed = self._remote_pkgs.setdefault(previous.remote, set(plan_pkgs))
+            if isinstance(previous, self.FinishedInfo):
+                installed.update(test_pkgs(previous.test_name))
+
+            best_ratio = min_satisfied
+            best = []
+            for pkgs, names in tuple(self._pkg_groups.items()):
+                ratio = len(pkgs & installed) / len(pkgs)
+                if ratio == 0 or ratio < best_ratio:
+                    continue
+                # lazily prune tests that are no longer queued
+                for name in [n for n in names if n not in self._to_run]:
+                    del names[name]
+                if not names:
+                    del self._pkg_groups[pkgs]
+                    continue
+                candidates = [n for n in names if n in to_run]
+                if not candidates:
+                    continue
+                if ratio > best_ratio:
+                    best_ratio = ratio
+                    best = candidates
+                else:
+                    best += candidates
+
+            if best:
+                return super().next_test(best, previous)
+            return super().next_test(to_run, previous)
+
+    return FMFPackageAffinityMixin
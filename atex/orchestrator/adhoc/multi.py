@@ -0,0 +1,136 @@
+import math
+import threading
+
+from ... import util
+from .. import Orchestrator
+from .adhoc import AdHocOrchestrator
+from .provisioning import ProvisioningController
+
+_get_logger = util.get_loggers("atex.orchestrator.adhoc.multi")
+
+
+class MultiPlatformOrchestrator(Orchestrator):
+    """
+    Runs tests for multiple platforms in one process, via one AdHocOrchestrator
+    (or a subclass) per platform, sharing a single serving loop, a single pool
+    of ingesting threads and a single Aggregator.
+
+    - `platforms` is a dict of platform names to `(tests, provisioners,
+      executor)` tuples, see AdHocOrchestrator for their meaning.
+
+    - `aggregator` is an initialized and started Aggregator instance,
+      shared by all platforms.
+
+    - `orchestrator` is an AdHocOrchestrator class (or a subclass of it, ie.
+      with mixins) to instantiate for each platform.
+
+    - `max_running` is how many tests can run at once across all platforms.
+      If None, there is no limit (besides the amount of Remotes provided).
+
+      Each platform with tests left is guaranteed an equal share of these,
+      and may only use more if no other platform is waiting for a share.
+
+    - `max_ingest_workers` is how many ingestions can run at once, across
+      all platforms. If None, there is no limit.
+
+    - `provisioning` is a factory (function or class) producing a new
+      ProvisioningController instance (see AdHocOrchestrator), called without
+      arguments for each platform, ie. `ProvisioningController` itself or
+      a `functools.partial()` of it. A controller tracks the state of one
+      orchestrator, so one instance cannot be shared by all platforms, and
+      its `max_remotes` limit applies to each platform separately.
+
+    - `kwargs` are passed to each per-platform orchestrator.
+    """
+
+    def __init__(
+        self, platforms, aggregator, *, orchestrator=AdHocOrchestrator,
+        max_running=None, max_ingest_workers=None, provisioning=None, **kwargs,
+    ):
+        self.logger = _get_logger()
+
+        if not platforms:
+            raise ValueError("no platforms were passed, 'platforms' is empty")
+
+        if isinstance(provisioning, ProvisioningController):
+            raise TypeError(
+                "'provisioning' needs to be a factory, a ProvisioningController instance "
+                "cannot be shared by all platforms",
+            )
+
+        self.aggregator = aggregator
+        self.max_running = max_running
+
+        self._wakeup = threading.Event()
+        self._ingest_queue = AdHocOrchestrator._make_queue(
+            max_ingest_workers, daemon=False, notify=self._wakeup.set,
+        )
+
+        self.orchestrators = {}
+        for platform, (tests, provisioners, executor) in platforms.items():
+            if provisioning:
+                kwargs["provisioning"] = provisioning()
+            o = orchestrator(platform, tests, provisioners, executor, aggregator, **kwargs)
+            o._attach(self._wakeup, self._ingest_queue, self._can_start_test)
+            self.orchestrators[platform] = o
+
+        # orchestrators still having tests to run, or running
+        self._serving = list(self.orchestrators.values())
+
+    def _can_start_test(self, orchestrator):
+        if self.max_running is None:
+            return True
+
+        running = sum(len(o._running_tests) for o in self._serving)
+        if running >= self.max_running:
+            return False
+
+        share = math.ceil(self.max_running / len(self._serving))
+        if len(orchestrator._running_tests) < share:
+            return True
+
+        # over its share, start only if no other orchestrator below its share
+        # has idle Remotes waiting for a free slot
+        return not any(
+            o._idle and len(o._running_tests) < share
+            for o in self._serving if o is not orchestrator
+        )
+
+    def serve_once(self):
+        # clear once for all the orchestrators sharing the Event
+        self._wakeup.clear()
+        self._serving = [o for o in self._serving if o.serve_once()]
+        # an orchestrator served earlier could not start a test on its idle
+        # Remote, but one served later freed up a slot, so come back right away
+        if any(o._idle and o._to_run and o._can_start_test() for o in self._serving):
+            self._wakeup.set()
+        return bool(self._serving)
+
+    def wait_for_work(self):
+        self._wakeup.wait(min(o._wait_timeout() for o in self._serving))
+
+    def start(self):
+        self.logger.debug(f"starting: {self}")
+        for o in self.orchestrators.values():
+            o.start()
+
+    def stop(self):
+        self.logger.debug(f"stopping: {self}")
+        # try to stop all, even if some fail
+        exception = None
+        for o in self.orchestrators.values():
+            try:
+                o.stop()
+            except Exception as e:
+                exception = exception or e
+        if exception:
+            raise exception
+
+    def __str__(self):
+        class_name = self.__class__.__name__
+        running = sum(len(o._running_tests) for o in self.orchestrators.values())
+        queued = sum(len(o._to_run) for o in self.orchestrators.values())
+        return (
+            f"{class_name}({len(self._serving)}/{len(self.orchestrators)} platforms, "
+            f"{queued} queued, {running} running)"
+        )
@@ -0,0 +1,211 @@
+import collections
+import math
+import time
+
+from ... import util
+
+_get_logger = util.get_loggers("atex.orchestrator.adhoc.provisioning")
+
+
+class ProvisioningController:
+    """
+    Decides how many Remotes an AdHocOrchestrator should request from its
+    Provisioners, based on the remaining work, instead of requesting as many
+    Remotes as there are tests from every Provisioner.
+
+    The target amount of Remotes is
+
+        running + min(queued, ceil(work / (remote_runtime + time_to_remote)))
+        + max_spares
+
+    clamped to `max_remotes`, where `work` is the sum of expected runtimes
+    of all queued tests and `time_to_remote` is how long it took the fastest
+    Provisioner to deliver a Remote recently. In other words, non-destructive
+    tests re-use Remotes, so a Remote is expected to take on `remote_runtime`
+    seconds of the work, and any work done while waiting for a new Remote
+    to be delivered is work it won't need to do.
+
+    Any missing Remotes are requested incrementally via `.provision(n)`,
+    preferring Provisioners that deliver faster and have fewer outstanding
+    requests. Excess outstanding requests are cancelled via `.clear()` of
+    Provisioners whose outstanding requests are all in excess (slowest first),
+    at most once per `scale_down_interval`. Nothing is re-requested, so any
+    remaining excess Remotes are delivered and released when not needed.
+
+    - `max_remotes` is the maximum amount of Remotes (in use or requested)
+      across all Provisioners, or None for no limit.
+
+    - `runtimes` is a started RuntimeStore instance to get expected test
+      runtimes from, or None to use `default_runtime` for all tests.
+
+    - `default_runtime` is the expected runtime (in seconds) of a test with
+      no known runtime.
+
+    - `remote_runtime` is how much work (in seconds of test runtime) a Remote
+      is expected to run before it is destroyed (or the work runs out).
+      Lower it for mostly destructive tests, 0 requests a Remote for every
+      `time_to_remote` seconds of work.
+
+    - `default_time_to_remote` is the assumed time (in seconds) it takes
+      a Provisioner to deliver a Remote, before it delivers the first one.
+
+    - `smoothing` is the weight (0 to 1) of a new time-to-remote observation
+      in its exponential moving average.
+
+    - `update_interval` is how often (in seconds) to re-evaluate the target
+      amount of Remotes, unless forced by an event (ie. a destroyed Remote).
+
+    - `scale_down_interval` is the minimum time (in seconds) between
+      cancelling excess requests.
+    """
+
+    def __init__(
+        self, *, max_remotes=None, runtimes=None, default_runtime=600,
+        remote_runtime=3600, default_time_to_remote=60, smoothing=0.3,
+        update_interval=1, scale_down_interval=60,
+    ):
+        self.logger = _get_logger()
+
+        self.max_remotes = max_remotes
+        self.runtimes = runtimes
+        self.default_runtime = default_runtime
+        self.remote_runtime = remote_runtime
+        self.default_time_to_remote = default_time_to_remote
+        self.smoothing = smoothing
+        self.update_interval = update_interval
+        self.scale_down_interval = scale_down_interval
+
+        # outstanding (not yet delivered) requests per Provisioner,
+        # as a FIFO of [time.monotonic(), count] pairs
+        self._requests = collections.defaultdict(collections.deque)
+        # moving average of time-to-remote per Provisioner
+        self._time_to_remote = {}
+        self._last_update = -math.inf
+        self._last_scale_down = -math.inf
+
+    def outstanding(self, provisioner):
+        """
+        Return how many Remotes were requested from `provisioner`,
+        but not yet delivered.
+        """
+        return sum(count for _, count in self._requests[provisioner])
+
+    def time_to_remote(self, provisioner):
+        """
+        Return the (estimated) time it takes `provisioner` to deliver a Remote.
+        """
+        return self._time_to_remote.get(provisioner, self.default_time_to_remote)
+
+    def remote_received(self, provisioner):
+        """
+        Account for a new Remote delivered by `provisioner`.
+
+        Return how long (in seconds) the Remote was waited for, or None
+        if it was not requested by this controller.
+        """
+        requests = self._requests[provisioner]
+        if not requests:
+            # delivered after .clear(), or without being asked
+            return None
+        requested, _ = requests[0]
+        requests[0][1] -= 1
+        if requests[0][1] <= 0:
+            requests.popleft()
+
+        elapsed = time.monotonic() - requested
+        if provisioner in self._time_to_remote:
+            old = self._time_to_remote[provisioner]
+            self._time_to_remote[provisioner] = (
+                self.smoothing * elapsed + (1 - self.smoothing) * old
+            )
+        else:
+            self._time_to_remote[provisioner] = elapsed
+        return elapsed
+
+    def _expected_work(self, orchestrator):
+        if self.runtimes is None:
+            return len(orchestrator._to_run) * self.default_runtime
+        work = 0
+        for name in orchestrator._to_run:
+            runtime = self.runtimes.median(orchestrator.platform, name)
+            work += self.default_runtime if runtime is None else runtime
+        return work
+
+    def target(self, orchestrator):
+        """
+        Return the amount of Remotes `orchestrator` should have (in use,
+        being set up, or requested).
+        """
+        running = len(orchestrator._running_tests)
+        queued = len(orchestrator._to_run)
+        if queued == 0:
+            return running
+
+        fastest = min(self.time_to_remote(p) for p in orchestrator.provisioners)
+        per_remote = max(self.remote_runtime + fastest, 0.001)
+        useful = math.ceil(self._expected_work(orchestrator) / per_remote)
+        target = running + min(queued, useful) + orchestrator.max_spares
+        if self.max_remotes is not None:
+            target = min(target, self.max_remotes)
+        return target
+
+    def _provision(self, provisioners, count):
+        # pick the Provisioner with the lowest expected wait, one by one
+        outstanding = {p: self.outstanding(p) for p in provisioners}
+        wanted = collections.Counter()
+        for _ in range(count):
+            best = min(
+                provisioners,
+                key=lambda p: (outstanding[p] + wanted[p] + 1) * self.time_to_remote(p),
+            )
+            wanted[best] += 1
+        now = time.monotonic()
+        for provisioner, n in wanted.items():
+            self.logger.debug(f"requesting {n} more from {provisioner}")
+            provisioner.provision(n)
+            self._requests[provisioner].append([now, n])
+
+    def _cancel(self, provisioners, excess):
+        # Provisioners can cancel only all of their requests, and any Remotes
+        # already being reserved may arrive regardless, so never re-request
+        # - cancel only Provisioners whose requests are all in excess,
+        # the slowest ones first
+        by_speed = sorted(provisioners, key=self.time_to_remote, reverse=True)
+        for provisioner in by_speed:
+            outstanding = self.outstanding(provisioner)
+            if outstanding == 0 or outstanding > excess:
+                continue
+            self.logger.info(f"cancelling {outstanding} excess requests from {provisioner}")
+            provisioner.clear()
+            self._requests[provisioner].clear()
+            excess -= outstanding
+
+    def update(self, orchestrator, *, force=False):
+        """
+        Re-evaluate the amount of Remotes needed by `orchestrator` (given
+        its current state), and request or cancel Remotes from its
+        Provisioners accordingly.
+
+        Unless `force` is True, this does nothing if called sooner than
+        `update_interval` after the last update.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_update < self.update_interval:
+            return
+        self._last_update = now
+
+        provisioners = orchestrator.provisioners
+        outstanding = sum(self.outstanding(p) for p in provisioners)
+        have = len(orchestrator._running_tests) + orchestrator._held_remotes() + outstanding
+        target = self.target(orchestrator)
+
+        if target > have:
+            self._provision(provisioners, target - have)
+
+        elif (
+            have > target
+            and outstanding > 0
+            and now - self._last_scale_down >= self.scale_down_interval
+        ):
+            self._last_scale_down = now
+            self._cancel(provisioners, min(have - target, outstanding))
@@ -0,0 +1,110 @@
+import json
+import os
+import statistics
+import tempfile
+import threading
+from pathlib import Path
+
+from ... import util
+
+_get_logger = util.get_loggers("atex.orchestrator.adhoc.runtimes")
+
+
+class RuntimeStore:
+    """
+    A persistent store of observed test runtimes (in seconds), kept in a JSON
+    file across multiple runs, per platform and test name, ie.
+
+        {"9.6": {"/some/test": [123.4, 130.1, 118.9]}}
+
+    - `path` is a string/Path to the JSON file, it doesn't need to exist,
+      it is created on `.stop()`.
+
+    - `history` is how many most recent runtimes to remember for each test,
+      older ones are forgotten.
+    """
+
+    def __init__(self, path, *, history=10):
+        self._lock = threading.RLock()
+        self.logger = _get_logger()
+
+        self.path = Path(path)
+        self.history = history
+        self._runtimes = {}
+        self._started = False
+
+    def start(self):
+        self.logger.debug(f"starting: {self}")
+
+        with self._lock:
+            if self.path.exists():
+                with open(self.path) as f:
+                    self._runtimes = json.load(f)
+            else:
+                self._runtimes = {}
+            self._started = True
+
+    def stop(self):
+        self.logger.debug(f"stopping: {self}")
+
+        with self._lock:
+            # don't overwrite the file if it failed to load
+            if self._started:
+                self.save()
+                self._started = False
+
+    def save(self):
+        """
+        Atomically write out all runtimes to `path`.
+        """
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=f".{self.path.name}.", dir=self.path.parent,
+            )
+            try:
+                # mkstemp() creates it as 0600, readable only by us
+                os.fchmod(fd, 0o644)
+                with os.fdopen(fd, "w") as f:
+                    json.dump(self._runtimes, f, indent=None)
+                Path(tmp_path).replace(self.path)
+            except BaseException:
+                Path(tmp_path).unlink(missing_ok=True)
+                raise
+
+    def record(self, platform, test_name, runtime):
+        """
+        Add a `runtime` (float of seconds) of one execution of `test_name`
+        (any `str()`-capable object, stored as a string) on `platform`.
+        """
+        with self._lock:
+            tests = self._runtimes.setdefault(platform, {})
+            runtimes = tests.setdefault(str(test_name), [])
+            runtimes.append(runtime)
+            del runtimes[:-self.history]
+
+    def median(self, platform, test_name):
+        """
+        Return a median of all remembered runtimes of `test_name`
+        on `platform`, or None if there are none.
+        """
+        with self._lock:
+            runtimes = self._runtimes.get(platform, {}).get(str(test_name))
+            if not runtimes:
+                return None
+            return statistics.median(runtimes)
+
+    def __enter__(self):
+        try:
+            self.start()
+            return self
+        except BaseException:
+            self.stop()
+            raise
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def __str__(self):
+        class_name = self.__class__.__name__
+        return f"{class_name}({self.path})"
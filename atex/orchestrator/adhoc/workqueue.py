@@ -0,0 +1,287 @@
+import contextlib
+import multiprocessing
+import sqlite3
+import threading
+from multiprocessing.managers import BaseManager
+from pathlib import Path
+
+from ... import util
+
+_get_logger = util.get_loggers("atex.orchestrator.adhoc.workqueue")
+
+
+class WorkQueue:
+    """
+    A queue of tests shared by several AdHocOrchestrator instances (shards),
+    possibly in different processes, stored in an SQLite database file.
+
+    Every test is, per platform, in one of these states:
+
+    - `pending` waiting for any shard to claim (and run) it,
+    - `running` claimed by one shard, running (or about to),
+    - `done` finished for good, its results were passed to an Aggregator.
+
+    A test to be re-run is put back to `pending`, so that any shard with
+    a free Remote can pick it up.
+
+    Every change bumps a sequence number, so that shards can cheaply fetch
+    only the changes since they last looked, see `.changes()`.
+
+    - `path` is a string/Path to the SQLite database, created if it doesn't
+      exist. All shards on one host can share it directly, shards on other
+      hosts need to use a WorkQueueCoordinator (SQLite locking over network
+      filesystems is unreliable).
+
+    - `timeout` is how many seconds to wait for a database lock held by
+      another process before giving up.
+    """
+
+    def __init__(self, path, *, timeout=60):
+        self._lock = threading.RLock()
+        self.logger = _get_logger()
+
+        self.path = Path(path)
+        self.timeout = timeout
+        self._db = None
+
+    def start(self):
+        self.logger.debug(f"starting: {self}")
+
+        with self._lock:
+            self._db = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                # transactions are handled by ._transaction()
+                isolation_level=None,
+                # used from multiple threads, under self._lock
+                check_same_thread=False,
+            )
+            with self._transaction() as db:
+                db.execute("""
+                    CREATE TABLE IF NOT EXISTS tests (
+                        platform TEXT NOT NULL,
+                        name TEXT NOT NULL,
+                        state TEXT NOT NULL,
+                        shard TEXT,
+                        seq INTEGER NOT NULL,
+                        PRIMARY KEY (platform, name)
+                    )
+                """)
+                db.execute("CREATE INDEX IF NOT EXISTS tests_seq ON tests (platform, seq)")
+
+    def stop(self):
+        self.logger.debug(f"stopping: {self}")
+
+        with self._lock:
+            if self._db:
+                self._db.close()
+                self._db = None
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            # lock the database for writing right away, so that a claim
+            # cannot race with another process
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            else:
+                self._db.execute("COMMIT")
+
+    @staticmethod
+    def _next_seq(db):
+        return db.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM tests").fetchone()[0]
+
+    def _set_state(self, platform, name, state, *, shard=None, only_from=None):
+        with self._transaction() as db:
+            query = (
+                "UPDATE tests SET state = ?, shard = ?, seq = ? WHERE platform = ? AND name = ?"
+            )
+            args = [state, shard, self._next_seq(db), platform, name]
+            if only_from:
+                query += " AND state = ?"
+                args.append(only_from)
+            return db.execute(query, args).rowcount == 1
+
+    def add(self, platform, names):
+        """
+        Add test `names` under `platform` as `pending`, skipping any already
+        present (ie. added by another shard), whatever their state.
+        """
+        with self._transaction() as db:
+            seq = self._next_seq(db)
+            db.executemany(
+                "INSERT OR IGNORE INTO tests VALUES (?, ?, 'pending', NULL, ?)",
+                ((platform, str(name), seq) for name in names),
+            )
+
+    def changes(self, platform, since=0):
+        """
+        Return a `(seq, changes)` tuple, with `changes` being a list of
+        `(name, state)` tuples for every test under `platform` changed after
+        sequence number `since`, and `seq` being the sequence number to pass
+        as `since` next time.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name, state, seq FROM tests WHERE platform = ? AND seq > ? ORDER BY seq",
+                (platform, since),
+            ).fetchall()
+        seq = rows[-1][2] if rows else since
+        return (seq, [(name, state) for name, state, _ in rows])
+
+    def claim(self, platform, name, shard):
+        """
+        Claim a `pending` test `name` under `platform` for `shard` (string),
+        returning True if it was claimed, False if somebody else claimed it
+        first (or it is not pending anymore).
+        """
+        return self._set_state(platform, name, "running", shard=shard, only_from="pending")
+
+    def requeue(self, platform, name):
+        """
+        Put a test `name` under `platform` back to `pending`, ie. to re-run it.
+        """
+        self._set_state(platform, name, "pending")
+
+    def done(self, platform, name):
+        """
+        Mark a test `name` under `platform` as finished for good.
+        """
+        self._set_state(platform, name, "done")
+
+    def reset(self, platform, shard):
+        """
+        Put all tests under `platform` claimed by `shard` back to `pending`,
+        ie. those left running by a crashed previous run of the shard.
+
+        Returns how many tests were reset.
+        """
+        with self._transaction() as db:
+            return db.execute(
+                "UPDATE tests SET state = 'pending', shard = NULL, seq = ? "
+                "WHERE platform = ? AND shard = ? AND state = 'running'",
+                (self._next_seq(db), platform, shard),
+            ).rowcount
+
+    def counts(self, platform):
+        """
+        Return a dict of states to the number of tests under `platform`
+        in them.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT state, COUNT(*) FROM tests WHERE platform = ? GROUP BY state",
+                (platform,),
+            ).fetchall()
+        return dict(rows)
+
+    def __enter__(self):
+        try:
+            self.start()
+            return self
+        except BaseException:
+            self.stop()
+            raise
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def __str__(self):
+        class_name = self.__class__.__name__
+        return f"{class_name}({self.path})"
+
+
+# the one WorkQueue instance served by a WorkQueueCoordinator process
+_served_queue = None
+
+
+def _open_served_queue(path, timeout):
+    global _served_queue  # noqa: PLW0603
+    _served_queue = WorkQueue(path, timeout=timeout)
+    _served_queue.start()
+
+
+def _get_served_queue():
+    return _served_queue
+
+
+class _WorkQueueManager(BaseManager):
+    pass
+
+
+_WorkQueueManager.register("work_queue", callable=_get_served_queue)
+
+
+class WorkQueueCoordinator:
+    """
+    A WorkQueue served by a separate (local) coordinator process, over
+    a UNIX or TCP socket, for shards on other hosts to use.
+
+    - `path` and `timeout` are passed to WorkQueue.
+
+    - `address` is a path to a UNIX socket (string), or a `(host, port)`
+      tuple for TCP (port 0 picks a free one, see `.address`).
+
+    - `authkey` is a bytes secret shards need to use to connect,
+      see `connect()`.
+    """
+
+    def __init__(self, path, address, authkey, *, timeout=60):
+        self.logger = _get_logger()
+
+        self.path = Path(path)
+        self.timeout = timeout
+        self.authkey = authkey
+        # don't fork() a (likely) multi-threaded process
+        self._manager = _WorkQueueManager(
+            address, authkey, ctx=multiprocessing.get_context("spawn"),
+        )
+
+    @property
+    def address(self):
+        """
+        The address the coordinator actually listens on.
+        """
+        return self._manager.address
+
+    def start(self):
+        self.logger.debug(f"starting: {self}")
+        self._manager.start(
+            initializer=_open_served_queue,
+            initargs=(self.path, self.timeout),
+        )
+
+    def stop(self):
+        self.logger.debug(f"stopping: {self}")
+        # not started (or already stopped)
+        if getattr(self._manager, "_process", None) is not None:
+            self._manager.shutdown()
+
+    @staticmethod
+    def connect(address, authkey):
+        """
+        Connect to a coordinator listening on `address`, returning
+        a (proxy) WorkQueue instance, already started.
+        """
+        manager = _WorkQueueManager(address, authkey)
+        manager.connect()
+        return manager.work_queue()
+
+    def __enter__(self):
+        try:
+            self.start()
+            return self
+        except BaseException:
+            self.stop()
+            raise
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def __str__(self):
+        class_name = self.__class__.__name__
+        return f"{class_name}({self.path}, {self._manager.address})"
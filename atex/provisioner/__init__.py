@@ -6,6 +6,10 @@ from ..connection import Connection
 
 
 class Remote(Connection):
+    # identifier of a Provisioner snapshot this Remote was started from,
+    # see Provisioner.snapshot()
+    snapshot = None
+
     @abstractmethod
     def release(self):
         """
@@ -14,6 +18,10 @@ class Remote(Connection):
 
 
 class Provisioner(ABC):
+    # True if the Provisioner calls ._notify() whenever a non-blocking
+    # .get_remote() might have something new to return, see .add_notify()
+    notifies = False
+
     @abstractmethod
     def provision(self, count=1):
         """
@@ -38,6 +46,40 @@ class Provisioner(ABC):
         the provisioner. Specifics are implementation-dependent.
         """
 
+    def add_notify(self, func):
+        """
+        Register `func` to be called (without arguments, from any thread)
+        whenever a non-blocking `.get_remote()` might return a new Remote,
+        or raise an exception it didn't raise before.
+
+        Return True if the Provisioner supports this, False otherwise,
+        in which case the caller needs to keep polling `.get_remote()`.
+        """
+        if not self.notifies:
+            return False
+        # there is no __init__ for subclasses to call, create it lazily
+        # (dict.setdefault and list.append are atomic)
+        self.__dict__.setdefault("_notify_funcs", []).append(func)
+        return True
+
+    def _notify(self):
+        """
+        Call all functions registered via `.add_notify()`.
+        """
+        for func in self.__dict__.get("_notify_funcs", ()):
+            func()
+
+    def snapshot(self, remote):  # noqa: ARG002, PLR6301
+        """
+        Snapshot the current state of `remote` (a Remote from this Provisioner),
+        for Remotes returned by later `.get_remote()` calls to start from.
+
+        Return a (hashable) identifier of the snapshot, the same as the `.snapshot`
+        attribute of Remotes started from it, or None if the Provisioner doesn't
+        support this.
+        """
+        return None
+
     @abstractmethod
     def start(self):
         """
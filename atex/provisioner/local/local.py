@@ -42,6 +42,8 @@ class LocalProvisioner(Provisioner):
       LocalConnection.
     """
 
+    notifies = True
+
     def __init__(self, **kwargs):
         self._lock = threading.Condition()
         self.logger = _get_logger()
@@ -70,6 +72,7 @@ class LocalProvisioner(Provisioner):
         with self._lock:
             self._requested += count
             self._lock.notify(count)
+        self._notify()
 
     def get_remote(self, block=True):
         with self._lock:
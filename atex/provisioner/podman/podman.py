@@ -69,6 +69,8 @@ class PodmanProvisioner(Provisioner):
       to execute as the "init system" in the container.
     """
 
+    notifies = True
+
     def __init__(
         self, image, *,
         max_remotes=10, run_options=None, run_command=("sleep", "inf"),
@@ -85,6 +87,8 @@ class PodmanProvisioner(Provisioner):
         self._to_reserve = 0
         self._reserving = 0
         self._stopped = True
+        # images committed by .snapshot(), the last one used for new containers
+        self._snapshots = []
 
     def start(self):
         self.logger.debug(f"starting: {self}")
@@ -103,6 +107,12 @@ class PodmanProvisioner(Provisioner):
             self._remotes = set()
         for remote in to_release:
             remote.release()
+        while self._snapshots:
+            subprocess.run(
+                ("podman", "image", "rm", "-f", self._snapshots.pop()),
+                check=False,  # ignore if it fails
+                stdout=subprocess.DEVNULL,
+            )
 
     def provision(self, count=1):
         with self._lock:
@@ -111,6 +121,7 @@ class PodmanProvisioner(Provisioner):
             self.logger.debug(f"provisioning {count}")
             self._to_reserve += count
             self._lock.notify(count)
+        self._notify()
 
     def _has_capacity(self):
         return len(self._remotes) + self._reserving < self.max_remotes
@@ -134,12 +145,13 @@ class PodmanProvisioner(Provisioner):
                 return None
             self._to_reserve -= 1
             self._reserving += 1
+            snapshot = self._snapshots[-1] if self._snapshots else None
 
         remote = None
         try:
             cmd = (
                 "podman", "container", "run", "--quiet", "--detach", "--pull", "never",
-                *self.run_options, self.image, *self.run_command,
+                *self.run_options, snapshot or self.image, *self.run_command,
             )
 
             proc = subprocess.run(cmd, check=True, text=True, stdout=subprocess.PIPE)
@@ -152,8 +164,11 @@ class PodmanProvisioner(Provisioner):
                 with self._lock:
                     self._remotes.discard(remote)
                     self._lock.notify()
+                # freed capacity for another .get_remote()
+                self._notify()
 
             remote = self._make_remote(container_id, release_hook)
+            remote.snapshot = snapshot
             remote.connect()
         except BaseException:
             with self._lock:
@@ -173,6 +188,19 @@ class PodmanProvisioner(Provisioner):
 
         return remote
 
+    def snapshot(self, remote):
+        proc = subprocess.run(
+            ("podman", "container", "commit", "--quiet", remote.container),
+            check=True,
+            text=True,
+            stdout=subprocess.PIPE,
+        )
+        image = proc.stdout.rstrip("\n")
+        self.logger.debug(f"committed {remote} as {image}")
+        with self._lock:
+            self._snapshots.append(image)
+        return image
+
     def clear(self):
         with self._lock:
             self._to_reserve = 0
@@ -98,6 +98,8 @@ class SharedVirtProvisioner(Provisioner):
       by a user. Must be at most 15 characters long (per PR_SET_NAME).
     """
 
+    notifies = True
+
     helper_command = ("atex-virt-helper",)
 
     # DESIGN NOTES:
@@ -195,6 +197,7 @@ class SharedVirtProvisioner(Provisioner):
             self.stop()
             # wake up any waiting .get_remote() calls
             self._reserving_events.release(1_000_000_000)  # needs integer, not math.inf
+            self._notify()
         else:
             self.logger.debug("reserve thread exited cleanly")
 
@@ -351,6 +354,7 @@ class SharedVirtProvisioner(Provisioner):
                 self._reserving_remotes.add(remote)
                 self._to_reserve -= 1
             self._reserving_events.release(1)
+            self._notify()
 
             # delay for reserve_delay before reserving more
             if self._reserving_exit.wait(timeout=self.reserve_delay):
@@ -102,6 +102,8 @@ class TempVirtProvisioner(Provisioner):
       to avoid creating too many running domains.
     """
 
+    notifies = True
+
     # number of parallel threads running virsh destroy commands
     # to remove transient domains on .stop() or Context Manager exit
     stop_release_workers = 6
@@ -196,6 +198,7 @@ class TempVirtProvisioner(Provisioner):
                 self._remotes.add(result.value)
             self._queue.append(result)
             self._lock.notify()
+        self._notify()
 
     def _create_domain(self):
         if self._stopped.is_set():
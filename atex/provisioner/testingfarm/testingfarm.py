@@ -60,6 +60,8 @@ class TestingFarmProvisioner(Provisioner):
       that will be retried (systems reprovisioned) before giving up.
     """
 
+    notifies = True
+
     # maximum number of TF requests the user can .provision(),
     # as a safety measure against somebody passing huge max_remotes
     absolute_max_remotes = 50
@@ -77,7 +79,7 @@ class TestingFarmProvisioner(Provisioner):
         self.reserve_kwargs = reserve_kwargs
         self._retries = max_retries
 
-        self._queue = util.ThreadJoinQueue(daemon=True)
+        self._queue = util.ThreadJoinQueue(daemon=True, notify=self._notify)
         self._tf_api = api.TestingFarmAPI()
         self._to_reserve = 0
 
@@ -122,6 +124,8 @@ class TestingFarmProvisioner(Provisioner):
                         pass
                 # call TF API, cancel the request, etc.
                 tf_reserve.release()
+                # freed capacity for a new reservation via .get_remote()
+                self._notify()
 
             remote = TestingFarmRemote(
                 tf_reserve.request.id,
@@ -225,8 +229,10 @@ class TestingFarmProvisioner(Provisioner):
                         self._to_reserve += 1
                         if block:
                             continue
-                        else:
-                            return None
+                        # schedule the retry right away (self._lock is an RLock),
+                        # its reservation notifies the caller once it finishes
+                        self._schedule_new_reservations()
+                        return None
                     else:
                         self.logger.warning(
                             f"caught while reserving a TF system: {exc_str}, "
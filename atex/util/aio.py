@@ -0,0 +1,204 @@
+import asyncio
+import concurrent.futures
+import inspect
+import threading
+
+from .threads import ThreadJoinQueue
+
+
+async def wait_readable(fd, timeout=None):
+    """
+    Wait for a file descriptor `fd` to become readable (or to reach EOF),
+    for up to `timeout` seconds (or forever, if None).
+
+    Returns True if `fd` is readable, False if `timeout` was reached.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def readable():
+        if not future.done():
+            future.set_result(None)
+
+    loop.add_reader(fd, readable)
+    try:
+        await asyncio.wait_for(future, timeout)
+        return True
+    except TimeoutError:
+        return False
+    finally:
+        loop.remove_reader(fd)
+
+
+class EventLoopThread:
+    """
+    An asyncio event loop running forever in a background (daemon) thread,
+    for running coroutines from synchronous code.
+
+    Example:
+        with EventLoopThread() as loop:
+            future = loop.submit(asyncio.sleep(1, result=123))
+            future.result()  # returns 123
+
+    If `max_workers` is given, it limits the default executor of the loop,
+    running any blocking calls passed to `asyncio.to_thread()`.
+    """
+
+    def __init__(self, name="atex-asyncio", *, max_workers=None):
+        self.name = name
+        self.max_workers = max_workers
+        self.loop = None
+        self._thread = None
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        if self.max_workers is not None:
+            self.loop.set_default_executor(
+                concurrent.futures.ThreadPoolExecutor(self.max_workers),
+            )
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Cancel any coroutines still running, wait for them to handle
+        the cancellation, and stop (and close) the event loop.
+        """
+        if not self.loop:
+            return
+
+        async def cancel_all():
+            current = asyncio.current_task()
+            tasks = [task for task in asyncio.all_tasks() if task is not current]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.loop.shutdown_default_executor()
+
+        asyncio.run_coroutine_threadsafe(cancel_all(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+        self.loop = None
+        self._thread = None
+
+    def submit(self, coro):
+        """
+        Schedule a coroutine `coro` on the event loop, returning
+        a concurrent.futures.Future of its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def __enter__(self):
+        try:
+            self.start()
+            return self
+        except BaseException:
+            self.stop()
+            raise
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+_sync_loop = None
+_sync_loop_lock = threading.Lock()
+
+
+def run_sync(coro):
+    """
+    Run a coroutine `coro` to completion from synchronous code, returning
+    its result (or raising its exception).
+
+    Unlike `asyncio.run()`, this doesn't create a new event loop for every
+    call, all coroutines run on one shared EventLoopThread (started on first
+    use), blocking the calling thread until they finish. This works also
+    when called from a thread already running an event loop (ie. from its
+    callback), blocking that loop.
+    """
+    global _sync_loop  # noqa: PLW0603
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = EventLoopThread("atex-asyncio-sync")
+            _sync_loop.start()
+    future = _sync_loop.submit(coro)
+    try:
+        return future.result()
+    except BaseException:
+        # ie. Ctrl-C, don't leave `coro` running
+        future.cancel()
+        raise
+
+
+class CoroutineJoinQueue(ThreadJoinQueue):
+    """
+    A variant of ThreadJoinQueue that runs callables as coroutines on
+    a (started) EventLoopThread `loop`, instead of starting one thread for each.
+
+    The `.start_thread()`, `.get_raw()` and `.get()` semantics are identical
+    to ThreadJoinQueue, except that `target` is expected to be a coroutine
+    function (a regular callable would block the event loop), and the `thread`
+    in a ThreadResult is the asyncio.Task that ran it.
+    """
+
+    def __init__(self, loop, notify=None):
+        super().__init__(daemon=True, notify=notify)
+        self.loop = loop
+
+    async def _async_wrapper(self, func, func_args, func_kwargs, **user_kwargs):
+        current_task = asyncio.current_task()
+        try:
+            ret = func(*func_args, **func_kwargs)
+            if inspect.isawaitable(ret):
+                ret = await ret
+            result = self.ThreadResult(
+                thread=current_task,
+                returned=ret,
+                exception=None,
+                **user_kwargs,
+            )
+        except BaseException as e:
+            result = self.ThreadResult(
+                thread=current_task,
+                returned=None,
+                exception=e,
+                **user_kwargs,
+            )
+        self._queue.put(result)
+        if self.notify is not None:
+            self.notify()
+
+    def _discard(self, future):
+        with self._lock:
+            self._threads.discard(future)
+
+    def start_thread(self, target, *, target_args=None, target_kwargs=None, **user_kwargs):
+        """
+        Schedule `target` as a coroutine on the event loop, passing it
+        `target_args` as arguments and `target_kwargs` as keyword arguments.
+
+        See ThreadJoinQueue.start_thread() for the arguments.
+        """
+        coro = self._async_wrapper(
+            target, target_args or (), target_kwargs or {}, **user_kwargs,
+        )
+        with self._lock:
+            future = self.loop.submit(coro)
+            self._threads.add(future)
+        future.add_done_callback(self._discard)
+
+    def get_raw(self, block=True, timeout=None):
+        # coroutines remove themselves from self._threads when they finish
+        return self._queue.get(block=block, timeout=timeout)
+
+    def join(self):
+        """
+        Wait for all coroutines to finish, ignoring the state of the queue.
+        """
+        with self._lock:
+            futures = tuple(self._threads)
+        concurrent.futures.wait(futures)
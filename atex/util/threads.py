@@ -1,3 +1,4 @@
+import collections
 import queue
 import threading
 
@@ -76,16 +77,21 @@ class ThreadJoinQueue:
         queue.get()  # returns (1,2,3) or (4,5,6)
         queue.get()  # returns (1,2,3) or (4,5,6)
 
+    If `notify` is given, it is called (without arguments) from inside each
+    finished thread, right after its result has been put on the queue.
+    This allows the caller to block on its own synchronization primitive
+    (ie. a threading.Event) instead of polling the queue.
     """
     class ThreadResult(NamedMapping, required=("thread", "returned", "exception")):
         pass
 
     Empty = queue.Empty
 
-    def __init__(self, daemon=False):
+    def __init__(self, daemon=False, notify=None):
         self._lock = threading.RLock()
         self._queue = queue.SimpleQueue()
         self.daemon = daemon
+        self.notify = notify
         self._threads = set()
 
     def _wrapper(self, func, func_args, func_kwargs, **user_kwargs):
@@ -106,6 +112,8 @@ class ThreadJoinQueue:
                 **user_kwargs,
             )
         self._queue.put(result)
+        if self.notify is not None:
+            self.notify()
 
     def start_thread(self, target, *, target_args=None, target_kwargs=None, **user_kwargs):
         """
@@ -173,3 +181,76 @@ class ThreadJoinQueue:
         `queue.Empty`.
         """
         return self._queue.qsize()
+
+
+class ThreadPoolJoinQueue(ThreadJoinQueue):
+    """
+    A variant of ThreadJoinQueue that runs at most `max_workers` callables
+    at any one time, re-using its worker threads for any further callables
+    started via `.start_thread()`, instead of starting one thread for each.
+
+    Callables beyond `max_workers` are held in a FIFO and picked up by
+    the first worker that becomes free. Workers exit once there is nothing
+    more to pick up, so an idle pool has no running threads.
+
+    The `.start_thread()`, `.get_raw()` and `.get()` semantics are identical
+    to ThreadJoinQueue, the `thread` in a ThreadResult is the worker thread
+    that ran the callable.
+    """
+
+    def __init__(self, max_workers, daemon=False, notify=None):
+        if max_workers < 1:
+            raise ValueError(f"max_workers must be at least 1, got {max_workers}")
+        super().__init__(daemon=daemon, notify=notify)
+        self.max_workers = max_workers
+        self._pending = collections.deque()
+
+    def _worker(self):
+        current_thread = threading.current_thread()
+        while True:
+            with self._lock:
+                try:
+                    func, func_args, func_kwargs, user_kwargs = self._pending.popleft()
+                except IndexError:
+                    # nothing left to do, exit (under the lock, so that
+                    # .start_thread() knows to spawn a new worker)
+                    self._threads.discard(current_thread)
+                    return
+            self._wrapper(func, func_args, func_kwargs, **user_kwargs)
+
+    def start_thread(self, target, *, target_args=None, target_kwargs=None, **user_kwargs):
+        """
+        Run `target` in a free worker thread, starting a new one if there
+        are fewer than `max_workers`, or queue it up for the first worker
+        that becomes free.
+
+        See ThreadJoinQueue.start_thread() for the arguments.
+        """
+        with self._lock:
+            self._pending.append((target, target_args or (), target_kwargs or {}, user_kwargs))
+            if len(self._threads) < self.max_workers:
+                t = threading.Thread(target=self._worker, daemon=self.daemon)
+                self._threads.add(t)
+                t.start()
+
+    def get_raw(self, block=True, timeout=None):
+        # workers remove themselves from self._threads when they exit
+        return self._queue.get(block=block, timeout=timeout)
+
+    def join(self):
+        """
+        Wait for all started callables (running or not) to finish, ignoring
+        the state of the queue.
+        """
+        while True:
+            with self._lock:
+                if not self._threads:
+                    break
+                thread = next(iter(self._threads))
+            thread.join()
+
+    def pending(self):
+        """
+        Return the number of callables waiting for a free worker.
+        """
+        return len(self._pending)
@@ -197,3 +197,78 @@ def files_compressed_no_suffix(tmp_path, cls, decompress_open, ext):
     with decompress_open(target, "rt") as f:
         result = json.loads(f.read().strip())
     assert result[4] == ["data.bin"]
+
+
+def resume(tmp_path, cls, decompress_open, ext):
+    target = tmp_path / f"target{ext}"
+    files = tmp_path / "files"
+    artifacts1 = make_artifacts(tmp_path, [{"status": "pass"}], name="artifacts1")
+    artifacts2 = make_artifacts(tmp_path, [{"status": "fail"}], name="artifacts2")
+    artifacts3 = make_artifacts(tmp_path, [{"status": "pass"}], name="artifacts3")
+    with cls(target, files) as aggregator:
+        aggregator.ingest("platform1", "/test1", artifacts1)
+    # refuse to overwrite without resume
+    with pytest.raises(FileExistsError):
+        cls(target, files).start()
+    with cls(target, files, resume=True) as aggregator:
+        # already ingested before resuming
+        with pytest.raises(AggregatorError):
+            aggregator.ingest("platform1", "/test1", artifacts2)
+        aggregator.ingest("platform1", "/test2", artifacts3)
+    with decompress_open(target, "rt") as f:
+        lines = [json.loads(line) for line in f]
+    assert lines == [
+        ["platform1", "pass", "/test1", None, [], None],
+        ["platform1", "pass", "/test2", None, [], None],
+    ]
+
+
+def resume_truncated(tmp_path, cls, decompress_open, ext):
+    target = tmp_path / f"target{ext}"
+    files = tmp_path / "files"
+    artifacts1 = make_artifacts(tmp_path, [{"status": "pass"}], name="artifacts1")
+    artifacts2 = make_artifacts(tmp_path, [{"status": "pass"}], name="artifacts2")
+    artifacts3 = make_artifacts(tmp_path, [{"status": "pass"}], name="artifacts3")
+    with cls(target, files) as aggregator:
+        aggregator.ingest("platform1", "/test1", artifacts1)
+        aggregator.ingest("platform1", "/test2", artifacts2)
+    # simulate a crash while writing out the last result
+    target.write_bytes(target.read_bytes()[:-10])
+    with cls(target, files, resume=True) as aggregator:
+        aggregator.ingest("platform1", "/test3", artifacts3)
+    with decompress_open(target, "rt") as f:
+        names = [json.loads(line)[2] for line in f]
+    # the cut-off /test2 may or may not have been recoverable
+    assert names in (["/test1", "/test3"], ["/test1", "/test2", "/test3"])
+
+
+def discard(tmp_path, cls, decompress_open, ext):
+    target = tmp_path / f"target{ext}"
+    files = tmp_path / "files"
+    artifacts1 = make_artifacts(
+        tmp_path, [{"status": "pass"}], files={"data.bin": b"\x00"}, name="artifacts1",
+    )
+    artifacts2 = make_artifacts(
+        tmp_path, [{"status": "fail"}, {"status": "pass", "name": "sub"}],
+        files={"data.bin": b"\x01"}, name="artifacts2",
+    )
+    artifacts3 = make_artifacts(tmp_path, [{"status": "pass"}], name="artifacts3")
+    artifacts4 = make_artifacts(tmp_path, [{"status": "pass"}], name="artifacts4")
+    with cls(target, files) as aggregator:
+        aggregator.ingest("platform1", "/test1", artifacts1)
+        aggregator.ingest("platform1", "/test2", artifacts2)
+        aggregator.ingest("platform2", "/test2", artifacts3)
+    with cls(target, files, resume=True) as aggregator:
+        assert aggregator.discard("platform1", ["/test2", "/test3"]) == 1
+        assert aggregator.discard("platform1", ["/test2"]) == 0
+        assert not (files / "platform1" / "test2").exists()
+        assert (files / "platform1" / "test1").exists()
+        # can be ingested again
+        aggregator.ingest("platform1", "/test2", artifacts4)
+    with decompress_open(target, "rt") as f:
+        lines = [json.loads(line)[:3] for line in f]
+    assert lines == [
+        ["platform1", "pass", "/test1"],
+        ["platform2", "pass", "/test2"],
+        ["platform1", "pass", "/test2"],
+    ]
@@ -148,3 +148,34 @@ def test_ingest_missing_results(tmp_path):
     files = tmp_path / "files"
     with JSONLinesAggregator(target, files) as aggregator:
         shared.ingest_missing_results(tmp_path, aggregator)
+
+
+def test_resume(tmp_path):
+    """Resuming appends to existing output and remembers ingested tests."""
+    shared.resume(tmp_path, JSONLinesAggregator, open, ".jsonl")
+
+
+def test_resume_truncated(tmp_path):
+    """Resuming after a crash drops a truncated last line, keeps the output readable."""
+    shared.resume_truncated(tmp_path, JSONLinesAggregator, open, ".jsonl")
+
+
+def test_resume_duplicate_allow(tmp_path):
+    """Resuming with allow_duplicate continues the counter suffix."""
+    target = tmp_path / "target.jsonl"
+    files = tmp_path / "files"
+    artifacts1 = shared.make_artifacts(tmp_path, [{"status": "pass"}], name="artifacts1")
+    artifacts2 = shared.make_artifacts(tmp_path, [{"status": "pass"}], name="artifacts2")
+    artifacts3 = shared.make_artifacts(tmp_path, [{"status": "pass"}], name="artifacts3")
+    with JSONLinesAggregator(target, files, allow_duplicate=True) as aggregator:
+        aggregator.ingest("platform1", "/test1", artifacts1)
+        aggregator.ingest("platform1", "/test1", artifacts2)
+    with JSONLinesAggregator(target, files, allow_duplicate=True, resume=True) as aggregator:
+        aggregator.ingest("platform1", "/test1", artifacts3)
+    names = [json.loads(line)[2] for line in target.read_text().splitlines()]
+    assert names == ["/test1", "/test1 (1)", "/test1 (2)"]
+
+
+def test_discard(tmp_path):
+    """Discarded tests lose their results and files, and can be ingested again."""
+    shared.discard(tmp_path, JSONLinesAggregator, open, ".jsonl")
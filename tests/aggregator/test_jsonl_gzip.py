@@ -64,3 +64,18 @@ def test_ingest_missing_results(tmp_path):
     files = tmp_path / "files"
     with GzipJSONLinesAggregator(target, files) as aggregator:
         shared.ingest_missing_results(tmp_path, aggregator)
+
+
+def test_resume(tmp_path):
+    """Resuming appends a new gzip member to the existing output."""
+    shared.resume(tmp_path, GzipJSONLinesAggregator, gzip.open, ".jsonl.gz")
+
+
+def test_resume_truncated(tmp_path):
+    """Resuming after a crash drops a truncated gzip member, keeps the output readable."""
+    shared.resume_truncated(tmp_path, GzipJSONLinesAggregator, gzip.open, ".jsonl.gz")
+
+
+def test_discard(tmp_path):
+    """Discarded tests lose their results and files, and can be ingested again."""
+    shared.discard(tmp_path, GzipJSONLinesAggregator, gzip.open, ".jsonl.gz")
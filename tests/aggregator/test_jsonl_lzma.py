@@ -64,3 +64,18 @@ def test_ingest_missing_results(tmp_path):
     files = tmp_path / "files"
     with LZMAJSONLinesAggregator(target, files) as aggregator:
         shared.ingest_missing_results(tmp_path, aggregator)
+
+
+def test_resume(tmp_path):
+    """Resuming appends a new LZMA stream to the existing output."""
+    shared.resume(tmp_path, LZMAJSONLinesAggregator, lzma.open, ".jsonl.xz")
+
+
+def test_resume_truncated(tmp_path):
+    """Resuming after a crash drops a truncated LZMA stream, keeps the output readable."""
+    shared.resume_truncated(tmp_path, LZMAJSONLinesAggregator, lzma.open, ".jsonl.xz")
+
+
+def test_discard(tmp_path):
+    """Discarded tests lose their results and files, and can be ingested again."""
+    shared.discard(tmp_path, LZMAJSONLinesAggregator, lzma.open, ".jsonl.xz")
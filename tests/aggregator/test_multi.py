@@ -31,6 +31,27 @@ def test_artifact_isolation(tmp_path):
     assert (files2 / "platform1" / "test1" / "data.bin").read_bytes() == b"\xaa\xbb\xcc"
 
 
+def test_hardlinked_copies(tmp_path):
+    """Extra children get hardlinks of the artifacts, not copies of the data."""
+    files1 = tmp_path / "files1"
+    files2 = tmp_path / "files2"
+    artifacts = shared.make_artifacts(
+        tmp_path,
+        [{"status": "pass", "files": ["data.bin"]}],
+        files={"data.bin": b"\xaa\xbb\xcc"},
+    )
+    with MultiAggregator([
+        JSONLinesAggregator(tmp_path / "out1.jsonl", files1),
+        JSONLinesAggregator(tmp_path / "out2.jsonl", files2),
+    ]) as multi:
+        assert multi.artifacts_dir() == tmp_path
+        multi.ingest("platform1", "/test1", artifacts)
+    stat1 = (files1 / "platform1" / "test1" / "data.bin").stat()
+    stat2 = (files2 / "platform1" / "test1" / "data.bin").stat()
+    assert stat1.st_ino == stat2.st_ino
+    assert stat1.st_nlink == 2
+
+
 def test_temp_cleanup_on_failure(tmp_path):
     """No temporary dirs leak when a child's ingest raises."""
     target = tmp_path / "target.jsonl"
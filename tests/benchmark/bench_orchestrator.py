@@ -0,0 +1,177 @@
+"""
+Benchmarks of controller-side overhead of AdHocOrchestrator and the utilities
+on its hot path (ThreadJoinQueue, NamedMapping), compared to a stored baseline.
+
+Not collected by a plain `pytest` run (the file name doesn't match test_*.py),
+run it explicitly, ie.
+
+    pytest -s tests/benchmark/bench_orchestrator.py
+
+Environment variables:
+
+- ATEX_BENCH_TESTS - number of trivial tests to run (default 10000)
+- ATEX_BENCH_REMOTES - number of LocalProvisioner Remotes (default 8)
+- ATEX_BENCH_TOLERANCE - allowed relative regression (default 0.5)
+- ATEX_BENCH_UPDATE - if set to 1, store the results as a new baseline
+"""
+
+import json
+import os
+import resource
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from atex.aggregator.jsonl import JSONLinesAggregator
+from atex.executor.command import CommandExecutor
+from atex.orchestrator.adhoc import AdHocOrchestrator, ProvisioningController
+from atex.provisioner.local import LocalProvisioner
+from atex.util import NamedMapping, ThreadJoinQueue, ThreadPoolJoinQueue
+
+BASELINE = Path(__file__).parent / "baseline.json"
+
+TESTS = int(os.environ.get("ATEX_BENCH_TESTS", "10000"))
+REMOTES = int(os.environ.get("ATEX_BENCH_REMOTES", "8"))
+TOLERANCE = float(os.environ.get("ATEX_BENCH_TOLERANCE", "0.5"))
+UPDATE = os.environ.get("ATEX_BENCH_UPDATE") == "1"
+
+# metrics where higher is better, all others are lower-is-better
+HIGHER_IS_BETTER = {"tests_per_sec"}
+
+
+def compare_to_baseline(name, config, results):
+    """
+    Print `results` (dict of metric names to numbers) of benchmark `name`,
+    and fail if any is worse than the stored baseline by more than TOLERANCE,
+    as long as the baseline was measured with the same `config` (dict).
+    """
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    print(f"\n{name} {config}: {results}")
+
+    if UPDATE:
+        baseline[name] = {"config": config, "results": results}
+        BASELINE.write_text(json.dumps(baseline, indent=4, sort_keys=True) + "\n")
+        return
+
+    stored = baseline.get(name)
+    if not stored or stored["config"] != config:
+        pytest.skip(f"no baseline for {name} with {config}")
+
+    regressions = []
+    for metric, value in results.items():
+        old = stored["results"].get(metric)
+        if old is None:
+            continue
+        if metric in HIGHER_IS_BETTER:
+            worse = value < old * (1 - TOLERANCE)
+        else:
+            worse = value > old * (1 + TOLERANCE)
+        if worse:
+            regressions.append(f"{metric}: {value:.6g} vs baseline {old:.6g}")
+    assert not regressions, f"{name} regressed: " + ", ".join(regressions)
+
+
+def best_cpu_time(func, repeat=5):
+    """
+    Return the lowest CPU time (in seconds) `func` took in `repeat` calls,
+    to filter out noise of other processes, garbage collection, etc.
+    """
+    best = None
+    for _ in range(repeat):
+        cpu = time.process_time()
+        func()
+        cpu = time.process_time() - cpu
+        best = cpu if best is None else min(best, cpu)
+    return best
+
+
+def test_orchestrator_overhead(tmp_path):
+    """Trivial tests pushed through the whole orchestrator."""
+    tests = {f"/test{i}": ("true",) for i in range(TESTS)}
+    peak_threads = 0
+
+    class SamplingOrchestrator(AdHocOrchestrator):
+        def _start_test(self, info, test_name):
+            nonlocal peak_threads
+            rinfo = super()._start_test(info, test_name)
+            peak_threads = max(peak_threads, threading.active_count())
+            return rinfo
+
+    with (
+        LocalProvisioner() as provisioner,
+        JSONLinesAggregator(tmp_path / "results.jsonl", tmp_path / "files") as aggregator,
+    ):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        with SamplingOrchestrator(
+            "bench",
+            tests.keys(),
+            (provisioner,),
+            lambda conn: CommandExecutor(conn, tests),
+            aggregator,
+            provisioning=ProvisioningController(max_remotes=REMOTES),
+        ) as orchestrator:
+            orchestrator.serve_forever()
+        cpu = time.process_time() - cpu
+        wall = time.perf_counter() - wall
+
+    with open(tmp_path / "results.jsonl") as f:
+        assert sum(1 for _ in f) == TESTS
+
+    compare_to_baseline(
+        "orchestrator",
+        {"tests": TESTS, "remotes": REMOTES},
+        {
+            "tests_per_sec": TESTS / wall,
+            "cpu_per_test": cpu / TESTS,
+            "peak_threads": peak_threads,
+            # KiB on Linux
+            "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+    )
+
+
+@pytest.mark.parametrize("queue_cls", (ThreadJoinQueue, ThreadPoolJoinQueue))
+def test_queue_overhead(queue_cls):
+    """Starting and collecting no-op callables, a few at a time."""
+    queue = queue_cls(REMOTES) if queue_cls is ThreadPoolJoinQueue else queue_cls()
+
+    def run():
+        for i in range(0, TESTS, REMOTES):
+            for j in range(REMOTES):
+                queue.start_thread(int, target_args=(i + j,), extra=i + j)
+            for _ in range(REMOTES):
+                queue.get_raw()
+
+    cpu = best_cpu_time(run)
+
+    compare_to_baseline(
+        queue_cls.__name__,
+        {"tests": TESTS, "remotes": REMOTES},
+        {"cpu_per_call": cpu / TESTS},
+    )
+
+
+def test_named_mapping_overhead():
+    """Creating and re-creating NamedMappings, like RunningInfo -> FinishedInfo."""
+    class Running(NamedMapping, required=("provisioner", "remote", "executor", "test_name")):
+        pass
+
+    class Finished(Running, required=("exit_code", "exception")):
+        pass
+
+    def run():
+        for i in range(TESTS):
+            running = Running(provisioner=None, remote=None, executor=None, test_name=i)
+            finished = Finished(**running, exit_code=0, exception=None)
+            Running._from(finished)
+
+    cpu = best_cpu_time(run)
+
+    compare_to_baseline(
+        "NamedMapping",
+        {"tests": TESTS},
+        {"cpu_per_test": cpu / TESTS},
+    )
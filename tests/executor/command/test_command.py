@@ -1,3 +1,4 @@
+import asyncio
 import json
 import threading
 import time
@@ -141,3 +142,76 @@ def test_cancel(tmp_path):
             executor.cancel()
             thread.join(timeout=5)
             assert not thread.is_alive()
+
+
+def test_arun_test(tmp_path):
+    """Tests run concurrently as coroutines from one event loop."""
+    tests = {"/test1": ("sleep", "1"), "/test2": ("sh", "-c", "sleep 1; exit 2")}
+    for name in ("a1", "a2"):
+        (tmp_path / name).mkdir()
+
+    async def run_both(executor1, executor2):
+        return await asyncio.gather(
+            executor1.arun_test("/test1", tmp_path / "a1"),
+            executor2.arun_test("/test2", tmp_path / "a2"),
+        )
+
+    with LocalConnection() as conn:
+        with CommandExecutor(conn, tests) as e1, CommandExecutor(conn, tests) as e2:
+            start = time.monotonic()
+            rcs = asyncio.run(run_both(e1, e2))
+            assert time.monotonic() - start < 1.9
+    assert rcs == [0, 2]
+    assert json.loads((tmp_path / "a1" / "results").read_text())["status"] == "pass"
+    assert json.loads((tmp_path / "a2" / "results").read_text())["status"] == "fail"
+
+
+def test_run_test_in_loop(tmp_path):
+    """The sync run_test works when called from a running event loop."""
+    tests = {"/test1": ("sh", "-c", "exit 3")}
+
+    async def run(executor):  # noqa: RUF029
+        return executor.run_test("/test1", tmp_path)
+
+    with LocalConnection() as conn:
+        with CommandExecutor(conn, tests) as executor:
+            rc = asyncio.run(run(executor))
+    assert rc == 3
+    assert json.loads((tmp_path / "results").read_text())["status"] == "fail"
+
+
+def test_cancel_arun_test(tmp_path):
+    """Cancelling from another thread kills a test running in an event loop."""
+    tests = {"/test1": ("sleep", "30")}
+
+    async def run(executor):
+        canceller = threading.Timer(1, executor.cancel)
+        canceller.start()
+        try:
+            return await asyncio.wait_for(executor.arun_test("/test1", tmp_path), 5)
+        finally:
+            canceller.cancel()
+
+    with LocalConnection() as conn:
+        with CommandExecutor(conn, tests) as executor:
+            rc = asyncio.run(run(executor))
+    assert rc == -9
+
+
+def test_run_test_shared_loop(tmp_path):
+    """The sync run_test reuses one event loop, instead of creating one per test."""
+    loops = []
+
+    class LoopExecutor(CommandExecutor):
+        async def arun_test(self, *args, **kwargs):
+            loops.append(asyncio.get_running_loop())
+            return await super().arun_test(*args, **kwargs)
+
+    tests = {"/test1": ("true",)}
+    with LocalConnection() as conn:
+        with LoopExecutor(conn, tests) as executor:
+            for name in ("a1", "a2"):
+                (tmp_path / name).mkdir()
+                assert executor.run_test("/test1", tmp_path / name) == 0
+    assert len(loops) == 2
+    assert loops[0] is loops[1]
@@ -0,0 +1,94 @@
+import json
+
+from atex.executor.fmf import FMFExecutor, TestAbortedError, TestSetupError, discover
+from atex.executor.fmf.testcontrol import BadReportJSONError
+
+
+def read_results(artifacts):
+    with open(artifacts / "results") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_same_as_single(provisioner, tmp_path):
+    """Results of a batch are the same as of individually run tests."""
+    fmf_tests = discover("fmf_trees/results", plan="/plan")
+    tests = (
+        "/test_noresult_pass",
+        "/test_noresult_fail",
+        "/test_files",
+        "/test_subtest",
+        "/test_partial_files",
+        "/test_testout",
+    )
+    provisioner.provision(1)
+    remote = provisioner.get_remote()
+    with FMFExecutor(remote, fmf_tests=fmf_tests) as e:
+        single = []
+        for i, test in enumerate(tests):
+            artifacts = tmp_path / f"single{i}"
+            artifacts.mkdir()
+            single.append(e.run_test(test, artifacts))
+        batch = []
+        for i in range(len(tests)):
+            artifacts = tmp_path / f"batch{i}"
+            artifacts.mkdir()
+            batch.append((tests[i], artifacts))
+        assert e.run_tests(batch) == single
+
+    for i in range(len(tests)):
+        assert read_results(tmp_path / f"batch{i}") == read_results(tmp_path / f"single{i}")
+        single_files = sorted(p.name for p in (tmp_path / f"single{i}" / "files").rglob("*"))
+        batch_files = sorted(p.name for p in (tmp_path / f"batch{i}" / "files").rglob("*"))
+        assert batch_files == single_files
+
+
+def test_failures(provisioner, tmp_path):
+    """A test failing on its own doesn't stop the batch, an abort does."""
+    fmf_tests = discover("fmf_trees/results", plan="/plan")
+    tests = (
+        "/test_bad_json",
+        "/test_trivial",
+        "/test_noresult_abort",
+        "/test_trivial",
+    )
+    batch = []
+    for i, test in enumerate(tests):
+        artifacts = tmp_path / str(i)
+        artifacts.mkdir()
+        batch.append((test, artifacts))
+
+    provisioner.provision(1)
+    remote = provisioner.get_remote()
+    with FMFExecutor(remote, fmf_tests=fmf_tests) as e:
+        bad_json, trivial, abort, not_run = e.run_tests(batch)
+
+    assert isinstance(bad_json, BadReportJSONError)
+    assert trivial == 0
+    assert isinstance(abort, TestAbortedError)
+    assert str(abort) == "test duration timeout reached"
+    assert read_results(tmp_path / "2") == [{
+        "status": "infra",
+        "note": "TestAbortedError(test duration timeout reached)",
+        "files": ["output.txt"],
+    }]
+    assert not_run is None
+    assert not (tmp_path / "3" / "results").exists()
+
+
+def test_setup_failure(provisioner, tmp_path):
+    """A failed test setup is reported for its test only."""
+    fmf_tests = discover("fmf_trees/pkgs", plan="/plan")
+    batch = []
+    for i, test in enumerate(("/test_require_fail", "/test_require")):
+        artifacts = tmp_path / str(i)
+        artifacts.mkdir()
+        batch.append((test, artifacts))
+
+    provisioner.provision(1)
+    remote = provisioner.get_remote()
+    with FMFExecutor(remote, fmf_tests=fmf_tests) as e:
+        missing, present = e.run_tests(batch)
+
+    assert isinstance(missing, TestSetupError)
+    assert read_results(tmp_path / "0")[0]["status"] == "infra"
+    assert present == 0
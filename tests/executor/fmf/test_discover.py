@@ -119,3 +119,39 @@ def test_absolute_path_library():
     assert "ext_dependency" in require_strings
     # library content should be at the expected path
     assert (fmf_tests.root / "libs" / "extlib" / "extfunc" / "main.fmf").exists()
+
+
+def test_prune():
+    """Pruned discovery copies only the test directory and its fmf parents."""
+    fmf_tests = discover("fmf_trees/prune", names=("/tests/one",), prune=True)
+    assert list(fmf_tests.data) == ["/tests/one"]
+    root = fmf_tests.root
+    assert (root / "tests" / "one" / "runtest.sh").exists()
+    assert (root / "tests" / "main.fmf").exists()
+    assert (root / "main.fmf").exists()
+    assert not (root / "tests" / "two").exists()
+    assert not (root / "files").exists()
+    assert not (root / "unrelated").exists()
+    # the pruned copy is still a valid fmf tree, with inherited metadata
+    node = fmf.Tree(str(root)).find("/tests/one")
+    assert node.data["environment"] == {"FROM_PARENT": "1"}
+
+
+def test_prune_require_file():
+    """Pruned discovery copies paths matching 'require: type: file'."""
+    fmf_tests = discover("fmf_trees/prune", names=("/tests/two",), prune=True)
+    root = fmf_tests.root
+    assert (root / "tests" / "two" / "main.fmf").exists()
+    assert (root / "files" / "needed" / "data.txt").read_text() == "needed\n"
+    assert not (root / "files" / "unneeded.txt").exists()
+    assert not (root / "tests" / "one").exists()
+
+
+def test_prune_local_library():
+    """In-tree library is copied into a pruned tree and symlinked to libs/."""
+    fmf_tests = discover("fmf_trees/prune", names=("/tests/with_lib",), prune=True)
+    target = fmf_tests.root / "libs" / "mylib" / "library"
+    assert target.is_symlink()
+    assert (target / "main.fmf").exists()
+    assert not (fmf_tests.root / "unrelated").exists()
+    assert "lib_dependency" in fmf_tests.data["/tests/with_lib"]["require"]
@@ -1,10 +1,15 @@
+import concurrent.futures
+import logging
 import shutil
+import subprocess
 import time
 
 import pytest
 
 from atex import util
 from atex.executor.fmf import FMFExecutor, TestAbortedError, discover
+from atex.executor.fmf.scripts import agent_name, wrapper_name
+from atex.executor.fmf.tree import TreeArchive, tree_archive
 
 
 def test_output(provisioner, tmp_path, monkeypatch):
@@ -40,3 +45,115 @@ def test_cancel(provisioner, tmp_path):
         e.cancel()
         with pytest.raises(TestAbortedError):
             thread.join(timeout=30)
+
+
+def test_cancel_prompt(provisioner, tmp_path):
+    """A test sleeping on its control stream wakes up right on .cancel()."""
+    fmf_tests = discover("fmf_trees/misc", plan="/plan")
+    provisioner.provision(1)
+    remote = provisioner.get_remote()
+
+    with FMFExecutor(remote, fmf_tests=fmf_tests) as e:
+        thread = util.ThreadJoin(target=e.run_test, args=("/test_cancel", tmp_path))
+        thread.start()
+        time.sleep(5)
+        cancelled = time.monotonic()
+        e.cancel()
+        with pytest.raises(TestAbortedError, match="cancel requested"):
+            thread.join(timeout=30)
+        assert time.monotonic() - cancelled < 5
+
+
+def test_helpers_installed_once(provisioner, tmp_path):
+    """The test wrapper is installed by .start(), not sent with every test."""
+    fmf_tests = discover("fmf_trees/misc", plan="/plan")
+    provisioner.provision(1)
+    remote = provisioner.get_remote()
+    with FMFExecutor(remote, fmf_tests=fmf_tests) as e:
+        wrapper = e.work_dir / wrapper_name
+        remote.cmd(("test", "-x", wrapper), check=True)
+        _, _, _, setup_script = e._prepare_test("/test_output", None)
+        assert "ATEX_TEST_CONTROL" not in setup_script
+        proc = remote.cmd(("stat", "-c", "%i", wrapper), stdout=subprocess.PIPE, text=True)
+        e.run_test("/test_output", tmp_path)
+        after = remote.cmd(("stat", "-c", "%i", wrapper), stdout=subprocess.PIPE, text=True)
+        assert proc.stdout == after.stdout
+
+
+def test_agent(provisioner, tmp_path):
+    """Tests run the same with the remote agent, which survives its death."""
+    fmf_tests = discover("fmf_trees/misc", plan="/plan")
+    provisioner.provision(1)
+    remote = provisioner.get_remote()
+    with FMFExecutor(remote, fmf_tests=fmf_tests, agent=True) as e:
+        for i in range(2):
+            artifacts = tmp_path / str(i)
+            artifacts.mkdir()
+            assert e.run_test("/test_output", artifacts) == 0
+            output = (artifacts / "files" / "output.txt").read_bytes()
+            assert output == b"test output \x00\x01\x02\x03"
+            # as if the remote was rebooted
+            remote.cmd(("pkill", "-f", e.work_dir / agent_name))
+        agent = e._agent
+    assert not agent.alive
+
+
+def test_agent_concurrent(provisioner):
+    """Large requests and responses in parallel don't block each other."""
+    fmf_tests = discover("fmf_trees/misc", plan="/plan")
+    provisioner.provision(1)
+    remote = provisioner.get_remote()
+    data = b"x" * 1000000
+    with FMFExecutor(remote, fmf_tests=fmf_tests, agent=True) as e:
+        agent = e._agent
+
+        def write(i):
+            agent.cmd(("sh", "-c", f"cat > {e.work_dir}/data{i}"), input=data, check=True)
+
+        def read(i):
+            return agent.cmd(("cat", e.work_dir / f"data{i % 4}")).stdout
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=16) as pool:
+            list(pool.map(write, range(4)))
+            writes = []
+            reads = []
+            for i in range(16):
+                writes.append(pool.submit(write, 4 + i))
+                reads.append(pool.submit(read, i))
+            for future in writes:
+                future.result(timeout=60)
+            for future in reads:
+                assert future.result(timeout=60) == data
+
+
+def test_archive_upload(provisioner, tmp_path, caplog):
+    """The tree is uploaded as an archive once, and then reused from a cache."""
+    fmf_tests = discover("fmf_trees/misc", plan="/plan")
+    provisioner.provision(1)
+    remote = provisioner.get_remote()
+    caplog.set_level(logging.INFO)
+    for i in range(2):
+        with FMFExecutor(remote, fmf_tests=fmf_tests, upload="archive") as e:
+            artifacts = tmp_path / str(i)
+            artifacts.mkdir()
+            assert e.run_test("/test_output", artifacts) == 0
+            proc = remote.cmd(("ls", e.work_dir / "tests"), stdout=subprocess.PIPE, text=True)
+            assert "main.fmf" in proc.stdout.split()
+    archive = tree_archive(fmf_tests.root)
+    remote.cmd(("test", "-f", FMFExecutor.tree_cache_dir / f"{archive.digest}.tar.gz"), check=True)
+    assert "already cached on the remote" in caplog.text
+
+
+def test_tree_archive_digest(tmp_path):
+    """The archive digest changes with the tree contents, but not with .git."""
+    root = tmp_path / "tree"
+    (root / ".git").mkdir(parents=True)
+    (root / "test.sh").write_text("true")
+    digest = TreeArchive(root).digest
+    (root / ".git" / "HEAD").write_text("ref")
+    assert TreeArchive(root).digest == digest
+    (root / "test.sh").chmod(0o755)
+    assert TreeArchive(root).digest != digest
+    (root / "test.sh").chmod(0o644)
+    (root / "test.sh").write_text("false")
+    assert TreeArchive(root).digest != digest
@@ -63,3 +63,39 @@ def test_recommend(provisioner, tmp_path):
     json_results = json.loads(results)
     assert "status" in json_results
     assert json_results["status"] == "pass"
+
+
+def test_preinstall(provisioner, tmp_path):
+    fmf_tests = discover("fmf_trees/pkgs", plan="/plan")
+    provisioner.provision(1)
+    remote = provisioner.get_remote()
+    preinstall = ("/test_require", "/test_recommend")
+    with FMFExecutor(
+        remote, fmf_tests=fmf_tests, preinstall=preinstall, cache_packages=True,
+    ) as e:
+        remote.cmd(("rpm", "-q", "units"), check=True)
+        # installed packages are not handled by test setup anymore
+        _, _, _, setup_script = e._prepare_test("/test_require", None)
+        assert "--whatprovides" not in setup_script
+        # unavailable packages are skipped, and still fail the test setup
+        _, _, _, setup_script = e._prepare_test("/test_require_fail", None)
+        assert "--whatprovides nonexistent_pkg 2>" in setup_script
+        e.run_test("/test_require", tmp_path)
+    output = (tmp_path / "files" / "output.txt").read_text()
+    assert output.startswith("units-")
+
+
+def test_removed_package(provisioner, tmp_path):
+    fmf_tests = discover("fmf_trees/pkgs", plan="/plan")
+    provisioner.provision(1)
+    remote = provisioner.get_remote()
+    (tmp_path / "remove").mkdir()
+    (tmp_path / "require").mkdir()
+    with FMFExecutor(remote, fmf_tests=fmf_tests) as e:
+        e.run_test("/test_remove", tmp_path / "remove")
+        # packages removed by an earlier test are installed again
+        _, _, _, setup_script = e._prepare_test("/test_require", None)
+        assert "--whatprovides units 2>" in setup_script
+        e.run_test("/test_require", tmp_path / "require")
+    output = (tmp_path / "require" / "files" / "output.txt").read_text()
+    assert output.startswith("units-")
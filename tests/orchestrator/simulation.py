@@ -0,0 +1,608 @@
+import collections
+import contextlib
+import functools
+import heapq
+import importlib
+import itertools
+import math
+import os
+import random
+import subprocess
+import types
+from unittest import mock
+
+from atex import util
+from atex.aggregator import Aggregator
+from atex.executor import Executor, ExecutorError
+from atex.orchestrator import OrchestratorError
+from atex.provisioner import Provisioner, ProvisionerError, Remote
+
+_get_logger = util.get_loggers("tests.orchestrator.simulation")
+
+
+class SimulationError(OrchestratorError):
+    pass
+
+
+class SimulatedClock:
+    """
+    Virtual (simulated) time in seconds, moving forward only by `.advance()`,
+    which runs events scheduled via `.schedule()`.
+
+    Calling the instance returns the current time, like `time.monotonic()`.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        # heap of (time, sequence, callable) tuples, sequence keeping events
+        # scheduled for the same time in order
+        self._events = []
+        self._seq = itertools.count()
+        # seconds spent by the current .call(), None outside of it
+        self._spent = None
+
+    def __call__(self):
+        return self.now
+
+    def schedule(self, delay, func):
+        """
+        Call `func` (without arguments) `delay` seconds from now.
+        """
+        heapq.heappush(self._events, (self.now + delay, next(self._seq), func))
+
+    def pending(self):
+        """
+        Return the number of scheduled events not yet run.
+        """
+        return len(self._events)
+
+    def spend(self, seconds):
+        """
+        Account for `seconds` of time spent by a blocking operation,
+        from inside a `.call()`.
+        """
+        if self._spent is None:
+            raise SimulationError("time can be spent only inside SimulatedClock.call()")
+        self._spent += seconds
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call `func` right away (without moving time), returning a tuple of
+        `(seconds, returned, exception)`, with `seconds` being the sum of all
+        `.spend()` calls made by `func`.
+        """
+        outer = self._spent
+        self._spent = 0.0
+        try:
+            returned = func(*args, **kwargs)
+            exception = None
+        except Exception as e:
+            returned = None
+            exception = e
+        finally:
+            spent = self._spent
+            self._spent = outer
+        return (spent, returned, exception)
+
+    def advance(self, timeout=math.inf):
+        """
+        Move time to the earliest scheduled event, if it is due within
+        `timeout` seconds, and run it, along with any other events due
+        at that time, returning True.
+
+        Otherwise, move time `timeout` seconds forward (if not infinite),
+        returning False.
+        """
+        if self._events and self._events[0][0] <= self.now + timeout:
+            due = self._events[0][0]
+            self.now = max(self.now, due)
+            while self._events and self._events[0][0] <= due:
+                _, _, func = heapq.heappop(self._events)
+                func()
+            return True
+        if timeout != math.inf:
+            self.now += timeout
+        return False
+
+
+class SimulatedJoinQueue:
+    """
+    A stand-in for util.ThreadJoinQueue (or util.ThreadPoolJoinQueue) calling
+    any callable right away, but making its ThreadResult available only after
+    the (simulated) time the callable spent, see `SimulatedClock.call()`.
+
+    - `clock` is a SimulatedClock instance.
+
+    - `max_workers` is how many callables can be "running" at once, with
+      any further ones waiting in a FIFO, None for no limit.
+
+    - `notify` is called (without arguments) whenever a result becomes
+      available, like for util.ThreadJoinQueue.
+    """
+
+    ThreadResult = util.ThreadJoinQueue.ThreadResult
+    Empty = util.ThreadJoinQueue.Empty
+
+    def __init__(self, clock, max_workers=None, notify=None):
+        self.clock = clock
+        self.max_workers = max_workers
+        self.notify = notify
+        self._running = 0
+        self._pending = collections.deque()
+        self._finished = collections.deque()
+
+    def start_thread(self, target, *, target_args=None, target_kwargs=None, **user_kwargs):
+        job = (target, target_args or (), target_kwargs or {}, user_kwargs)
+        if self.max_workers is not None and self._running >= self.max_workers:
+            self._pending.append(job)
+        else:
+            self._start(*job)
+
+    def _start(self, target, target_args, target_kwargs, user_kwargs):
+        self._running += 1
+        spent, returned, exception = self.clock.call(target, *target_args, **target_kwargs)
+        result = self.ThreadResult(
+            thread=None,
+            returned=returned,
+            exception=exception,
+            **user_kwargs,
+        )
+        self.clock.schedule(spent, functools.partial(self._finish, result))
+
+    def _finish(self, result):
+        self._running -= 1
+        self._finished.append(result)
+        if self._pending:
+            self._start(*self._pending.popleft())
+        if self.notify is not None:
+            self.notify()
+
+    def get_raw(self, block=True, timeout=None):  # noqa: ARG002
+        # blocking advances time until a result is available, or until
+        # there is nothing left to wait for
+        while not self._finished:
+            if not block or not self._running or not self.clock.advance():
+                raise self.Empty
+        return self._finished.popleft()
+
+    def get(self, block=True, timeout=None):
+        treturn = self.get_raw(block, timeout)
+        if treturn.exception is not None:
+            raise treturn.exception
+        return treturn.returned
+
+    def join(self):
+        while self._running and self.clock.advance():
+            pass
+
+    def qsize(self):
+        return len(self._finished)
+
+    def pending(self):
+        return len(self._pending)
+
+
+# modules of the orchestration logic using time.monotonic()
+_TIMED_MODULES = (
+    "atex.orchestrator.adhoc.adhoc",
+    "atex.orchestrator.adhoc.mixins",
+    "atex.orchestrator.adhoc.provisioning",
+)
+
+
+class _SimulatedArtifacts:
+    """
+    Stand-in for a TemporaryDirectory of test artifacts, with nothing in it.
+    """
+
+    name = os.devnull
+
+    @staticmethod
+    def cleanup():
+        pass
+
+
+def _sample(value, rng):
+    """
+    Return a number of seconds from `value`, being either a number, or
+    a callable taking a random.Random instance, ie. `lambda r: r.expovariate(0.1)`.
+    """
+    return value(rng) if callable(value) else value
+
+
+class SimulatedRemote(Remote):
+    """
+    A Remote of a SimulatedProvisioner, not connected to anything.
+
+    Keeps (simulated) times of when it was `delivered` and `released`,
+    and how many seconds it spent on `setup` and running (`busy`) any
+    of its `tests`.
+    """
+
+    def __init__(self, provisioner, name):
+        self.provisioner = provisioner
+        self.name = name
+        self.delivered = None
+        self.released = None
+        self.setup = 0.0
+        self.busy = 0.0
+        self.tests = 0
+
+    def connect(self, block=True):
+        pass
+
+    def disconnect(self):
+        pass
+
+    # there is nothing to run on, so run a local no-op instead,
+    # returning whatever `func` returns for a successful command
+
+    def cmd(self, command, *, func=subprocess.run, **func_args):  # noqa: ARG002, PLR6301
+        return func(("true",), **func_args)
+
+    def rsync(self, *args, func=subprocess.run, **func_args):  # noqa: ARG002, PLR6301
+        return func(("true",), **func_args)
+
+    def release(self):
+        self.provisioner._release(self)
+
+    def __str__(self):
+        class_name = self.__class__.__name__
+        return f"{class_name}({self.name})"
+
+
+class SimulatedProvisioner(Provisioner):
+    """
+    A Provisioner delivering SimulatedRemote instances on simulated time.
+
+    - `simulation` is the Simulation instance to run on.
+
+    - `time_to_remote` is how many seconds it takes to deliver a Remote
+      after `.provision()`.
+
+    - `release_time` is how many seconds `Remote.release()` blocks for,
+      the Remote counting against `max_remotes` until it finishes.
+
+    - `max_remotes` is how many Remotes can be provisioned (or in use)
+      at once, with further requests waiting for a release, None for
+      no limit.
+
+    Any of the times can also be a callable taking a random.Random instance,
+    returning a (random) number of seconds, ie. `lambda r: r.uniform(30, 90)`.
+    """
+
+    notifies = True
+
+    def __init__(self, simulation, *, time_to_remote=60, release_time=0, max_remotes=None):
+        self.simulation = simulation
+        self.time_to_remote = time_to_remote
+        self.release_time = release_time
+        self.max_remotes = max_remotes
+
+        # requested, but not yet being provisioned (due to max_remotes)
+        self._wanted = 0
+        # being provisioned, not yet delivered
+        self._provisioning = 0
+        # delivered and not yet (fully) released
+        self._alive = 0
+        # bumped by .clear() to drop deliveries of cancelled requests
+        self._generation = 0
+        self._delivered = collections.deque()
+        # all Remotes ever delivered, for statistics
+        self.remotes = []
+
+    def _fill(self):
+        clock = self.simulation.clock
+        while self._wanted > 0 and (
+            self.max_remotes is None or self._provisioning + self._alive < self.max_remotes
+        ):
+            self._wanted -= 1
+            self._provisioning += 1
+            delay = _sample(self.time_to_remote, self.simulation.random)
+            clock.schedule(delay, functools.partial(self._deliver, self._generation))
+
+    def _deliver(self, generation):
+        if generation != self._generation:
+            return
+        self._provisioning -= 1
+        self._alive += 1
+        remote = SimulatedRemote(self, len(self.remotes))
+        remote.delivered = self.simulation.clock.now
+        self.remotes.append(remote)
+        self._delivered.append(remote)
+        self.simulation._remote_delivered()
+        self._notify()
+
+    def _release(self, remote):
+        if remote.released is not None:
+            return
+        clock = self.simulation.clock
+        release_time = _sample(self.release_time, self.simulation.random)
+        clock.spend(release_time)
+        remote.released = clock.now + release_time
+        clock.schedule(release_time, self._freed)
+
+    def _freed(self):
+        self._alive -= 1
+        self.simulation._remote_freed()
+        self._fill()
+
+    def provision(self, count=1):
+        self._wanted += count
+        self._fill()
+
+    def get_remote(self, block=True):
+        while not self._delivered:
+            if not block:
+                return None
+            if not self.simulation.clock.advance():
+                raise ProvisionerError("no Remote will ever be delivered")
+        return self._delivered.popleft()
+
+    def clear(self):
+        self._wanted = 0
+        self._provisioning = 0
+        self._generation += 1
+
+    def start(self):
+        pass
+
+    def stop(self):
+        self.clear()
+        now = self.simulation.clock.now
+        for remote in self.remotes:
+            if remote.released is None:
+                remote.released = now
+
+    def __str__(self):
+        class_name = self.__class__.__name__
+        return f"{class_name}({len(self.remotes)} delivered)"
+
+
+class SimulatedExecutor(Executor):
+    """
+    An Executor "running" tests on a SimulatedRemote, only spending
+    simulated time.
+
+    - `simulation` is the Simulation instance to run on.
+
+    - `remote` is the SimulatedRemote to run tests on.
+
+    - `setup_time` is how many seconds `.start()` takes.
+
+    - `runtime` is how many seconds a test takes if `runtimes` doesn't know.
+
+    - `runtimes` is a RuntimeStore instance, with the median runtime of
+      a test on `platform` used as its (simulated) runtime.
+
+    - `failure_rate` is the probability of a test execution failing
+      (returning exit code 1), independently for every execution.
+
+    - `setup_failure_rate` is the probability of `.start()` failing
+      (after spending `setup_time`).
+
+    The times can also be callables, as for SimulatedProvisioner.
+    """
+
+    def __init__(
+        self, simulation, remote, *, setup_time=0, runtime=60, runtimes=None, platform=None,
+        failure_rate=0, setup_failure_rate=0,
+    ):
+        self.simulation = simulation
+        self.remote = remote
+        self.setup_time = setup_time
+        self.runtime = runtime
+        self.runtimes = runtimes
+        self.platform = platform
+        self.failure_rate = failure_rate
+        self.setup_failure_rate = setup_failure_rate
+
+    def start(self):
+        sim = self.simulation
+        setup_time = _sample(self.setup_time, sim.random)
+        sim.clock.spend(setup_time)
+        self.remote.setup += setup_time
+        if sim.random.random() < self.setup_failure_rate:
+            raise ExecutorError("simulated setup failure")
+
+    def stop(self):
+        pass
+
+    def cancel(self):
+        # a simulated test already finished at its pre-computed time
+        pass
+
+    def run_test(self, test_name, artifacts):  # noqa: ARG002
+        sim = self.simulation
+        runtime = None
+        if self.runtimes:
+            runtime = self.runtimes.median(self.platform, test_name)
+        if runtime is None:
+            runtime = _sample(self.runtime, sim.random)
+        sim.clock.spend(runtime)
+        self.remote.busy += runtime
+        self.remote.tests += 1
+        return 1 if sim.random.random() < self.failure_rate else 0
+
+
+class SimulatedAggregator(Aggregator):
+    """
+    An Aggregator only counting ingested results, spending `ingest_time`
+    (simulated) seconds on each, see `.ingested`.
+    """
+
+    def __init__(self, simulation, *, ingest_time=0):
+        self.simulation = simulation
+        self.ingest_time = ingest_time
+        # number of ingestions per (platform, test_name)
+        self.ingested = collections.Counter()
+
+    def ingest(self, platform, test_name, artifacts):  # noqa: ARG002
+        self.simulation.clock.spend(_sample(self.ingest_time, self.simulation.random))
+        self.ingested[platform, test_name] += 1
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class SimulationReport(
+    util.NamedMapping,
+    required=(
+        # simulated seconds from start to all testing being concluded
+        "makespan",
+        # number of test executions, including re-runs and hedges
+        "executions",
+        # number of Remotes delivered by all Provisioners
+        "remotes",
+        # highest number of Remotes delivered and not yet released at once
+        "peak_remotes",
+        # delivered Remotes that never ran any test (over-provisioning)
+        "unused_remotes",
+        # sum of seconds between delivery and release of all Remotes
+        "remote_time",
+        # sum of seconds the Remotes spent running setup
+        "setup_time",
+        # sum of seconds the Remotes spent running tests
+        "busy_time",
+        # seconds the Remotes were held doing neither (over-provisioning)
+        "idle_time",
+        # busy_time / remote_time
+        "utilization",
+    ),
+):
+    pass
+
+
+class Simulation:
+    """
+    A discrete-event simulation of an AdHocOrchestrator (or its subclass,
+    ie. with mixins) run, with simulated Provisioners, Executors and
+    Aggregators, all on virtual time, for evaluating scheduling policies
+    (`.next_test()`, `.destructive()`, `max_spares`, ProvisioningController
+    parameters, etc.) without any real Remotes.
+
+        sim = Simulation(seed=1)
+        provisioner = SimulatedProvisioner(
+            sim, time_to_remote=lambda r: r.uniform(60, 300), max_remotes=50,
+        )
+        report = sim.run(
+            AdHocOrchestrator, "rhel-9", tests, (provisioner,),
+            lambda remote: SimulatedExecutor(sim, remote, setup_time=120),
+            SimulatedAggregator(sim),
+            max_spares=2,
+        )
+        print(report.makespan, report.utilization)
+
+    - `seed` is for the `.random` (random.Random) instance used by all
+      simulated components, for repeatable results.
+
+    - `max_time` is how many simulated seconds a run can take before being
+      aborted with SimulationError (ie. when it never finishes).
+
+    The orchestration logic itself runs unchanged, except that `.cancel()`
+    of a hedged test does nothing (the test still finishes at its simulated
+    time) and there are no test artifacts on disk.
+
+    A Simulation instance is meant for one `.run()`.
+    """
+
+    def __init__(self, *, seed=None, max_time=7*24*3600):
+        self.logger = _get_logger()
+
+        self.clock = SimulatedClock()
+        self.random = random.Random(seed)
+        self.max_time = max_time
+
+        # Remotes delivered and not yet released
+        self._active = 0
+        self._peak = 0
+
+    def _remote_delivered(self):
+        self._active += 1
+        self._peak = max(self._peak, self._active)
+
+    def _remote_freed(self):
+        self._active -= 1
+
+    def _simulated(self, orchestrator_cls):
+        """
+        Return a subclass of `orchestrator_cls` running on simulated time.
+        """
+        sim = self
+        sim_clock = self.clock
+
+        class Simulated(orchestrator_cls):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self._test_queue = SimulatedJoinQueue(sim_clock, notify=self._wakeup.set)
+                self._setup_queue = SimulatedJoinQueue(sim_clock, notify=self._wakeup.set)
+
+            @staticmethod
+            def _make_queue(max_workers, **kwargs):
+                return SimulatedJoinQueue(sim_clock, max_workers, notify=kwargs.get("notify"))
+
+            def wait_for_work(self):
+                if sim_clock.now > sim.max_time:
+                    raise SimulationError(f"not finished after {sim.max_time} simulated seconds")
+                sim_clock.advance(self._wait_timeout())
+
+        Simulated.__name__ = Simulated.__qualname__ = orchestrator_cls.__name__
+        return Simulated
+
+    def run(
+        self, orchestrator_cls, platform, tests, provisioners, executor, aggregator, **kwargs,
+    ):
+        """
+        Run all `tests` to completion with `orchestrator_cls` on simulated
+        time, returning a SimulationReport.
+
+        Arguments are passed to `orchestrator_cls` as-is, `provisioners` and
+        `aggregator` are started and stopped here. A ProvisioningController
+        passed as `provisioning` is switched to simulated time too.
+        """
+        provisioners = tuple(provisioners)
+
+        cls = self._simulated(orchestrator_cls)
+        with contextlib.ExitStack() as stack:
+            # the orchestration logic measures time via time.monotonic()
+            # and creates test artifacts via tempfile, swap both
+            sim_time = types.SimpleNamespace(monotonic=self.clock)
+            for module in _TIMED_MODULES:
+                stack.enter_context(
+                    mock.patch.object(importlib.import_module(module), "time", sim_time),
+                )
+            stack.enter_context(mock.patch.object(
+                importlib.import_module("atex.orchestrator.adhoc.adhoc"),
+                "tempfile",
+                types.SimpleNamespace(TemporaryDirectory=lambda **_: _SimulatedArtifacts),
+            ))
+            stack.enter_context(aggregator)
+            for provisioner in provisioners:
+                stack.enter_context(provisioner)
+            orchestrator = stack.enter_context(
+                cls(platform, tests, provisioners, executor, aggregator, **kwargs),
+            )
+            orchestrator.serve_forever()
+            makespan = self.clock.now
+
+        remotes = [r for p in provisioners for r in getattr(p, "remotes", ())]
+        remote_time = sum(r.released - r.delivered for r in remotes)
+        setup_time = sum(r.setup for r in remotes)
+        busy_time = sum(r.busy for r in remotes)
+        report = SimulationReport(
+            makespan=makespan,
+            executions=sum(r.tests for r in remotes),
+            remotes=len(remotes),
+            peak_remotes=self._peak,
+            unused_remotes=sum(1 for r in remotes if not r.tests),
+            remote_time=remote_time,
+            setup_time=setup_time,
+            busy_time=busy_time,
+            idle_time=remote_time - setup_time - busy_time,
+            utilization=busy_time / remote_time if remote_time else 0.0,
+        )
+        self.logger.info(f"simulation finished: {dict(report)}")
+        return report
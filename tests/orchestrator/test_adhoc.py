@@ -1,22 +1,55 @@
+import functools
 import json
+import threading
+import time
+import types
+from pathlib import Path
 
 import pytest
 
 from atex.aggregator.jsonl import JSONLinesAggregator
 from atex.executor.command import CommandExecutor
-from atex.orchestrator.adhoc import AdHocOrchestrator
+from atex.orchestrator.adhoc import (
+    AdHocOrchestrator,
+    ArtifactBudget,
+    AsyncAdHocOrchestrator,
+    FMFDurationMixin,
+    FMFPackageAffinityMixin,
+    FMFPriorityMixin,
+    HedgingMixin,
+    HistoricalRuntimeMixin,
+    LimitedRerunsMixin,
+    MultiPlatformOrchestrator,
+    ProvisioningController,
+    RemoteHealth,
+    RunJournal,
+    RunMetrics,
+    RuntimeStore,
+    WorkQueue,
+    WorkQueueCoordinator,
+)
 from atex.provisioner.local import LocalProvisioner
+from tests.orchestrator.simulation import (
+    SimulatedAggregator,
+    SimulatedExecutor,
+    SimulatedProvisioner,
+    SimulatedRemote,
+    Simulation,
+)
 
 
-def run_orchestrator(tmp_path, tests, *, cls=AdHocOrchestrator, use_old_aggregator=False):
+def run_orchestrator(
+    tmp_path, tests, *, cls=AdHocOrchestrator, use_old_aggregator=False,
+    provisioner_cls=LocalProvisioner, resume=False, **kwargs,
+):
     target = tmp_path / "results.jsonl"
     files = tmp_path / "aggregator_files"
 
     old_target = tmp_path / "old_results.jsonl"
     old_files = tmp_path / "old_aggregator_files"
 
-    with LocalProvisioner() as provisioner:
-        with JSONLinesAggregator(target, files) as aggregator:
+    with provisioner_cls() as provisioner:
+        with JSONLinesAggregator(target, files, resume=resume) as aggregator:
             old_aggregator = None
             if use_old_aggregator:
                 old_aggregator = JSONLinesAggregator(
@@ -32,6 +65,7 @@ def run_orchestrator(tmp_path, tests, *, cls=AdHocOrchestrator, use_old_aggregat
                     lambda conn, t=tests: CommandExecutor(conn, t),
                     aggregator,
                     old_aggregator=old_aggregator,
+                    **kwargs,
                 ) as orchestrator:
                     orchestrator.serve_forever()
             finally:
@@ -178,3 +212,1344 @@ def test_empty_tests(tmp_path):
                     lambda conn: CommandExecutor(conn, {}),
                     aggregator,
                 )
+
+
+def test_notified_wakeup(tmp_path):
+    """Notifications from threads and the Provisioner wake up the serve loop."""
+    class NotifiedOrchestrator(AdHocOrchestrator):
+        # would take minutes if anything relied on the timeout
+        notify_timeout = 60
+        poll_timeout = 60
+
+        def start(self):
+            super().start()
+            assert self._notified
+
+    script = tmp_path / "test.sh"
+    script.write_text("#!/bin/bash\necho hello\n")
+    script.chmod(0o755)
+    tests = {f"/test{i}": (script,) for i in range(20)}
+    start = time.monotonic()
+    results, _ = run_orchestrator(tmp_path, tests, cls=NotifiedOrchestrator)
+    assert time.monotonic() - start < 30
+    assert len(results) == 20
+    assert all(r[1] == "pass" for r in results)
+
+
+def test_polling_fallback(tmp_path):
+    """Provisioner without notification support is polled instead."""
+    class PolledProvisioner(LocalProvisioner):
+        def add_notify(self, func):  # noqa: ARG002, PLR6301
+            return False
+
+    class PolledOrchestrator(AdHocOrchestrator):
+        def start(self):
+            super().start()
+            assert not self._notified
+
+    script = tmp_path / "test.sh"
+    script.write_text("#!/bin/bash\necho hello\n")
+    script.chmod(0o755)
+    tests = {"/test1": (script,), "/test2": (script,)}
+    results, _ = run_orchestrator(
+        tmp_path, tests, cls=PolledOrchestrator, provisioner_cls=PolledProvisioner,
+    )
+    assert len(results) == 2
+    assert all(r[1] == "pass" for r in results)
+
+
+def test_max_ingest_workers(tmp_path):
+    """Ingestion concurrency is capped by max_ingest_workers."""
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+
+    class CappedOrchestrator(AdHocOrchestrator):
+        def _ingest_and_cleanup(self, *args):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            try:
+                time.sleep(0.05)
+                super()._ingest_and_cleanup(*args)
+            finally:
+                with lock:
+                    active -= 1
+
+    script = tmp_path / "test.sh"
+    script.write_text("#!/bin/bash\necho hello\n")
+    script.chmod(0o755)
+    tests = {f"/test{i}": (script,) for i in range(10)}
+    cls = functools.partial(
+        CappedOrchestrator, max_ingest_workers=2, max_release_workers=1,
+    )
+    results, _ = run_orchestrator(tmp_path, tests, cls=cls)
+    assert len(results) == 10
+    assert all(r[1] == "pass" for r in results)
+    assert 1 <= peak <= 2
+
+
+def test_journal_resume(tmp_path):
+    """Resuming from a journal runs only tests not yet ingested."""
+    script = tmp_path / "test.sh"
+    script.write_text("#!/bin/bash\necho hello\n")
+    script.chmod(0o755)
+    journal_path = tmp_path / "journal.jsonl"
+
+    tests = {"/test1": (script,), "/test2": (script,)}
+    with RunJournal(journal_path) as journal:
+        results, _ = run_orchestrator(tmp_path, tests, journal=journal)
+    assert len(results) == 2
+
+    with open(journal_path) as f:
+        records = [json.loads(line) for line in f]
+    events = {(r["event"], r["test"]) for r in records}
+    assert ("start", "/test1") in events
+    assert ("finish", "/test2") in events
+    assert ("ingested", "/test1") in events
+    assert ("ingested", "/test2") in events
+
+    # refuse to overwrite without resume
+    with pytest.raises(FileExistsError):
+        RunJournal(journal_path).start()
+
+    started = []
+
+    class TrackingOrchestrator(AdHocOrchestrator):
+        def next_test(self, to_run, previous, /):
+            choice = super().next_test(to_run, previous)
+            started.append(choice)
+            return choice
+
+    tests = {"/test1": (script,), "/test2": (script,), "/test3": (script,)}
+    with RunJournal(journal_path, resume=True) as journal:
+        results, _ = run_orchestrator(
+            tmp_path, tests, cls=TrackingOrchestrator, resume=True, journal=journal,
+        )
+    assert started == ["/test3"]
+    assert sorted(r[2] for r in results) == ["/test1", "/test2", "/test3"]
+
+
+def test_journal_resume_truncated(tmp_path):
+    """A truncated last line from a crash doesn't swallow new records."""
+    journal_path = tmp_path / "journal.jsonl"
+    with RunJournal(journal_path) as journal:
+        journal.record("test-platform", "ingested", "/a")
+    with open(journal_path, "a") as f:
+        f.write('{"time": 1, "platform": "test-platform", "eve')
+    with RunJournal(journal_path, resume=True) as journal:
+        assert journal.ingested("test-platform") == {"/a"}
+        journal.record("test-platform", "ingested", "/b")
+    with RunJournal(journal_path, resume=True) as journal:
+        assert journal.ingested("test-platform") == {"/a", "/b"}
+
+
+class Name:
+    """A test name that isn't a string."""
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+
+def str_ingest(monkeypatch):
+    """Make JSONLinesAggregator ingest any str()-able test names."""
+    ingest = JSONLinesAggregator.ingest
+    monkeypatch.setattr(
+        JSONLinesAggregator, "ingest", lambda self, p, t, a: ingest(self, p, str(t), a),
+    )
+
+
+def test_journal_non_str_names(tmp_path, monkeypatch):
+    """Tests which are not strings are journaled (and resumed) by their str()."""
+    str_ingest(monkeypatch)
+    journal_path = tmp_path / "journal.jsonl"
+    tests = {Name("/a"): ("true",), Name("/b"): ("true",)}
+    with RunJournal(journal_path) as journal:
+        results, _ = run_orchestrator(tmp_path, tests, journal=journal)
+    assert sorted(r[2] for r in results) == ["/a", "/b"]
+
+    with RunJournal(journal_path, resume=True) as journal:
+        assert journal.ingested("test-platform") == {"/a", "/b"}
+        tests = [Name("/a"), Name("/c")]
+        o = make_orchestrator(tmp_path, AdHocOrchestrator, tests, journal=journal)
+        assert list(o._to_run) == [tests[1]]
+
+
+def test_journal_resume_nothing_left(tmp_path):
+    """Resuming a fully finished journal runs nothing."""
+    script = tmp_path / "test.sh"
+    script.write_text("#!/bin/bash\necho hello\n")
+    script.chmod(0o755)
+    journal_path = tmp_path / "journal.jsonl"
+    tests = {"/test1": (script,)}
+    with RunJournal(journal_path) as journal:
+        run_orchestrator(tmp_path, tests, journal=journal)
+    with RunJournal(journal_path, resume=True) as journal:
+        results, _ = run_orchestrator(tmp_path, tests, resume=True, journal=journal)
+    assert len(results) == 1
+
+
+def test_journal_resume_partial_ingest(tmp_path):
+    """Results of a test not journaled as ingested are replaced by a re-run."""
+    marker = tmp_path / "marker"
+    tests = {
+        "/a": ("true",),
+        # fails the first time, passes when run again
+        "/b": ("sh", "-c", f"[ -e {marker} ] || {{ touch {marker}; exit 1; }}"),
+    }
+    journal_path = tmp_path / "journal.jsonl"
+    with RunJournal(journal_path) as journal:
+        results, _ = run_orchestrator(tmp_path, tests, journal=journal)
+    assert sorted((r[2], r[1]) for r in results) == [("/a", "pass"), ("/b", "fail")]
+
+    # simulate a crash after the aggregator got the results of /b,
+    # but before the journal recorded them as ingested
+    with open(journal_path) as f:
+        lines = [line for line in f if json.loads(line)["event"] != "ingested" or "/b" not in line]
+    journal_path.write_text("".join(lines))
+
+    with RunJournal(journal_path, resume=True) as journal:
+        results, _ = run_orchestrator(tmp_path, tests, resume=True, journal=journal)
+    assert sorted((r[2], r[1]) for r in results) == [("/a", "pass"), ("/b", "pass")]
+    with RunJournal(journal_path, resume=True) as journal:
+        assert journal.ingested("test-platform") == {"/a", "/b"}
+
+
+def make_orchestrator(tmp_path, cls, tests, **kwargs):
+    """Orchestrator instance for calling next_test() directly, never started."""
+    return cls(
+        "test-platform",
+        tests,
+        (LocalProvisioner(),),
+        lambda conn: CommandExecutor(conn, {}),
+        JSONLinesAggregator(tmp_path / "results.jsonl", tmp_path / "files"),
+        **kwargs,
+    )
+
+
+def pick_all(orchestrator):
+    picked = []
+    while orchestrator._to_run:
+        name = orchestrator.next_test(orchestrator._to_run.keys(), None)
+        del orchestrator._to_run[name]
+        picked.append(name)
+    return picked
+
+
+def test_duration_mixin_order(tmp_path):
+    """FMFDurationMixin picks longest tests first, then passes on the rest."""
+    fmf_tests = types.SimpleNamespace(data={
+        "/short": {"duration": "1m"},
+        "/unset1": {},
+        "/long": {"duration": "1h"},
+        "/medium": {"duration": "5m"},
+        "/unset2": {},
+        "/medium2": {"duration": "300"},
+    })
+
+    class CustomOrchestrator(FMFDurationMixin(fmf_tests), AdHocOrchestrator):
+        pass
+
+    o = make_orchestrator(tmp_path, CustomOrchestrator, fmf_tests.data)
+    assert pick_all(o) == ["/long", "/medium", "/medium2", "/short", "/unset1", "/unset2"]
+
+
+def test_priority_mixin_order(tmp_path):
+    """FMFPriorityMixin picks high priority first and negative priority last."""
+    fmf_tests = types.SimpleNamespace(data={
+        "/zero1": {},
+        "/high": {"extra-priority": 5},
+        "/higher": {"extra-priority": 10},
+        "/zero2": {"extra-priority": 0},
+        "/lower": {"extra-priority": -5},
+        "/low": {"extra-priority": -1},
+    })
+
+    class CustomOrchestrator(FMFPriorityMixin(fmf_tests), AdHocOrchestrator):
+        pass
+
+    o = make_orchestrator(tmp_path, CustomOrchestrator, fmf_tests.data)
+    assert pick_all(o) == ["/higher", "/high", "/zero1", "/zero2", "/low", "/lower"]
+
+
+def test_mixin_index_requeue(tmp_path):
+    """Re-queued (re-run) tests are picked according to their priority again."""
+    fmf_tests = types.SimpleNamespace(data={
+        "/a": {"extra-priority": 1, "duration": "1m"},
+        "/b": {"extra-priority": 1, "duration": "1h"},
+        "/c": {"duration": "1m"},
+        "/d": {"duration": "1h"},
+    })
+
+    class CustomOrchestrator(
+        LimitedRerunsMixin(1),
+        FMFPriorityMixin(fmf_tests),
+        FMFDurationMixin(fmf_tests),
+        AdHocOrchestrator,
+    ):
+        pass
+
+    o = make_orchestrator(tmp_path, CustomOrchestrator, fmf_tests.data)
+    to_run = o._to_run
+    # priority first, ties in original order, then by duration
+    first = o.next_test(to_run.keys(), None)
+    assert first == "/a"
+    del to_run[first]
+    second = o.next_test(to_run.keys(), None)
+    assert second == "/b"
+    del to_run[second]
+    assert o.next_test(to_run.keys(), None) == "/d"
+    # re-queue a previously picked test, it should again be preferred
+    o._requeue_test("/a")
+    assert o.next_test(to_run.keys(), None) == "/a"
+    del to_run["/a"]
+    assert pick_all(o) == ["/d", "/c"]
+    # a subset of queued tests is also handled
+    o._requeue_test("/c")
+    o._requeue_test("/b")
+    assert o.next_test(["/c"], None) == "/c"
+    assert o.next_test(to_run.keys(), None) == "/b"
+
+
+def test_runtime_store(tmp_path):
+    """Runtimes are persisted across instances, keeping only recent history."""
+    path = tmp_path / "runtimes.json"
+    with RuntimeStore(path, history=3) as store:
+        assert store.median("p1", "/test1") is None
+        for runtime in (100, 1, 2, 3):
+            store.record("p1", "/test1", runtime)
+        store.record("p2", "/test1", 50)
+    with RuntimeStore(path, history=3) as store:
+        assert store.median("p1", "/test1") == 2
+        assert store.median("p2", "/test1") == 50
+        assert store.median("p1", "/test2") is None
+    assert path.stat().st_mode & 0o777 == 0o644
+
+
+def test_runtimes_recorded(tmp_path):
+    """Orchestrator records runtimes of finished tests."""
+    script = tmp_path / "test.sh"
+    script.write_text("#!/bin/bash\nsleep 0.2\n")
+    script.chmod(0o755)
+    tests = {"/test1": (script,), "/test2": (script,)}
+    with RuntimeStore(tmp_path / "runtimes.json") as store:
+        run_orchestrator(tmp_path, tests, runtimes=store)
+        for name in tests:
+            assert store.median("test-platform", name) >= 0.2
+
+
+def test_runtimes_non_str_names(tmp_path, monkeypatch):
+    """Tests which are not strings have their runtimes stored by their str()."""
+    str_ingest(monkeypatch)
+    tests = {Name("/a"): ("true",)}
+    with RuntimeStore(tmp_path / "runtimes.json") as store:
+        run_orchestrator(tmp_path, tests, runtimes=store)
+        assert store.median("test-platform", "/a") is not None
+        assert store.median("test-platform", Name("/a")) is not None
+    assert "/a" in json.loads((tmp_path / "runtimes.json").read_text())["test-platform"]
+
+
+def test_historical_runtime_mixin_order(tmp_path):
+    """HistoricalRuntimeMixin runs tests with longest median runtime first."""
+    with RuntimeStore(tmp_path / "runtimes.json") as store:
+        store.record("test-platform", "/short", 10)
+        store.record("test-platform", "/long", 1000)
+        store.record("test-platform", "/medium", 100)
+        store.record("other-platform", "/unknown", 10000)
+
+        class CustomOrchestrator(HistoricalRuntimeMixin(store), AdHocOrchestrator):
+            pass
+
+        tests = ["/short", "/unknown", "/medium", "/long"]
+        o = make_orchestrator(tmp_path, CustomOrchestrator, tests)
+        assert pick_all(o) == ["/long", "/medium", "/short", "/unknown"]
+
+
+def test_package_affinity_mixin(tmp_path):
+    """FMFPackageAffinityMixin prefers tests with packages already installed."""
+    fmf_tests = types.SimpleNamespace(
+        plan={"prepare": [{"how": "install", "package": ["base"]}]},
+        data={
+            "/a": {"require": ["x", "y"]},
+            "/b": {"require": ["z"]},
+            "/c": {"recommend": ["x"]},
+            "/d": {},
+            "/e": {"require": ["base", {"type": "library"}]},
+        },
+    )
+
+    class CustomOrchestrator(FMFPackageAffinityMixin(fmf_tests), AdHocOrchestrator):
+        pass
+
+    class FakeRemote:
+        pass
+
+    o = make_orchestrator(tmp_path, CustomOrchestrator, fmf_tests.data)
+    to_run = o._to_run
+    remote = FakeRemote()
+
+    def pick(previous):
+        name = o.next_test(to_run.keys(), previous)
+        del to_run[name]
+        return o.FinishedInfo(
+            provisioner=None, remote=remote, executor=None, test_name=name,
+            artifacts=None, started=0, exit_code=0, exception=None,
+        )
+
+    # new Remote, with only the plan package installed
+    sinfo = o.SetupInfo(provisioner=None, remote=remote, executor=None)
+    finfo = pick(sinfo)
+    assert finfo.test_name == "/e"
+    # nothing is satisfied, use the default order
+    finfo = pick(finfo)
+    assert finfo.test_name == "/a"
+    # '/a' installed 'x' needed by '/c'
+    finfo = pick(finfo)
+    assert finfo.test_name == "/c"
+    # a different (new) Remote doesn't have 'x' and 'y'
+    o._requeue_test("/c")
+    sinfo = o.SetupInfo(provisioner=None, remote=FakeRemote(), executor=None)
+    assert o.next_test(to_run.keys(), sinfo) == "/b"
+    assert o.next_test(to_run.keys(), finfo) == "/c"
+
+
+def test_multi_platform(tmp_path):
+    """Tests for multiple platforms share one aggregator and a global limit."""
+    script = tmp_path / "test.sh"
+    script.write_text("#!/bin/bash\nsleep 0.1\n")
+    script.chmod(0o755)
+    tests = {f"/test{i}": (script,) for i in range(6)}
+
+    multi = None
+    peak = 0
+
+    class TrackingOrchestrator(AdHocOrchestrator):
+        def _run_new_test(self, info):
+            nonlocal peak
+            super()._run_new_test(info)
+            running = sum(len(o._running_tests) for o in multi.orchestrators.values())
+            peak = max(peak, running)
+
+    target = tmp_path / "results.jsonl"
+    files = tmp_path / "aggregator_files"
+    with LocalProvisioner() as prov1, LocalProvisioner() as prov2:
+        with JSONLinesAggregator(target, files) as aggregator:
+            multi = MultiPlatformOrchestrator(
+                {
+                    "platform1": (tests, (prov1,), lambda c: CommandExecutor(c, tests)),
+                    "platform2": (tests, (prov2,), lambda c: CommandExecutor(c, tests)),
+                },
+                aggregator,
+                orchestrator=TrackingOrchestrator,
+                max_running=3,
+                max_ingest_workers=2,
+            )
+            with multi:
+                multi.serve_forever()
+
+    with open(target) as f:
+        results = [json.loads(line) for line in f]
+    assert len(results) == 12
+    assert {(r[0], r[2]) for r in results} == {
+        (platform, name) for platform in ("platform1", "platform2") for name in tests
+    }
+    assert all(r[1] == "pass" for r in results)
+    assert peak == 3
+
+
+def test_multi_platform_provisioning(tmp_path):
+    """Every platform gets a ProvisioningController of its own."""
+    script = tmp_path / "test.sh"
+    script.write_text("#!/bin/bash\nsleep 0.1\n")
+    script.chmod(0o755)
+    tests = {f"/test{i}": (script,) for i in range(4)}
+
+    # an instance would be shared by all platforms
+    with pytest.raises(TypeError):
+        MultiPlatformOrchestrator(
+            {"platform1": (tests, (), None)}, None, provisioning=ProvisioningController(),
+        )
+
+    peaks = {}
+
+    class TrackingProvisioner(LocalProvisioner):
+        def get_remote(self, block=True):
+            remote = super().get_remote(block)
+            peaks[self] = max(peaks.get(self, 0), len(self._remotes))
+            return remote
+
+    target = tmp_path / "results.jsonl"
+    files = tmp_path / "aggregator_files"
+    with TrackingProvisioner() as prov1, TrackingProvisioner() as prov2:
+        with JSONLinesAggregator(target, files) as aggregator:
+            multi = MultiPlatformOrchestrator(
+                {
+                    "platform1": (tests, (prov1,), lambda c: CommandExecutor(c, tests)),
+                    "platform2": (tests, (prov2,), lambda c: CommandExecutor(c, tests)),
+                },
+                aggregator,
+                provisioning=functools.partial(
+                    ProvisioningController, max_remotes=2, remote_runtime=0,
+                ),
+            )
+            controllers = [o.provisioning for o in multi.orchestrators.values()]
+            assert controllers[0] is not controllers[1]
+            with multi:
+                multi.serve_forever()
+
+    with open(target) as f:
+        results = [json.loads(line) for line in f]
+    assert len(results) == 8
+    assert all(r[1] == "pass" for r in results)
+    # the limit applies to each platform
+    assert peaks == {prov1: 2, prov2: 2}
+
+
+def test_multi_platform_wait_timeout(tmp_path):
+    """The shortest per-platform wait timeout applies, incl. work_queue_timeout."""
+    with WorkQueue(tmp_path / "queue.db") as queue:
+        multi = MultiPlatformOrchestrator(
+            {
+                "platform1": (("/a",), (LocalProvisioner(),), None),
+                "platform2": (("/a",), (LocalProvisioner(),), None),
+            },
+            JSONLinesAggregator(tmp_path / "results.jsonl", tmp_path / "files"),
+            work_queue=queue,
+            shard="shard0",
+        )
+        for o in multi.orchestrators.values():
+            o._notified = True
+        multi.orchestrators["platform2"].work_queue_timeout = 0.5
+        timeouts = []
+        multi._wakeup.wait = timeouts.append
+        multi.wait_for_work()
+        assert timeouts == [0.5]
+
+
+class FakeProvisioner:
+    def __init__(self):
+        self.provisioned = 0
+        self.cleared = 0
+
+    def provision(self, count=1):
+        self.provisioned += count
+
+    def clear(self):
+        self.cleared += 1
+
+
+def test_provisioning_controller():
+    """Remotes are requested according to remaining work and time-to-remote."""
+    prov1 = FakeProvisioner()
+    prov2 = FakeProvisioner()
+    orchestrator = types.SimpleNamespace(
+        platform="test-platform",
+        provisioners=(prov1, prov2),
+        max_spares=0,
+        _to_run=dict.fromkeys(f"/test{i}" for i in range(30)),
+        _running_tests={},
+        _held_remotes=lambda: 0,
+    )
+    controller = ProvisioningController(
+        default_runtime=10, remote_runtime=0, default_time_to_remote=60,
+    )
+
+    # 30 tests * 10s of work, 60s to get a Remote --> 5 Remotes
+    controller.update(orchestrator)
+    assert prov1.provisioned + prov2.provisioned == 5
+    assert abs(prov1.provisioned - prov2.provisioned) == 1
+    # nothing changed, nothing more requested, even if forced
+    controller.update(orchestrator, force=True)
+    assert prov1.provisioned + prov2.provisioned == 5
+
+    # prov1 delivered instantly, prefer it for more Remotes
+    controller.remote_received(prov1)
+    assert controller.time_to_remote(prov1) < 1
+    assert controller.outstanding(prov1) == prov1.provisioned - 1
+    before = prov2.provisioned
+    del orchestrator._to_run["/test0"]
+    orchestrator._running_tests = {"/test0": None}
+    controller.update(orchestrator, force=True)
+    assert prov2.provisioned == before
+    # and the limit is respected
+    assert controller.outstanding(prov1) + controller.outstanding(prov2) + 1 == 30
+
+    # all tests started, cancel any outstanding requests
+    orchestrator._to_run = {}
+    controller.update(orchestrator, force=True)
+    assert prov1.cleared == 1
+    assert prov2.cleared == 1
+    assert controller.outstanding(prov1) == 0
+    assert controller.outstanding(prov2) == 0
+
+
+def test_provisioning_controller_reuse():
+    """Remotes re-used by many tests are requested fewer than queued tests."""
+    prov = FakeProvisioner()
+    orchestrator = types.SimpleNamespace(
+        platform="test-platform",
+        provisioners=(prov,),
+        max_spares=0,
+        _to_run=dict.fromkeys(f"/test{i}" for i in range(20)),
+        _running_tests={},
+        _held_remotes=lambda: 0,
+    )
+    controller = ProvisioningController(
+        default_runtime=600, remote_runtime=3600, default_time_to_remote=60,
+    )
+    # 20 tests * 600s of work, 3600s of it per Remote + 60s to get one
+    controller.update(orchestrator)
+    assert prov.provisioned == 4
+    # destructive tests, one Remote per test
+    prov = FakeProvisioner()
+    orchestrator.provisioners = (prov,)
+    ProvisioningController(remote_runtime=0).update(orchestrator)
+    assert prov.provisioned == 20
+
+
+def test_provisioning_controller_scale_down():
+    """Excess requests are cancelled without re-requesting any still needed."""
+    fast = FakeProvisioner()
+    slow = FakeProvisioner()
+    orchestrator = types.SimpleNamespace(
+        platform="test-platform",
+        provisioners=(fast, slow),
+        max_spares=0,
+        _to_run=dict.fromkeys(f"/test{i}" for i in range(6)),
+        _running_tests={},
+        _held_remotes=lambda: 0,
+    )
+    controller = ProvisioningController(
+        remote_runtime=0, default_time_to_remote=0, scale_down_interval=0,
+    )
+    controller._time_to_remote = {fast: 10, slow: 40}
+    controller.update(orchestrator)
+    assert (fast.provisioned, slow.provisioned) == (5, 1)
+
+    # 1 excess, only the slow Provisioner can be cancelled as a whole
+    del orchestrator._to_run["/test0"]
+    controller.update(orchestrator, force=True)
+    assert (fast.cleared, slow.cleared) == (0, 1)
+    assert controller.outstanding(fast) == 5
+    assert controller.outstanding(slow) == 0
+
+    # 2 excess, fast has 5 outstanding, nothing can be cancelled
+    del orchestrator._to_run["/test1"]
+    del orchestrator._to_run["/test2"]
+    controller.update(orchestrator, force=True)
+    assert (fast.cleared, slow.cleared) == (0, 1)
+    # and nothing was re-requested
+    assert (fast.provisioned, slow.provisioned) == (5, 1)
+
+
+def test_provisioning_controller_limit():
+    """Requests never exceed max_remotes."""
+    prov = FakeProvisioner()
+    orchestrator = types.SimpleNamespace(
+        platform="test-platform",
+        provisioners=(prov,),
+        max_spares=1,
+        _to_run=dict.fromkeys(f"/test{i}" for i in range(30)),
+        _running_tests={},
+        _held_remotes=lambda: 0,
+    )
+    controller = ProvisioningController(max_remotes=3, default_time_to_remote=0)
+    controller.update(orchestrator)
+    assert prov.provisioned == 3
+
+
+def test_provisioning_controller_orchestrator(tmp_path):
+    """Orchestrator with a controller requests only up to max_remotes."""
+    peak = 0
+
+    class TrackingProvisioner(LocalProvisioner):
+        def get_remote(self, block=True):
+            nonlocal peak
+            remote = super().get_remote(block)
+            peak = max(peak, len(self._remotes))
+            return remote
+
+    script = tmp_path / "test.sh"
+    script.write_text("#!/bin/bash\nsleep 0.05\n")
+    script.chmod(0o755)
+    tests = {f"/test{i}": (script,) for i in range(10)}
+    results, _ = run_orchestrator(
+        tmp_path, tests, provisioner_cls=TrackingProvisioner,
+        provisioning=ProvisioningController(max_remotes=2),
+    )
+    assert len(results) == 10
+    assert all(r[1] == "pass" for r in results)
+    assert peak == 2
+
+
+def test_metrics(tmp_path):
+    """All phases of a run are timed, exported as events and for Prometheus."""
+    events_file = tmp_path / "events.jsonl"
+    prom_file = tmp_path / "metrics.prom"
+    tests = {
+        "/pass1": ("true",),
+        "/pass2": ("true",),
+        "/fail": ("false",),
+    }
+    with RunMetrics(events_file, prometheus=prom_file) as metrics:
+        results, _ = run_orchestrator(tmp_path, tests, metrics=metrics)
+        assert len(results) == 3
+
+        assert metrics.histogram("test").count == 3
+        assert metrics.histogram("ingest", platform="test-platform").count == 3
+        assert metrics.histogram("setup", provisioner="LocalProvisioner").count >= 1
+        assert metrics.histogram("provision").count >= 1
+        assert metrics.histogram("test", platform="other").count == 0
+        assert metrics.gauge("ingest_backlog") == 0
+
+    events = [json.loads(line) for line in events_file.read_text().splitlines()]
+    phases = {e["phase"] for e in events}
+    assert {"provision", "setup", "test", "ingest"} <= phases
+    test_events = {e["test"]: e for e in events if e["phase"] == "test"}
+    assert test_events["/fail"]["exit_code"] == 1
+    assert test_events["/pass1"]["provisioner"] == "LocalProvisioner"
+
+    # readable by a node_exporter running as another user
+    assert prom_file.stat().st_mode & 0o777 == 0o644
+    prom = prom_file.read_text()
+    assert "# TYPE atex_phase_duration_seconds histogram" in prom
+    assert (
+        'atex_phase_duration_seconds_count{phase="test",platform="test-platform",'
+        'provisioner="LocalProvisioner"} 3'
+    ) in prom
+    assert (
+        'atex_phase_duration_seconds_bucket{phase="test",platform="test-platform",'
+        'provisioner="LocalProvisioner",le="+Inf"} 3'
+    ) in prom
+    assert 'atex_ingest_backlog{platform="test-platform",provisioner="LocalProvisioner"} 0' in prom
+
+
+def test_metrics_non_str_names(tmp_path, monkeypatch):
+    """Tests which are not strings are recorded in events by their str()."""
+    str_ingest(monkeypatch)
+    events_file = tmp_path / "events.jsonl"
+    tests = {Name("/a"): ("true",)}
+    with RunMetrics(events_file) as metrics:
+        run_orchestrator(tmp_path, tests, metrics=metrics)
+    with open(events_file) as f:
+        events = [json.loads(line) for line in f]
+    assert {e["test"] for e in events if e["phase"] in ("test", "ingest")} == {"/a"}
+
+
+def test_artifact_budget(tmp_path):
+    """No tests start while too many artifacts wait for a slow Aggregator."""
+    budget = ArtifactBudget(max_count=1, max_bytes=10**9)
+    artifacts_dir = tmp_path / "artifacts"
+    artifacts_dir.mkdir()
+    in_flight = []
+
+    class SlowAggregator(JSONLinesAggregator):
+        def ingest(self, platform, test_name, artifacts):
+            in_flight.append((budget.count, budget.bytes))
+            assert Path(artifacts).parent == artifacts_dir
+            time.sleep(0.2)
+            super().ingest(platform, test_name, artifacts)
+
+    tests = {f"/test{i}": ("echo", "output") for i in range(4)}
+    with (
+        LocalProvisioner() as provisioner,
+        SlowAggregator(tmp_path / "results.jsonl", tmp_path / "files") as aggregator,
+        RunMetrics() as metrics,
+    ):
+        with AdHocOrchestrator(
+            "test-platform", tests.keys(), (provisioner,),
+            lambda conn: CommandExecutor(conn, tests), aggregator,
+            provisioning=ProvisioningController(max_remotes=1), metrics=metrics,
+            artifacts_budget=budget, artifacts_dir=artifacts_dir,
+        ) as orchestrator:
+            orchestrator.serve_forever()
+        # every test waited for the ingestion of the previous one
+        assert metrics.histogram("stall").count == 3
+        assert metrics.histogram("stall").mean() >= 0.1
+        assert metrics.gauge("artifacts_bytes") == 0
+
+    # one Remote, so one in-flight artifacts dir (with results and output)
+    assert len(in_flight) == 4
+    assert all(count == 1 and size > 0 for count, size in in_flight)
+    assert budget.count == 0
+    assert budget.bytes == 0
+    assert not any(artifacts_dir.iterdir())
+
+
+def test_artifact_budget_measured_in_worker(tmp_path, monkeypatch):
+    """Artifacts are measured by ingestion workers, not the serving thread."""
+    threads = []
+    size = ArtifactBudget.size
+
+    def recording_size(self, path):
+        threads.append(threading.current_thread())
+        return size(self, path)
+
+    monkeypatch.setattr(ArtifactBudget, "size", recording_size)
+    budget = ArtifactBudget(max_bytes=10**9)
+    tests = {f"/test{i}": ("echo", "output") for i in range(3)}
+    run_orchestrator(tmp_path, tests, artifacts_budget=budget, max_ingest_workers=2)
+    assert len(threads) == 3
+    assert threading.main_thread() not in threads
+    assert budget.count == 0
+    assert budget.bytes == 0
+
+
+@pytest.mark.parametrize("in_aggregator", (False, True))
+def test_aggregator_artifacts_dir(tmp_path, in_aggregator):
+    """Artifacts are created where the Aggregator can rename them from, if asked to."""
+    artifacts = []
+
+    class RecordingAggregator(JSONLinesAggregator):
+        def ingest(self, platform, test_name, artifacts_path):
+            artifacts.append(Path(artifacts_path))
+            super().ingest(platform, test_name, artifacts_path)
+
+    tests = {"/test1": ("echo", "output"), "/test2": ("true",)}
+    with (
+        LocalProvisioner() as provisioner,
+        RecordingAggregator(tmp_path / "results.jsonl", tmp_path / "files") as aggregator,
+    ):
+        assert aggregator.artifacts_dir() == tmp_path
+        with AdHocOrchestrator(
+            "test-platform", tests.keys(), (provisioner,),
+            lambda conn: CommandExecutor(conn, tests), aggregator,
+            artifacts_in_aggregator=in_aggregator,
+        ) as orchestrator:
+            orchestrator.serve_forever()
+
+    assert len(artifacts) == 2
+    assert all((path.parent == tmp_path) == in_aggregator for path in artifacts)
+    assert not list(tmp_path.glob("atex-*"))
+    assert (tmp_path / "files" / "test-platform" / "test1" / "output.txt").exists()
+
+    with pytest.raises(ValueError):
+        make_orchestrator(
+            tmp_path, AdHocOrchestrator, tests,
+            artifacts_dir=tmp_path, artifacts_in_aggregator=True,
+        )
+
+
+def test_hedging(tmp_path):
+    """A straggler is duplicated on a spare Remote, the first to finish wins."""
+    class HedgingOrchestrator(AdHocOrchestrator):
+        notify_timeout = 0.1
+
+        def should_hedge(self, info, /):  # noqa: PLR6301
+            return time.monotonic() - info.started > 0.5
+
+    # the first execution hangs, any later one finishes right away
+    marker = tmp_path / "marker"
+    script = tmp_path / "test.sh"
+    script.write_text(f"#!/bin/bash\nmkdir {marker} 2>/dev/null && exec sleep 60\nexit 0\n")
+    script.chmod(0o755)
+    tests = {"/straggler": (script,)}
+
+    start = time.monotonic()
+    results, old_results = run_orchestrator(
+        tmp_path, tests, cls=HedgingOrchestrator, use_old_aggregator=True,
+        max_spares=1, provisioning=ProvisioningController(),
+    )
+    assert time.monotonic() - start < 30
+    assert len(results) == 1
+    assert results[0][1] == "pass"
+    # the cancelled (killed) original
+    assert len(old_results) == 1
+    assert old_results[0][1] == "fail"
+
+
+def test_hedging_failed_hedge(tmp_path):
+    """A hedge failing fast doesn't cancel the (healthy) original."""
+    class HedgingOrchestrator(AdHocOrchestrator):
+        notify_timeout = 0.1
+
+        def should_hedge(self, info, /):  # noqa: PLR6301
+            return time.monotonic() - info.started > 0.5
+
+    # the first execution passes after a while, any later one fails right away
+    marker = tmp_path / "marker"
+    script = tmp_path / "test.sh"
+    script.write_text(f"#!/bin/bash\nmkdir {marker} 2>/dev/null && sleep 3 && exit 0\nexit 1\n")
+    script.chmod(0o755)
+    tests = {"/straggler": (script,)}
+
+    results, old_results = run_orchestrator(
+        tmp_path, tests, cls=HedgingOrchestrator, use_old_aggregator=True,
+        max_spares=1, provisioning=ProvisioningController(),
+    )
+    assert len(results) == 1
+    assert results[0][1] == "pass"
+    # the failed hedge(s)
+    assert old_results
+    assert all(result[1] == "fail" for result in old_results)
+
+
+def test_hedging_mixin(tmp_path):
+    """HedgingMixin hedges tests running much longer than their median."""
+    with RuntimeStore(tmp_path / "runtimes.json") as store:
+        store.record("test-platform", "/test", 100)
+
+        mixin = HedgingMixin(store, factor=2, min_elapsed=250)
+
+        class CustomOrchestrator(mixin, AdHocOrchestrator):
+            pass
+
+        o = make_orchestrator(tmp_path, CustomOrchestrator, ["/test", "/unknown"])
+        now = time.monotonic()
+        info = types.SimpleNamespace(test_name="/test", started=now - 150)
+        assert not o.should_hedge(info)
+        info = types.SimpleNamespace(test_name="/test", started=now - 240)
+        assert not o.should_hedge(info)
+        info = types.SimpleNamespace(test_name="/test", started=now - 260)
+        assert o.should_hedge(info)
+        info = types.SimpleNamespace(test_name="/unknown", started=now - 10000)
+        assert not o.should_hedge(info)
+
+
+def test_remote_health(tmp_path):
+    """RemoteHealth quarantines Remotes crossing any of its thresholds."""
+    health = RemoteHealth(max_failures=2, max_infra=1, max_reconnects=3, max_latency=1.0)
+    provisioner = LocalProvisioner()
+
+    def finished(remote, exit_code=0, results=None, **executor_attrs):
+        artifacts = tmp_path / f"artifacts-{time.monotonic_ns()}"
+        artifacts.mkdir()
+        if results:
+            (artifacts / "results").write_text(
+                "".join(json.dumps(r) + "\n" for r in results),
+            )
+        return types.SimpleNamespace(
+            remote=remote,
+            provisioner=provisioner,
+            executor=types.SimpleNamespace(**executor_attrs),
+            test_name="/test",
+            exit_code=exit_code,
+            exception=None,
+            artifacts=types.SimpleNamespace(name=artifacts),
+        )
+
+    # consecutive failures, reset by a pass
+    assert not health.record(finished("a", exit_code=1))
+    assert not health.record(finished("a", exit_code=0))
+    assert not health.record(finished("a", exit_code=1))
+    assert health.record(finished("a", exit_code=1))
+    # infra results
+    assert health.record(finished("b", results=[{"status": "infra"}]))
+    # reconnects
+    assert not health.record(finished("c", reconnects=3))
+    assert health.record(finished("c", reconnects=4))
+    # slow commands, twice in a row
+    assert not health.record(finished("d", command_latency=2.0))
+    assert not health.record(finished("d", command_latency=0.5))
+    assert not health.record(finished("d", command_latency=2.0))
+    assert health.record(finished("d", command_latency=2.0))
+    # forgotten Remotes start over
+    health.forget("a")
+    assert not health.record(finished("a", exit_code=1))
+
+    stats = health.stats()["LocalProvisioner"]
+    assert stats["tests"] == 12
+    assert stats["failures"] == 4
+    assert stats["infra"] == 1
+    assert stats["reconnects"] == 7
+    assert stats["quarantined"] == 4
+    assert stats["latency"] == pytest.approx(1.625)
+
+
+def test_remote_health_orchestrator(tmp_path):
+    """A Remote failing too many tests is released and replaced."""
+    remotes = []
+
+    class TrackingOrchestrator(AdHocOrchestrator):
+        def run_setup(self, sinfo):
+            remotes.append(sinfo.remote)
+            super().run_setup(sinfo)
+
+        def destructive(self, info, /):  # noqa: PLR6301, ARG002
+            return False
+
+    script = tmp_path / "fail.sh"
+    script.write_text("#!/bin/bash\nexit 1\n")
+    script.chmod(0o755)
+    tests = {f"/test{i}": (script,) for i in range(4)}
+
+    health = RemoteHealth(max_failures=2)
+    results, _ = run_orchestrator(
+        tmp_path, tests, cls=TrackingOrchestrator, health=health,
+        provisioning=ProvisioningController(max_remotes=1),
+    )
+    assert len(results) == 4
+    assert all(r[1] == "fail" for r in results)
+    # one Remote at a time, quarantined after every 2 tests
+    stats = health.stats()["LocalProvisioner"]
+    assert stats["quarantined"] == 2
+    assert len(remotes) == 2
+
+
+@pytest.mark.parametrize("cls", (AdHocOrchestrator, AsyncAdHocOrchestrator))
+def test_snapshots(tmp_path, cls):
+    """Only the first Remote is set up, later ones start from its snapshot."""
+    class SnapshotProvisioner(LocalProvisioner):
+        snapshotted = 0
+
+        def snapshot(self, remote):  # noqa: ARG002
+            self.snapshotted += 1
+            return "golden"
+
+        def get_remote(self, block=True):
+            remote = super().get_remote(block)
+            if remote and self.snapshotted:
+                remote.snapshot = "golden"
+            return remote
+
+    setups = []
+    snapshotted = []
+
+    class DestructiveOrchestrator(cls):
+        notify_timeout = 0.1
+
+        def run_setup(self, info, /):
+            setups.append(info.remote)
+            super().run_setup(info)
+
+        def destructive(self, info, /):  # noqa: PLR6301, ARG002
+            snapshotted.append(info.provisioner.snapshotted)
+            return True
+
+    script = tmp_path / "test.sh"
+    script.write_text("#!/bin/bash\nexit 0\n")
+    script.chmod(0o755)
+    tests = {f"/test{i}": (script,) for i in range(5)}
+
+    results, _ = run_orchestrator(
+        tmp_path, tests, cls=DestructiveOrchestrator, provisioner_cls=SnapshotProvisioner,
+        snapshots=True, provisioning=ProvisioningController(max_remotes=1),
+    )
+    assert len(results) == 5
+    assert all(r[1] == "pass" for r in results)
+    # one Remote at a time, each test destroying it
+    assert len(setups) == 1
+    assert snapshotted == [1] * 5
+
+
+def run_simulation(cls, tests, *, seed=None, max_remotes=2, **executor_kwargs):
+    sim = Simulation(seed=seed)
+    provisioner = SimulatedProvisioner(sim, time_to_remote=100, max_remotes=max_remotes)
+    aggregator = SimulatedAggregator(sim, ingest_time=1)
+    report = sim.run(
+        cls, "test-platform", tests, (provisioner,),
+        lambda remote: SimulatedExecutor(sim, remote, **executor_kwargs),
+        aggregator,
+    )
+    return (report, aggregator)
+
+
+def test_simulation():
+    """A simulated run is timed exactly, without waiting for anything."""
+    class ReusingOrchestrator(AdHocOrchestrator):
+        def destructive(self, info, /):  # noqa: PLR6301, ARG002
+            return False
+
+    tests = [f"/test{i}" for i in range(10)]
+    start = time.monotonic()
+    report, aggregator = run_simulation(
+        ReusingOrchestrator, tests, setup_time=10, runtime=60,
+    )
+    assert time.monotonic() - start < 5
+    assert set(aggregator.ingested) == {("test-platform", name) for name in tests}
+    # 2 Remotes delivered at 100s, set up by 110s, running 5 tests each
+    assert report.makespan == 410
+    assert report.executions == 10
+    assert report.remotes == 2
+    assert report.peak_remotes == 2
+    assert report.unused_remotes == 0
+    assert report.remote_time == 2 * 310
+    assert report.setup_time == 2 * 10
+    assert report.busy_time == 10 * 60
+    assert report.idle_time == 0
+    assert report.utilization == pytest.approx(600 / 620)
+
+
+def test_simulated_remote():
+    """Commands on a simulated Remote succeed without doing anything."""
+    sim = Simulation()
+    provisioner = SimulatedProvisioner(sim, time_to_remote=0, max_remotes=1)
+    remote = SimulatedRemote(provisioner, "remote")
+    assert remote.cmd(("false",), check=True).returncode == 0
+    proc = remote.cmd(("cat", "/etc/os-release"), capture_output=True, text=True)
+    assert not proc.stdout
+    assert remote.rsync("-r", "foo/", "remote:bar").returncode == 0
+
+
+def test_simulation_reruns(tmp_path):
+    """Simulated failures are re-run, with results repeatable by seed."""
+    cls = type("RerunOrchestrator", (LimitedRerunsMixin(2), AdHocOrchestrator), {})
+    with RuntimeStore(tmp_path / "runtimes.json") as store:
+        store.record("test-platform", "/test0", 1000)
+        tests = [f"/test{i}" for i in range(1000)]
+        kwargs = {
+            "seed": 123,
+            "max_remotes": 10,
+            "runtime": lambda r: r.uniform(10, 20),
+            "runtimes": store,
+            "platform": "test-platform",
+            "failure_rate": 0.1,
+        }
+        report, aggregator = run_simulation(cls, tests, **kwargs)
+        again, _ = run_simulation(cls, tests, **kwargs)
+    assert report == again
+    # only final results are ingested, re-runs are not
+    assert sum(aggregator.ingested.values()) == 1000
+    assert report.executions > 1000
+    # every failure destroys the Remote
+    assert report.remotes > 10
+    assert report.peak_remotes == 10
+    # the one test with a known runtime outlasted everything else
+    assert report.makespan > 1000
+
+
+def test_async_orchestrator(tmp_path):
+    """Tests run as coroutines on an event loop, incl. reruns."""
+    class RerunOrchestrator(LimitedRerunsMixin(1), AsyncAdHocOrchestrator):
+        pass
+
+    sentinel = tmp_path / "sentinel"
+    flaky = tmp_path / "flaky.sh"
+    flaky.write_text(f"#!/bin/bash\n[ -f {sentinel} ] && exit 0\ntouch {sentinel}\nexit 1\n")
+    flaky.chmod(0o755)
+    tests = {f"/test{i}": ("true",) for i in range(10)}
+    tests["/flaky"] = (flaky,)
+
+    threads = threading.active_count()
+    results, old_results = run_orchestrator(
+        tmp_path, tests, cls=RerunOrchestrator, use_old_aggregator=True, max_threads=2,
+    )
+    assert len(results) == 11
+    assert all(r[1] == "pass" for r in results)
+    assert len(old_results) == 1
+    assert old_results[0][2] == "/flaky"
+    # the event loop thread is gone
+    assert threading.active_count() <= threads
+
+
+def test_async_orchestrator_cancel(tmp_path):
+    """Stopping an AsyncAdHocOrchestrator cancels running tests."""
+    tests = {"/sleep": ("sleep", "60")}
+    with LocalProvisioner() as provisioner:
+        aggregator = JSONLinesAggregator(tmp_path / "results.jsonl", tmp_path / "files")
+        with aggregator:
+            o = AsyncAdHocOrchestrator(
+                "test-platform",
+                tests.keys(),
+                (provisioner,),
+                lambda conn: CommandExecutor(conn, tests),
+                aggregator,
+            )
+            start = time.monotonic()
+            with o:
+                while o.serve_once() and not o._running_tests:
+                    o.wait_for_work()
+                # let the test command start
+                time.sleep(0.5)
+            assert time.monotonic() - start < 30
+
+
+def test_work_queue(tmp_path):
+    """Tests are claimed only once, re-queued and reset tests are pending again."""
+    with WorkQueue(tmp_path / "queue.db") as q1, WorkQueue(tmp_path / "queue.db") as q2:
+        q1.add("p", ["/a", "/b", "/c"])
+        q2.add("p", ["/a", "/b", "/c"])
+        q2.add("other", ["/a"])
+        seq, changes = q2.changes("p")
+        assert sorted(changes) == [("/a", "pending"), ("/b", "pending"), ("/c", "pending")]
+
+        assert q1.claim("p", "/a", "shard1")
+        assert not q2.claim("p", "/a", "shard2")
+        assert q2.claim("p", "/b", "shard2")
+        assert q2.changes("p", seq)[1] == [("/a", "running"), ("/b", "running")]
+
+        q1.requeue("p", "/a")
+        q2.done("p", "/b")
+        assert q1.counts("p") == {"pending": 2, "done": 1}
+        assert q2.claim("p", "/a", "shard2")
+        assert q1.claim("p", "/c", "shard1")
+        assert q1.reset("p", "shard2") == 1
+        assert q1.counts("p") == {"pending": 1, "running": 1, "done": 1}
+        assert q1.counts("other") == {"pending": 1}
+
+
+def run_shards(tmp_path, tests, queues, max_remotes=None):
+    """Run one orchestrator per WorkQueue in `queues`, in parallel threads."""
+    class RerunOrchestrator(LimitedRerunsMixin(1), AdHocOrchestrator):
+        pass
+
+    shard_results = {}
+
+    def run_shard(shard, queue):
+        shard_path = tmp_path / shard
+        shard_path.mkdir()
+        shard_results[shard] = run_orchestrator(
+            shard_path, tests, cls=RerunOrchestrator, use_old_aggregator=True,
+            work_queue=queue, shard=shard,
+            provisioning=ProvisioningController(max_remotes=max_remotes),
+        )
+
+    threads = [
+        threading.Thread(target=run_shard, args=(f"shard{i}", queue))
+        for i, queue in enumerate(queues)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return shard_results
+
+
+def test_sharded(tmp_path):
+    """Shards sharing a WorkQueue run every test exactly once, reruns included."""
+    script = tmp_path / "test.sh"
+    script.write_text("#!/bin/bash\nsleep 0.1\n")
+    script.chmod(0o755)
+    sentinel = tmp_path / "sentinel"
+    flaky = tmp_path / "flaky.sh"
+    flaky.write_text(f"#!/bin/bash\n[ -f {sentinel} ] && exit 0\ntouch {sentinel}\nexit 1\n")
+    flaky.chmod(0o755)
+    tests = {f"/test{i}": (script,) for i in range(10)}
+    tests["/flaky"] = (flaky,)
+
+    with WorkQueue(tmp_path / "queue.db") as q1, WorkQueue(tmp_path / "queue.db") as q2:
+        # limit Remotes, so that one shard doesn't claim all tests at once
+        shard_results = run_shards(tmp_path, tests, (q1, q2), max_remotes=2)
+        assert q1.counts("test-platform") == {"done": 11}
+
+    results = [r for results, _ in shard_results.values() for r in results]
+    old_results = [r for _, old_results in shard_results.values() for r in old_results]
+    assert sorted(r[2] for r in results) == sorted(tests)
+    assert all(r[1] == "pass" for r in results)
+    assert [r[2] for r in old_results] == ["/flaky"]
+    # both shards got some work
+    assert all(results for results, _ in shard_results.values())
+
+
+def test_sharded_resume(tmp_path):
+    """A restarted shard gives back tests it left claimed, skips finished ones."""
+    script = tmp_path / "test.sh"
+    script.write_text("#!/bin/bash\nexit 0\n")
+    script.chmod(0o755)
+    tests = {"/a": (script,), "/b": (script,), "/c": (script,)}
+
+    with WorkQueue(tmp_path / "queue.db") as queue:
+        queue.add("test-platform", tests)
+        queue.claim("test-platform", "/a", "shard0")
+        queue.claim("test-platform", "/b", "shard0")
+        queue.done("test-platform", "/b")
+        queue.claim("test-platform", "/c", "another")
+        queue.requeue("test-platform", "/c")
+        shard_results = run_shards(tmp_path, tests, (queue,))
+    results, _ = shard_results["shard0"]
+    assert sorted(r[2] for r in results) == ["/a", "/c"]
+
+
+def test_sharded_needs_shard(tmp_path):
+    """A WorkQueue cannot be used without a (stable) shard name."""
+    with WorkQueue(tmp_path / "queue.db") as queue:
+        with pytest.raises(ValueError, match="shard"):
+            make_orchestrator(tmp_path, AdHocOrchestrator, ["/a"], work_queue=queue)
+
+
+def test_sharded_ingest_failed(tmp_path, monkeypatch):
+    """A test is done only once ingested, a restarted shard re-runs it otherwise."""
+    script = tmp_path / "test.sh"
+    script.write_text("#!/bin/bash\nexit 0\n")
+    script.chmod(0o755)
+    tests = {"/a": (script,), "/b": (script,)}
+
+    ingest = JSONLinesAggregator.ingest
+
+    def failing_ingest(self, platform, test_name, artifacts):
+        if test_name == "/b":
+            raise RuntimeError("ingesting failed")
+        return ingest(self, platform, test_name, artifacts)
+
+    with WorkQueue(tmp_path / "queue.db") as queue:
+        with monkeypatch.context() as m:
+            m.setattr(JSONLinesAggregator, "ingest", failing_ingest)
+            results, _ = run_orchestrator(tmp_path, tests, work_queue=queue, shard="shard0")
+        assert [r[2] for r in results] == ["/a"]
+        assert queue.counts("test-platform") == {"done": 1, "running": 1}
+
+        results, _ = run_orchestrator(
+            tmp_path, tests, work_queue=queue, shard="shard0", resume=True,
+        )
+        assert sorted(r[2] for r in results) == ["/a", "/b"]
+        assert queue.counts("test-platform") == {"done": 2}
+
+
+def test_sharded_mixin(tmp_path):
+    """Mixins with their own state can be combined with a WorkQueue."""
+    script = tmp_path / "test.sh"
+    script.write_text("#!/bin/bash\nexit 0\n")
+    script.chmod(0o755)
+    tests = {"/short": (script,), "/long": (script,)}
+
+    with RuntimeStore(tmp_path / "runtimes.json") as store:
+        store.record("test-platform", "/long", 1000)
+        store.record("test-platform", "/short", 10)
+
+        class CustomOrchestrator(HistoricalRuntimeMixin(store), AdHocOrchestrator):
+            pass
+
+        with WorkQueue(tmp_path / "queue.db") as queue:
+            o = make_orchestrator(
+                tmp_path, CustomOrchestrator, tests, work_queue=queue, shard="shard0",
+            )
+            assert pick_all(o) == ["/long", "/short"]
+
+            results, _ = run_orchestrator(
+                tmp_path, tests, cls=CustomOrchestrator, work_queue=queue, shard="shard0",
+            )
+            assert sorted(r[2] for r in results) == ["/long", "/short"]
+            assert queue.counts("test-platform") == {"done": 2}
+
+
+def test_sharded_mixin_pending_later(tmp_path):
+    """Mixins also order tests which become pending in a WorkQueue only later."""
+    tests = ["/short", "/long"]
+    with RuntimeStore(tmp_path / "runtimes.json") as store:
+        store.record("test-platform", "/long", 1000)
+        store.record("test-platform", "/short", 10)
+
+        class CustomOrchestrator(HistoricalRuntimeMixin(store), AdHocOrchestrator):
+            pass
+
+        with WorkQueue(tmp_path / "queue.db") as queue:
+            queue.add("test-platform", tests)
+            queue.claim("test-platform", "/long", "another")
+            o = make_orchestrator(
+                tmp_path, CustomOrchestrator, tests, work_queue=queue, shard="shard0",
+            )
+            assert list(o._to_run) == ["/short"]
+            # re-queued by the other shard, ie. for a re-run
+            queue.requeue("test-platform", "/long")
+            o._sync_work_queue()
+            assert pick_all(o) == ["/long", "/short"]
+
+
+def test_work_queue_coordinator(tmp_path):
+    """Shards can share a WorkQueue served over a socket by a coordinator."""
+    script = tmp_path / "test.sh"
+    script.write_text("#!/bin/bash\nsleep 0.1\n")
+    script.chmod(0o755)
+    tests = {f"/test{i}": (script,) for i in range(6)}
+
+    address = str(tmp_path / "coordinator.sock")
+    with WorkQueueCoordinator(tmp_path / "queue.db", address, b"secret"):
+        queues = [WorkQueueCoordinator.connect(address, b"secret") for _ in range(2)]
+        shard_results = run_shards(tmp_path, tests, queues)
+        assert queues[0].counts("test-platform") == {"done": 6}
+
+    results = [r for results, _ in shard_results.values() for r in results]
+    assert sorted(r[2] for r in results) == sorted(tests)
@@ -1,3 +1,5 @@
+import threading
+
 import pytest
 import testutil
 
@@ -49,3 +51,12 @@ def test_cmd_cwd(tmp_path):
 def test_rsync(tmp_path):
     with LocalProvisioner(cwd=tmp_path) as p:
         shared.rsync(p)
+
+
+def test_notify():
+    with LocalProvisioner() as p:
+        event = threading.Event()
+        assert p.add_notify(event.set)
+        p.provision(1)
+        assert event.wait(timeout=10)
+        assert p.get_remote(block=False)